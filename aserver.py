@@ -0,0 +1,231 @@
+# -*- coding: UTF-8 -*-
+"""Game server on asyncio, one event loop for all the connections.
+
+The same `Package` protocol and `GameCoreServer` as `server.startServer`,
+with the game flow of `server.PackageHandler`, but a connection is a
+coroutine waiting on its stream instead of an OS thread blocked in `recv`:
+an idle player costs a few kilobytes of buffers, and all the game logic
+runs on the thread of the event loop, without any lock.
+
+Packages are written without waiting for the client to read them. A
+connection drains its own stream before it reads its next package, and a
+client whose unsent packages pile up past `MAX_WRITE_BUFFER` bytes (one
+that stopped reading) is dropped instead of buffered without limit.
+
+A server hosts many games, the rooms of a `rooms.RoomManager`: the first
+package of a connection may be a `Package.JoinRoom`, then every package
+of the connection goes to the game of that room.
+
+Classes
+----------
+AsyncServerHandler -- One client connection of an `AsyncServer`.
+AsyncServer -- The rooms served to the connections of an asyncio server.
+
+Functions
+----------
+startAsyncServer -- Serve a game in a background thread, as `startServer`.
+
+Usage
+----------
+python aserver.py --port 8888 --players 3
+"""
+
+from typing import Optional
+import argparse
+import asyncio
+import socket
+import struct
+import threading
+from package import Package
+from codec import decode
+from server import PackageHandler, encodePackage
+from rooms import DEFAULT_ROOM, Room, RoomManager
+
+__all__ = [
+    'MAX_WRITE_BUFFER',
+    'AsyncServerHandler',
+    'AsyncServer',
+    'startAsyncServer'
+]
+
+# The bytes of packages a client can leave unread before it is dropped.
+MAX_WRITE_BUFFER = 1 << 20
+
+class AsyncServerHandler(PackageHandler):
+    """One client connection of an `AsyncServer`.
+
+    Instance variables
+    ----------
+    rooms : RoomManager
+        The rooms of the server.
+    room : Room | None
+        The room of the connection, once joined.
+    core : GameCoreServer
+        The game of the room.
+    clients : list[asyncio.StreamWriter]
+        The connections of the players of the room.
+    reader, writer : asyncio.StreamReader, asyncio.StreamWriter
+        The stream of this connection.
+    peername : tuple
+        The address of the client, kept for logging after it is closed.
+    """
+    def __init__(self, server: "AsyncServer", reader: asyncio.StreamReader,
+                 writer: asyncio.StreamWriter) -> None:
+        self.rooms = server.rooms
+        self.room: Optional[Room] = None
+        self.reader = reader
+        self.writer = writer
+        self.peername = writer.get_extra_info('peername')
+
+    def sendPackage(self, client: asyncio.StreamWriter,
+                    package: Package.Package):
+        """Queue a package on a connection, the event loop writes it.
+
+        A client more than `MAX_WRITE_BUFFER` bytes behind is dropped, its
+        own handler then closes its seat.
+        """
+        peername = client.get_extra_info('peername')
+        self.logger.log('send', peername, str(package))
+        if client.is_closing():
+            return
+        client.write(encodePackage(package))
+        if client.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            self.logger.log('disconnect', peername, 'too far behind')
+            client.transport.abort()
+
+    def closeConnection(self, player_id: int, reason: str):
+        self.logger.log('disconnect', self.peername, reason)
+        self.room.leave(player_id)
+
+        self.updatePlayer()
+        self.writer.close()
+
+    async def recvPackage(self) -> Optional[Package.Package]:
+        """Return the next package of the client, None once it is gone or
+        sent bytes that are not a package."""
+        try:
+            header = await self.reader.readexactly(4)
+            length = struct.unpack("!I", header)[0]
+            data = await self.reader.readexactly(length)
+            package = decode(data)
+        except (asyncio.IncompleteReadError, ConnectionResetError, OSError,
+                ValueError):
+            return None
+        self.logger.log('recv', self.peername, str(package))
+        return package
+
+    def joinRoom(self, room_id: str, player_count: int = 0) -> int:
+        """Bind the connection to a room, return its player id or -1."""
+        room, player_id = self.rooms.join(room_id, self.writer, player_count)
+        if player_id == -1:
+            return -1
+        self.room = room
+        self.core = room.core
+        self.clients = room.clients
+        return player_id
+
+    async def handle(self, package: Optional[Package.Package] = None) -> None:
+        """Serve the connection until it is closed.
+
+        package is the first package of the client when it has already
+        been read from the connection (see `cluster`).
+        """
+        self.logger.log('connect', self.peername, '')
+        if package is None:
+            package = await self.recvPackage()
+        match package:
+            case None:
+                self.writer.close()
+                return
+            case Package.JoinRoom():
+                player_id = self.joinRoom(package.room, package.player_count)
+                package = None
+            case _:
+                player_id = self.joinRoom(DEFAULT_ROOM)
+        if player_id == -1:
+            self.logger.log('disconnect', self.peername, 'join not accept')
+            self.writer.close()
+            return
+
+        sock = self.writer.get_extra_info('socket')
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        reason = 'server error'
+        try:
+            while not self.writer.is_closing():
+                if package is None:
+                    package = await self.recvPackage()
+                if package is None:
+                    reason = 'player disconnect'
+                    break
+                self.handlePackage(self.clients.index(self.writer), package)
+                package = None
+                try:
+                    await self.writer.drain()
+                except (ConnectionResetError, OSError):
+                    reason = 'player disconnect'
+                    break
+        finally:
+            # leave the seat however the connection ends, also when
+            # handlePackage raised
+            if self.writer in self.clients:
+                self.closeConnection(self.clients.index(self.writer), reason)
+            self.rooms.release(self.room)
+
+class AsyncServer:
+    """The rooms served to the connections of an asyncio server.
+
+    Instance variables
+    ----------
+    rooms : RoomManager
+        The games, rooms open with player_count players unless the
+        `Package.JoinRoom` that opens them asks for another number.
+    server : asyncio.Server | None
+        The listening server, once `start` is done.
+    """
+    def __init__(self, player_count: int = 3, rare_rule: bool = False) -> None:
+        self.rooms = RoomManager(player_count, rare_rule)
+        self.server: Optional[asyncio.Server] = None
+
+    async def start(self, host: str, port: int) -> asyncio.Server:
+        """Listen on host:port, in the running event loop."""
+        self.server = await asyncio.start_server(self._connected, host, port)
+        return self.server
+
+    async def _connected(self, reader: asyncio.StreamReader,
+                         writer: asyncio.StreamWriter) -> None:
+        await AsyncServerHandler(self, reader, writer).handle()
+
+def startAsyncServer(host: str, port: int, player_count: int,
+                     rare_rule: bool = False) -> AsyncServer:
+    """Serve a game in a background thread, as `server.startServer`.
+
+    The server listens before it returns, then its event loop runs in a
+    daemon thread, which ends with the main thread.
+    """
+    server = AsyncServer(player_count, rare_rule)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(server.start(host, port))
+    print(f'serve on {host}:{port}')
+
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return server
+
+async def _serve_forever(host: str, port: int, player_count: int,
+                         rare_rule: bool) -> None:
+    server = await AsyncServer(player_count, rare_rule).start(host, port)
+    print(f'serve on {host}:{port}')
+    async with server:
+        await server.serve_forever()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--players', type=int, default=3, choices=(2, 3))
+    parser.add_argument('--rare', action='store_true',
+                        help="play with rule 'rare'")
+    args = parser.parse_args()
+
+    asyncio.run(_serve_forever(args.host, args.port, args.players,
+                               args.rare))
@@ -0,0 +1,458 @@
+# -*- coding: UTF-8 -*-
+"""Lockstep batch environment of many games, in NumPy arrays.
+
+`BatchEnv` plays thousands of independent games of the same number of
+players at once, every `step` plays one move in each game still playing.
+The state lives in arrays indexed by game (and seat): hands and cards on
+the table as card set bitmasks, the previous hand as a hand id of
+`utilities.ALL_HANDS`, rule9/19/29 as 3 bits. The rules are those of
+`TableClassic.apply_move` and `enumerate_legal_moves`, which `--check`
+verifies move by move against the scalar engine, without rule 'rare'.
+
+Actions
+----------
+0 ~ NUM_HANDS-1         play the hand `ALL_HANDS[action]`
+ERASE_ACTION + card     erase a card after an eraseable hand
+PASS_ACTION             pass, or skip the erase after an eraseable hand
+
+Classes
+----------
+BatchEnv -- Many games played in lockstep.
+
+Functions
+----------
+legal_actions -- The legal actions of the seat to move of a table.
+action_to_move -- The move of `enumerate_legal_moves` for an action.
+move_to_action -- The action of a move of `enumerate_legal_moves`.
+popcount -- The number of cards of each card set bitmask of an array.
+
+Usage
+----------
+python batch_env.py --check -n 200             # differential check
+python batch_env.py -n 4096 --steps 200        # steps per second
+"""
+
+from typing import Optional
+import argparse
+import time
+import numpy as np
+from utilities import (TableClassic, Player, Hand, ALL_HANDS, NONE_HAND,
+                       hand_id, encode_deal, rare_twins)
+from game import PlayerUtility
+from dominance import hands_beating
+
+__all__ = [
+    'NUM_HANDS',
+    'ERASE_ACTION',
+    'PASS_ACTION',
+    'NUM_ACTIONS',
+    'OBSERVATION_SIZE',
+    'BatchEnv',
+    'legal_actions',
+    'action_to_move',
+    'move_to_action',
+    'popcount'
+]
+
+NUM_HANDS = len(ALL_HANDS)
+ERASE_ACTION = NUM_HANDS
+PASS_ACTION = NUM_HANDS + 32
+NUM_ACTIONS = NUM_HANDS + 33
+
+# Hand attributes by hand id.
+_mask = np.array([hand.mask for hand in ALL_HANDS], np.uint32)
+_eraseable = np.array([hand.eraseable for hand in ALL_HANDS], np.bool_)
+_first_ok = _eraseable | (_mask & 1 << 1 != 0)
+_rule_set = np.array([(9 in hand.card) | (19 in hand.card) << 1
+                      | (29 in hand.card) << 2 for hand in ALL_HANDS],
+                     np.uint8)
+_rule_clear = np.array([(8 in hand.card) | (18 in hand.card) << 1
+                        | (28 in hand.card) << 2 for hand in ALL_HANDS],
+                       np.uint8)
+_bits = np.uint32(1) << np.arange(32, dtype=np.uint32)
+_popcount8 = np.array([bin(byte).count('1') for byte in range(256)], np.int8)
+# _held[k, byte, hand]: the cards of a hand in bits 8k~8k+7 are in byte.
+_held = np.stack([(_mask >> 8 * k & 0xff) & ~np.arange(256, dtype=np.uint32)
+                  [:, None] == 0 for k in range(4)])
+
+def _build_playable() -> np.ndarray:
+    """playable[rules, previous + 1, hand], previous -1 for nothing to beat.
+
+    The bitsets of `dominance.hands_beating` as arrays, the same as
+    `TableClassic.is_playable_hand` apart from the first turn.
+    """
+    width = (NUM_HANDS + 7) // 8
+    playable = np.empty((8, NUM_HANDS + 1, NUM_HANDS), np.bool_)
+    for rules in range(8):
+        for previous, hand in enumerate((NONE_HAND,) + ALL_HANDS):
+            bitset = hands_beating(hand, bool(rules & 1), bool(rules & 2),
+                                   bool(rules & 4))
+            playable[rules, previous] = np.unpackbits(
+                np.frombuffer(bitset.to_bytes(width, 'little'), np.uint8),
+                bitorder='little')[:NUM_HANDS]
+    return playable
+
+_playable = _build_playable()
+# A hand of rule 'rare' takes the action of the same hand without it.
+_rare_actions = {id(rare): hand_id(hand) for hand, rare in rare_twins()}
+
+def popcount(masks: np.ndarray) -> np.ndarray:
+    """The number of cards of each card set bitmask of a uint32 array."""
+    count = np.zeros(masks.shape, np.int8)
+    for shift in (0, 8, 16, 24):
+        count += _popcount8[masks >> shift & 0xff]
+    return count
+
+def action_to_move(action: int) -> Optional[Hand]:
+    """The move of `enumerate_legal_moves` for an action."""
+    if action < NUM_HANDS:
+        return ALL_HANDS[action]
+    if action == PASS_ACTION:
+        return None
+    return Hand((action - ERASE_ACTION,), 'erase')
+
+def move_to_action(move: Optional[Hand]) -> int:
+    """The action of a move of `enumerate_legal_moves`.
+
+    A hand of rule 'rare' takes the action of the same hand without the
+    rule: the table tells them apart, see `utilities.rarify`. Raises
+    ValueError for a hand that is not a hand of the deck.
+    """
+    if move is None:
+        return PASS_ACTION
+    if move.rank == 'erase':
+        return ERASE_ACTION + move.card[0]
+    action = hand_id(move)
+    if action == -1:
+        action = _rare_actions.get(id(move), -1)
+    if action == -1:
+        raise ValueError(f'{move} is not a hand of the deck')
+    return action
+
+def legal_actions(table: TableClassic) -> np.ndarray:
+    """Return bool (NUM_ACTIONS,), the legal actions of the seat to move.
+
+    The same moves as `enumerate_legal_moves` of `table.get_player()`,
+    with the tables of `BatchEnv.legal_mask`. Rule 'rare' is not
+    supported, its hands are not actions.
+    """
+    if table.rare_rule:
+        raise ValueError('actions do not cover the hands of rule rare')
+    player = table.get_player()
+    hand = player.card_mask
+    first = table.turn == 1 and not table.card_mask & 1 << 1
+    legal = np.zeros(NUM_ACTIONS, np.bool_)
+    if table.for_erase:
+        cards = legal[ERASE_ACTION:PASS_ACTION]
+        np.not_equal(np.uint32(hand) & _bits, 0, out=cards)
+        if first:
+            cards[2:] = False
+        else:
+            legal[PASS_ACTION] = True
+        return legal
+    previous = table.previous_hand
+    rules = table.rule9 | table.rule19 << 1 | table.rule29 << 2
+    hands = legal[:NUM_HANDS]
+    hands[:] = _playable[rules, 0 if previous.rank == 'None'
+                         else hand_id(previous) + 1]
+    for k in range(4):
+        hands &= _held[k, hand >> 8 * k & 0xff]
+    if first:
+        hands &= _first_ok
+    legal[PASS_ACTION] = not player.lastplayed
+    return legal
+
+class BatchEnv:
+    """Many games of the same number of players played in lockstep.
+
+    Arrays are indexed by game, and by seat for those of shape (N, players).
+    A game that is over keeps its final state, and its actions are ignored
+    until the next `reset`.
+
+    Instance variables
+    ----------
+    num_games : int
+        The number of games N.
+    num_players : int
+        2 or 3 players in every game.
+    hands : np.ndarray
+        uint32 (N, players), the card set bitmask of each seat.
+    table : np.ndarray
+        uint32 (N,), the cards on the table as a card set bitmask.
+    previous : np.ndarray
+        int16 (N,), the hand id of the previous hand, -1 for nothing.
+    rules : np.ndarray
+        uint8 (N,), rule9 | rule19 << 1 | rule29 << 2.
+    token : np.ndarray
+        int8 (N,), the seat to move.
+    lastplayed : np.ndarray
+        bool (N, players), `Player.lastplayed`.
+    in_game : np.ndarray
+        bool (N, players), `Player.in_game`.
+    for_erase : np.ndarray
+        bool (N,), whether the seat to move has to erase a card.
+    turn : np.ndarray
+        int32 (N,), `TableClassic.turn`.
+    playing : np.ndarray
+        bool (N,), whether the game is still playing.
+    winner : np.ndarray
+        int8 (N,), the first seat that played all of his cards, -1 if none.
+    dealt : np.ndarray
+        uint32 (N, players), the hands as they were dealt.
+    check : bool
+        Whether `step` raises ValueError on an illegal action.
+    """
+    def __init__(self, num_games: int, num_players: int = 2,
+                 check: bool = True) -> None:
+        if num_players not in (2, 3):
+            raise ValueError('a game has 2 or 3 players')
+        self.num_games = num_games
+        self.num_players = num_players
+        self.check = check
+        self._rows = np.arange(num_games)
+        self.reset()
+
+    def reset(self, seed: Optional[int] = None) -> None:
+        """Deal a new game to every table, as `TableClassic.start` does."""
+        n, players = self.num_games, self.num_players
+        rng = np.random.default_rng(seed)
+        decks = rng.permuted(np.tile(np.arange(2, 32), (n, 1)), axis=1)
+        size = 10 if players == 3 else 12
+        decks = decks[:, :size * players].reshape(n, players, size)
+        self.hands = np.bitwise_or.reduce(_bits[decks], axis=2)
+        dealer = rng.integers(players, size=n).astype(np.int8)
+        self.hands[self._rows, dealer] |= np.uint32(1 << 1)
+        self.dealt = self.hands.copy()
+        self.table = np.zeros(n, np.uint32)
+        self.previous = np.full(n, -1, np.int16)
+        self.rules = np.zeros(n, np.uint8)
+        self.token = dealer
+        self.lastplayed = np.zeros((n, players), np.bool_)
+        self.lastplayed[self._rows, dealer] = True
+        self.in_game = np.ones((n, players), np.bool_)
+        self.for_erase = np.zeros(n, np.bool_)
+        self.turn = np.ones(n, np.int32)
+        self.playing = np.ones(n, np.bool_)
+        self.winner = np.full(n, -1, np.int8)
+
+    def deal(self, game: int) -> int:
+        """The deal of a game as `TableClassic.deal`, to replay it."""
+        return encode_deal([int(hand) for hand in self.dealt[game]])
+
+    def legal_mask(self) -> np.ndarray:
+        """Return bool (N, NUM_ACTIONS), the legal actions of every game.
+
+        The same moves as `enumerate_legal_moves`, none in a game over.
+        """
+        hand = self.hands[self._rows, self.token]
+        first = (self.turn == 1) & (self.table & 1 << 1 == 0)
+        play = self.playing & ~self.for_erase
+        erase = self.playing & self.for_erase
+        hands = _playable[self.rules, self.previous + 1]
+        for k in range(4):
+            hands &= _held[k, hand >> 8 * k & 0xff]
+        hands[first] &= _first_ok
+        hands[~play] = False
+        legal = np.empty((self.num_games, NUM_ACTIONS), np.bool_)
+        legal[:, :NUM_HANDS] = hands
+        cards = legal[:, ERASE_ACTION:PASS_ACTION]
+        np.not_equal(hand[:, None] & _bits, 0, out=cards)
+        cards[first, 2:] = False
+        cards &= erase[:, None]
+        legal[:, PASS_ACTION] = ((erase & ~first) | (play & ~self.lastplayed[
+            self._rows, self.token]))
+        return legal
+
+    def step(self, actions: np.ndarray) -> np.ndarray:
+        """Play one action in every game, as `TableClassic.apply_move`.
+
+        Returns
+        ----------
+        done : np.ndarray
+            bool (N,), the games that are over after this step and were
+            not before.
+        """
+        actions = np.asarray(actions)
+        live = self.playing.copy()
+        if self.check:
+            bad = live & ~self.legal_mask()[self._rows, actions]
+            if bad.any():
+                game = int(np.argmax(bad))
+                raise ValueError(f'illegal action {actions[game]} '
+                                 f'in game {game}')
+        is_hand = live & (actions < NUM_HANDS)
+        is_erase = live & (actions >= ERASE_ACTION) & (actions < PASS_ACTION)
+        is_pass = live & (actions == PASS_ACTION)
+
+        games = np.nonzero(is_hand)[0]
+        hand = actions[games]
+        self.previous[games] = hand
+        self.table[games] |= _mask[hand]
+        self.hands[games, self.token[games]] &= ~_mask[hand]
+        self.rules[games] = (self.rules[games] | _rule_set[hand]) \
+            & ~_rule_clear[hand]
+        eraseable = np.zeros(self.num_games, np.bool_)
+        eraseable[games] = _eraseable[hand]
+
+        games = np.nonzero(is_erase)[0]
+        card = _bits[actions[games] - ERASE_ACTION]
+        self.hands[games, self.token[games]] &= ~card
+        self.table[games] |= card
+
+        played = is_hand | is_erase | (is_pass & self.for_erase)
+        forward = (is_hand & ~eraseable) | is_erase | is_pass
+        self.for_erase[is_erase | is_pass] = False
+        self.for_erase[eraseable] = True
+        games = np.nonzero(forward)[0]
+        self._turn_forward(games, played[games])
+        return live & ~self.playing
+
+    def _turn_forward(self, games: np.ndarray, played: np.ndarray) -> None:
+        """`TableClassic.turn_forward` of some games."""
+        players = self.num_players
+        token = self.token[games]
+        following = (token + 1) % players
+        skip = ~self.in_game[games, following]
+        holder = np.where(skip, (following + 1) % players, following)
+
+        out = self.hands[games, token] == 0
+        self.in_game[games[out], token[out]] = False
+        first_out = out & (self.winner[games] == -1)
+        self.winner[games[first_out]] = token[first_out]
+        over = self.in_game[games].sum(axis=1) == 1
+        self.playing[games[over]] = False
+
+        keep = ~over
+        games, token, following, skip, holder, played = (
+            games[keep], token[keep], following[keep], skip[keep],
+            holder[keep], played[keep])
+        self.lastplayed[games[played]] = False
+        self.lastplayed[games[played], token[played]] = True
+        self.previous[games[self.lastplayed[games, holder]]] = -1
+        self.turn[games] += 1
+        # a seat out of the game that played last hands it on
+        moved = skip & self.lastplayed[games, following]
+        self.previous[games[moved]] = -1
+        self.lastplayed[games[moved], following[moved]] = False
+        self.lastplayed[games[moved], holder[moved]] = True
+        self.token[games] = holder
+
+    def observe(self) -> np.ndarray:
+        """Return int16 (N, OBSERVATION_SIZE), the view of the seat to move.
+
+        Columns: own cards (32, card N at column N), cards on the table
+        (32), card counts of the 2 next seats in turn order (0 when no
+        such seat), previous hand id (-1 for nothing), rule9/19/29 (3),
+        for_erase, lastplayed of the seat to move, turn.
+        """
+        n, players = self.num_games, self.num_players
+        observation = np.zeros((n, OBSERVATION_SIZE), np.int16)
+        own = self.hands[self._rows, self.token]
+        observation[:, :32] = own[:, None] & _bits != 0
+        observation[:, 32:64] = self.table[:, None] & _bits != 0
+        counts = popcount(self.hands)
+        for shift in range(1, players):
+            seat = (self.token + shift) % players
+            observation[:, 63 + shift] = counts[self._rows, seat]
+        observation[:, 66] = self.previous
+        observation[:, 67:70] = self.rules[:, None] >> np.arange(3) & 1
+        observation[:, 70] = self.for_erase
+        observation[:, 71] = self.lastplayed[self._rows, self.token]
+        observation[:, 72] = self.turn
+        return observation
+
+OBSERVATION_SIZE = 73
+
+def _random_actions(legal: np.ndarray, rng: np.random.Generator
+                    ) -> np.ndarray:
+    """A uniformly random legal action of every game (0 in a game over)."""
+    flat = np.flatnonzero(legal)
+    if len(flat) == 0:
+        return np.zeros(len(legal), np.intp)
+    counts = np.bincount(flat // legal.shape[1], minlength=len(legal))
+    first = np.cumsum(counts) - counts
+    pick = flat[np.minimum(first + (rng.random(len(legal)) * counts)
+                           .astype(np.intp), len(flat) - 1)]
+    return np.where(counts > 0, pick % legal.shape[1], 0)
+
+def check(n_games: int, num_players: int, seed: int) -> int:
+    """Play random games in a `BatchEnv` and in `TableClassic` side by side.
+
+    Every step compares the legal actions with `PlayerUtility.legal_moves`,
+    plays the move with `PlayerUtility.play_move` and compares the whole
+    state. Raises AssertionError at the first difference, returns the
+    number of moves compared.
+    """
+    env = BatchEnv(n_games, num_players)
+    env.reset(seed)
+    rng = np.random.default_rng(seed)
+    tables = []
+    for game in range(n_games):
+        table = TableClassic()
+        for _ in range(num_players):
+            table.join(Player())
+        table.start(deal=env.deal(game))
+        tables.append(table)
+    moves = 0
+    while env.playing.any():
+        legal = env.legal_mask()
+        actions = _random_actions(legal, rng)
+        for game in np.nonzero(env.playing)[0]:
+            table = tables[game]
+            seat = PlayerUtility(table.get_player(), table)
+            expected = sorted(move_to_action(move)
+                              for move in seat.legal_moves())
+            assert expected == list(np.nonzero(legal[game])[0]), \
+                f'legal actions of game {game} turn {table.turn}'
+            assert expected == list(np.nonzero(legal_actions(table))[0]), \
+                f'legal_actions of game {game} turn {table.turn}'
+            assert seat.play_move(action_to_move(int(actions[game])))
+            moves += 1
+        env.step(actions)
+        for game, table in enumerate(tables):
+            state = (
+                [player.card_mask for player in table.players],
+                table.card_mask, hand_id(table.previous_hand)
+                if table.previous_hand.rank != 'None' else -1,
+                table.rule9 | table.rule19 << 1 | table.rule29 << 2,
+                table.get_player_index(), table.for_erase, table.turn,
+                [player.lastplayed for player in table.players],
+                [player.in_game for player in table.players],
+                table.game_playing)
+            assert state == (
+                env.hands[game].tolist(), int(env.table[game]),
+                int(env.previous[game]), int(env.rules[game]),
+                int(env.token[game]), bool(env.for_erase[game]),
+                int(env.turn[game]), env.lastplayed[game].tolist(),
+                env.in_game[game].tolist(), bool(env.playing[game])), \
+                f'state of game {game} turn {table.turn}'
+    return moves
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--games', type=int, default=4096)
+    parser.add_argument('--players', type=int, default=2, choices=(2, 3))
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--check', action='store_true',
+                        help='compare with the scalar engine instead')
+    args = parser.parse_args()
+
+    if args.check:
+        moves = check(args.games, args.players, args.seed)
+        print(f'{moves} moves of {args.games} games match TableClassic')
+    else:
+        env = BatchEnv(args.games, args.players, check=False)
+        rng = np.random.default_rng(args.seed)
+        env.reset(args.seed)
+        moves = 0
+        start = time.perf_counter()
+        for step in range(args.steps):
+            if not env.playing.any():
+                env.reset(args.seed + step)
+            moves += int(env.playing.sum())
+            env.step(_random_actions(env.legal_mask(), rng))
+        elapsed = time.perf_counter() - start
+        print(f'{args.games} games x {args.steps} steps: '
+              f'{args.steps / elapsed:,.1f} steps/s, '
+              f'{moves / elapsed:,.0f} moves/s')
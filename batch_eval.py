@@ -0,0 +1,154 @@
+# -*- coding: UTF-8 -*-
+"""Batched hand evaluation with NumPy, for offline analysis.
+
+Functions
+----------
+evaluate_cards_batch -- Evaluate all available hands of many card tuples.
+
+Classes
+----------
+HandBatch -- Columnar result of `evaluate_cards_batch`.
+
+Running this module reports the throughput of `evaluate_cards_batch` and
+`utilities.evaluate_cards` in rows/second.
+"""
+
+from dataclasses import dataclass
+import argparse
+import time
+import numpy as np
+from utilities import (ALL_HANDS, hand_ranking, hand_id, evaluate_cards,
+                       card_set_hands)
+
+__all__ = [
+    'HandBatch',
+    'RANK_NAMES',
+    'evaluate_cards_batch'
+]
+
+# RANK_NAMES[code] is the rank name of a rank code (`hand_ranking` value).
+RANK_NAMES = np.array(['']+sorted(hand_ranking, key=hand_ranking.get))
+
+# Hand attributes by hand id (position in ALL_HANDS).
+_rank = np.array([hand_ranking[hand.rank] for hand in ALL_HANDS], np.int8)
+_value = np.array([hand.value for hand in ALL_HANDS], np.int8)
+_suit = np.array([hand.suit for hand in ALL_HANDS], np.int8)
+_eraseable = np.array([hand.eraseable for hand in ALL_HANDS], np.bool_)
+
+def _build_table() -> tuple[np.ndarray, np.ndarray]:
+    """Dense table of hand ids over sorted rows padded with 0.
+
+    The row (a, b, c) is at index a*1024 + b*32 + c, counts[index] is its
+    number of hands and ids[index, :count] their ids.
+    """
+    card_sets = list(card_set_hands())
+    width = max(len(hands) for _, hands in card_sets)
+    counts = np.zeros(32 ** 3, np.int8)
+    ids = np.full((32 ** 3, width), -1, np.int16)
+    for mask, hands in card_sets:
+        cards = [0, 0, 0] + [card for card in range(1, 32) if mask >> card & 1]
+        index = cards[-3] * 1024 + cards[-2] * 32 + cards[-1]
+        counts[index] = len(hands)
+        for slot, hand in enumerate(hands):
+            ids[index, slot] = hand_id(hand)
+    return counts, ids
+
+_count, _ids = _build_table()
+
+@dataclass(init=True)
+class HandBatch():
+    """Columnar result of `evaluate_cards_batch`, one entry per hand.
+
+    Instance variables
+    ----------
+    row : np.ndarray
+        The row of the input the hand is made from. A row gives as many
+        hands as `utilities.evaluate_cards` does, in the same order.
+    hand : np.ndarray
+        The hand id, position of the hand in `utilities.ALL_HANDS`.
+    rank : np.ndarray
+        The rank code, as in `hand_ranking`, see also `RANK_NAMES`.
+    value : np.ndarray
+        The value of the hand.
+    suit : np.ndarray
+        The suit of the hand, -1 for none.
+    eraseable : np.ndarray
+        Whether the hand is eraseable.
+    """
+    row: np.ndarray
+    hand: np.ndarray
+    rank: np.ndarray
+    value: np.ndarray
+    suit: np.ndarray
+    eraseable: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.row)
+
+def evaluate_cards_batch(cards: np.ndarray) -> HandBatch:
+    """Evaluate all available hands of many card tuples.
+
+    Argument
+    ----------
+    cards : np.ndarray
+        An integer array of shape (N, 3), each row holds 1~3 distinct deck
+        cards in any order, padded with 0. Rows that are not such a card
+        set make no hand.
+
+    Returns
+    ----------
+    batch : HandBatch
+        The hands of every row, same rules as `utilities.evaluate_cards`.
+    """
+    cards = np.asarray(cards)
+    if cards.ndim != 2 or cards.shape[1] > 3:
+        raise ValueError('cards should be an array of shape (N, 3)')
+    if cards.shape[1] < 3:
+        padding = np.zeros((len(cards), 3 - cards.shape[1]), cards.dtype)
+        cards = np.hstack((padding, cards))
+    cards = np.sort(cards, axis=1).astype(np.int32)
+    valid = ((cards[:, 0] >= 0) & (cards[:, 2] <= 31) & (cards[:, 2] > 0)
+             & ((cards[:, 0] == 0) | (cards[:, 0] != cards[:, 1]))
+             & ((cards[:, 1] == 0) | (cards[:, 1] != cards[:, 2])))
+    index = cards[:, 0] * 1024 + cards[:, 1] * 32 + cards[:, 2]
+    index[~valid] = 0
+
+    counts = _count[index]
+    row = np.repeat(np.arange(len(cards)), counts)
+    first = np.repeat(np.cumsum(counts) - counts, counts)
+    slot = np.arange(len(row)) - first
+    hand = _ids[index[row], slot]
+    return HandBatch(row, hand, _rank[hand], _value[hand],
+                     _suit[hand], _eraseable[hand])
+
+def _all_rows() -> np.ndarray:
+    """Every 1/2/3-card combination of the deck, as rows padded with 0."""
+    rows = []
+    for mask, _ in card_set_hands():
+        cards = [card for card in range(1, 32) if mask >> card & 1]
+        rows.append([0] * (3 - len(cards)) + cards)
+    return np.array(rows, np.int8)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--rows', type=int, default=2_000_000,
+                        help='number of rows to benchmark')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    combinations = _all_rows()
+    rows = rng.permuted(combinations[rng.integers(0, len(combinations),
+                                                  args.rows)], axis=1)
+    start = time.perf_counter()
+    batch = evaluate_cards_batch(rows)
+    elapsed = time.perf_counter() - start
+    print(f'batch : {args.rows / elapsed:,.0f} rows/s '
+          f'({len(batch)} hands from {args.rows} rows)')
+
+    sample = rows[:50_000].tolist()
+    start = time.perf_counter()
+    for row in sample:
+        evaluate_cards([card for card in row if card != 0])
+    elapsed = time.perf_counter() - start
+    print(f'scalar: {len(sample) / elapsed:,.0f} rows/s')
@@ -0,0 +1,568 @@
+# -*- coding: UTF-8 -*-
+"""Benchmarks of the rules engine and of the game servers.
+
+Usage
+----------
+python benchmark.py make-unmake --depth 4 --width 4
+    Nodes per second of a game tree walk, with `TableClassic.apply_move` /
+    `undo_move` against cloning the table with deepcopy at every node.
+python benchmark.py server --connections 3000 --moves 2000
+    Memory per connection and move latency of the threaded server
+    (`server.ServerHandler`) against the asyncio one (`aserver`). A game
+    seats 3 players, so the server process hosts one game per 3
+    connections, on consecutive ports, or with '--servers rooms' all the
+    games as rooms of one asyncio server. Every seat is named, so the
+    games start and the connections then sit idle, but those of the first
+    game, whose bots play moves and time the server relaying each one to
+    the other seats.
+python benchmark.py codec --tables 200
+    Bytes and encode / decode time of every type of package, with
+    `codec` against pickle, the format the servers used before.
+python benchmark.py sync --games 200
+    Bytes and client apply time (decode and `GameCoreClient.applyUpdate`)
+    of each change of random games sent as a delta, against the whole
+    table (`SyncGame`) the client would get instead. A share of the moves
+    are rejected by the server, which the client then takes back.
+python benchmark.py cluster --workers 1 2 4
+    Throughput of `cluster.Supervisor` by number of workers: load
+    processes play random games as fast as the server relays the moves,
+    each game in its own room.
+"""
+
+from copy import deepcopy
+from timeit import Timer
+from typing import Optional
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import random
+import socket
+import socketserver
+import statistics
+import struct
+import sys
+import threading
+import time
+import pickle
+from utilities import (TableClassic, Player, ALL_HANDS, NONE_HAND,
+                       enumerate_legal_moves)
+from package import Package, sync_hash
+from codec import encode, decode
+from game import LocalPlayerUtility, RemotePlayerUtility
+from server import (GameCoreServer, ServerHandler, PackageHandler,
+                    encodePackage)
+from client import GameCoreClient
+from aserver import AsyncServer
+from cluster import Supervisor
+
+def _positions(count: int, seed: int) -> list[TableClassic]:
+    """Tables in the middle of random games, for search to start from."""
+    rng = random.Random(seed)
+    tables = []
+    while len(tables) < count:
+        table = TableClassic()
+        for _ in range(2 + len(tables) % 2):
+            table.join(Player())
+        table.start(rng)
+        for _ in range(rng.randint(0, 12)):
+            moves = list(enumerate_legal_moves(table.get_player(), table))
+            table.apply_move(rng.choice(moves))
+            if not table.game_playing:
+                break
+        if table.game_playing:
+            tables.append(table)
+    return tables
+
+def _walk_unmake(table: TableClassic, depth: int, width: int) -> int:
+    nodes = 1
+    if depth == 0 or not table.game_playing:
+        return nodes
+    moves = list(enumerate_legal_moves(table.get_player(), table))[:width]
+    for move in moves:
+        record = table.apply_move(move)
+        nodes += _walk_unmake(table, depth - 1, width)
+        table.undo_move(record)
+    return nodes
+
+def _walk_deepcopy(table: TableClassic, depth: int, width: int) -> int:
+    nodes = 1
+    if depth == 0 or not table.game_playing:
+        return nodes
+    moves = list(enumerate_legal_moves(table.get_player(), table))[:width]
+    for move in moves:
+        child = deepcopy(table)
+        child.apply_move(move)
+        nodes += _walk_deepcopy(child, depth - 1, width)
+    return nodes
+
+def bench_make_unmake(args: argparse.Namespace) -> None:
+    tables = _positions(args.positions, args.seed)
+    for name, walk in (('apply/undo', _walk_unmake),
+                       ('deepcopy', _walk_deepcopy)):
+        nodes = 0
+        start = time.perf_counter()
+        for table in tables:
+            nodes += walk(table, args.depth, args.width)
+        elapsed = time.perf_counter() - start
+        print(f'{name:<10}: {nodes / elapsed:>12,.0f} nodes/s '
+              f'({nodes} nodes)')
+
+def _sample_packages(tables: int, seed: int) -> dict[str, list]:
+    """Packages of every type, as the servers send them: SyncGame as
+    `syncGameTo`, GameStart as `startGame` and the changes of a game with
+    their sequence number and hash."""
+    rng = random.Random(seed)
+    syncs = []
+    starts = []
+    for table in _positions(tables, seed):
+        seat = rng.randrange(len(table.players))
+        for index, player in enumerate(table.players):
+            player.name = f'player{index}'
+        dealt = TableClassic()
+        for player in table.players:
+            dealt.join(Player(player.name))
+        dealt.start(rng)
+        starts.append(Package.GameStart(
+            rng.randrange(1, 1000), seat, dealt.players[seat].card_mask,
+            [player.card_count() for player in dealt.players],
+            dealt.get_player_index(), sync_hash(dealt)))
+        for index, player in enumerate(table.players):
+            if index != seat:
+                player.cards = [-1] * player.card_count()
+        syncs.append(Package.SyncGame(table, seat, rng.randrange(1, 1000)))
+    hands = [hand for hand in ALL_HANDS if hand is not NONE_HAND]
+    def change() -> tuple[int, int]:
+        return rng.randrange(1, 1000), rng.getrandbits(32)
+    return {
+        'PlayCard': [Package.PlayCard(rng.randrange(3), rng.choice(hands),
+                                      *change())
+                     for _ in range(tables)]
+                    + [Package.PlayCard(0, None, *change())],
+        'PlayErase': [Package.PlayErase(rng.randrange(3), rng.randint(1, 31),
+                                        *change())],
+        'SyncGame': syncs,
+        'GameStart': starts,
+        'MoveRejected': [Package.MoveRejected(*change())],
+        'GameOver': [Package.GameOver('player0')],
+        'SendName': [Package.SendName('player0')],
+        'GetPlayer': [Package.GetPlayer(['player0', 'player1', 'player2'],
+                                        3)],
+        'AgainChk': [Package.AgainChk(True)],
+        'SyncReq': [Package.SyncReq()],
+        'JoinRoom': [Package.JoinRoom('table-42', 3)],
+    }
+
+def bench_codec(args: argparse.Namespace) -> None:
+    print(f'{"package":<12} {"format":<6} {"bytes":>6} {"encode":>9} '
+          f'{"decode":>9}')
+    for name, packages in _sample_packages(args.tables, args.seed).items():
+        for form, dumps, loads in (('pickle', pickle.dumps, pickle.loads),
+                                   ('codec', encode, decode)):
+            datas = [dumps(package) for package in packages]
+            timings = []
+            for run in (lambda: [dumps(package) for package in packages],
+                        lambda: [loads(data) for data in datas]):
+                timer = Timer(run)
+                number, _ = timer.autorange()
+                timings.append(min(timer.repeat(3, number)) / number
+                               / len(packages))
+            print(f'{name:<12} {form:<6} '
+                  f'{sum(map(len, datas)) / len(datas):>6.0f} '
+                  f'{timings[0] * 1e6:>7.2f}us {timings[1] * 1e6:>7.2f}us')
+
+class _Relay(PackageHandler):
+    """The protocol of a game without connections: packages to the
+    clients are queued in outbox."""
+    def __init__(self, core: GameCoreServer, clients: list) -> None:
+        self.core = core
+        self.clients = clients
+        self.outbox: list[tuple[GameCoreClient, bytes]] = []
+
+    def sendPackage(self, client: GameCoreClient, package: Package.Package):
+        self.outbox.append((client, encodePackage(package)))
+
+    def closeConnection(self, player_id: int, reason: str):
+        raise NotImplementedError
+
+def bench_sync(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    # the server deals with the global generator
+    random.seed(args.seed)
+    core = GameCoreServer()
+    clients = [GameCoreClient() for _ in range(3)]
+    sent: list[list[Package.Package]] = [[] for _ in clients]
+    for seat, client in enumerate(clients):
+        core.join()
+        core.setName(seat, f'player{seat}')
+        client.network_handler.sendPackage = sent[seat].append
+    relay = _Relay(core, clients)
+    probe = GameCoreClient()
+    # kind: [number, delta bytes, snapshot bytes, delta times, snapshot times]
+    stats = {kind: [0, 0, 0, [], []] for kind in ('start', 'move', 'reject')}
+    turns = desyncs = 0
+
+    def deliver() -> None:
+        nonlocal desyncs
+        while relay.outbox:
+            client, data = relay.outbox.pop(0)
+            start = time.perf_counter()
+            package = decode(data[4:])
+            client.applyUpdate(package)
+            elapsed = time.perf_counter() - start
+            seat = clients.index(client)
+            match package:
+                case Package.PlayCard() | Package.PlayErase(): kind = 'move'
+                case Package.MoveRejected():                   kind = 'reject'
+                case _:                                        kind = 'start'
+            relay.syncGameTo(seat)
+            _, snapshot = relay.outbox.pop()
+            start = time.perf_counter()
+            probe.applyUpdate(decode(snapshot[4:]))
+            entry = stats[kind]
+            entry[0] += 1
+            entry[1] += len(data)
+            entry[2] += len(snapshot)
+            entry[3].append(elapsed)
+            entry[4].append(time.perf_counter() - start)
+            for index, requests in enumerate(sent):
+                for request in requests:
+                    desyncs += 1
+                    relay.handlePackage(index, request)
+                requests.clear()
+
+    for _ in range(args.games):
+        relay.startGame()
+        deliver()
+        table = core.table
+        while table.game_playing:
+            seat = table.get_player_index()
+            client = clients[seat]
+            move = rng.choice(list(core.players[seat].legal_moves()))
+            if move is None:
+                client.passTurn()
+            else:
+                client.playHand(move)
+            package = sent[seat].pop()
+            if rng.random() < args.rejects:
+                # a move the server does not accept, e.g. sent twice
+                player = table.players[seat]
+                package = Package.PlayCard(-1, next(
+                    hand for hand in ALL_HANDS
+                    if hand.mask & ~player.card_mask))
+            else:
+                turns += 1
+            relay.handlePackage(seat, decode(encode(package)))
+            deliver()
+
+    delta_bytes = sum(entry[1] for entry in stats.values())
+    snapshot_bytes = sum(entry[2] for entry in stats.values())
+    print(f'{args.games} games, {turns} moves, {desyncs} desyncs')
+    print(f'{"change":<7} {"number":>7} {"delta":>14} {"snapshot":>14}')
+    for kind, (number, delta, snapshot, delta_times,
+               snapshot_times) in stats.items():
+        if number:
+            print(f'{kind:<7} {number:>7} '
+                  f'{delta / number:>4.0f} B {statistics.median(delta_times) * 1e6:>5.1f} us '
+                  f'{snapshot / number:>4.0f} B {statistics.median(snapshot_times) * 1e6:>5.1f} us')
+    print(f'per move: {delta_bytes / turns:.0f} bytes as deltas, '
+          f'{snapshot_bytes / turns:.0f} bytes as snapshots')
+
+def _serve_games(kind: str, games: int, port: int, ready) -> None:
+    """Serve one game per port from port, or rooms on port, until
+    terminated."""
+    logging.getLogger('server').setLevel(logging.WARNING)
+    sys.stdout = open(os.devnull, 'w')
+    if kind in ('async', 'rooms'):
+        async def serve() -> None:
+            for game in range(1 if kind == 'rooms' else games):
+                await AsyncServer(3).start('127.0.0.1', port + game)
+            ready.set()
+            await asyncio.Event().wait()
+        asyncio.run(serve())
+        return
+    for game in range(games):
+        # ServerHandler keeps its game in class attributes, one class a game
+        handler = type('ServerHandler', (ServerHandler,),
+                       {'core': GameCoreServer(), 'clients': [],
+                        'lock': threading.RLock()})
+        server = socketserver.ThreadingTCPServer(('127.0.0.1', port + game),
+                                                 handler, False)
+        server.allow_reuse_address = True
+        server.server_bind()
+        server.server_activate()
+        server.daemon_threads = True
+        server.player_count = 3
+        server.rare_rule = False
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    ready.set()
+    threading.Event().wait()
+
+def _process_status(pid: int) -> dict[str, str]:
+    with open(f'/proc/{pid}/status') as file:
+        return dict(line.split(':', 1) for line in file)
+
+def _recv_package(sock: socket.socket) -> Package.Package:
+    def recv_exact(size: int) -> bytes:
+        data = b''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError('server closed the connection')
+            data += chunk
+        return data
+    return decode(recv_exact(struct.unpack('!I', recv_exact(4))[0]))
+
+class _Bot:
+    """A headless client playing random moves, as `client.GameCoreClient`."""
+    def __init__(self, sock: Optional[socket.socket] = None) -> None:
+        self.sock = sock
+        self.table: Optional[TableClassic] = None
+
+    def recv(self) -> Package.Package:
+        """Receive a package and apply it to the table."""
+        return self.apply(_recv_package(self.sock))
+
+    def play(self, rng: random.Random) -> None:
+        """Play a random legal move and send it."""
+        self.sock.sendall(encodePackage(self.move(rng)))
+
+    def apply(self, package: Package.Package) -> Package.Package:
+        """Apply a package received from the server to the table."""
+        match package:
+            case Package.SyncGame():
+                self.table = package.table
+                self.id = package.id
+                self.players = [
+                    (LocalPlayerUtility if index == package.id
+                     else RemotePlayerUtility)(player, self.table)
+                    for index, player in enumerate(self.table.players)]
+            case Package.GameStart():
+                self.table.start_seen(package.id, package.cards,
+                                      package.card_counts, package.dealer)
+            case Package.PlayCard() if package.hand is None:
+                self.players[package.id].pass_turn()
+            case Package.PlayCard():
+                self.players[package.id].play_hand(package.hand)
+            case Package.PlayErase():
+                self.players[package.id].play_erase(package.card)
+        return package
+
+    def move(self, rng: random.Random) -> Package.Package:
+        """Play a random legal move, return the package to send."""
+        seat = self.players[self.id]
+        move = rng.choice(list(seat.legal_moves()))
+        if seat.for_erase:
+            package = Package.PlayErase(-1, None if move is None
+                                        else move.card[0])
+        else:
+            package = Package.PlayCard(-1, move)
+        seat.play_move(move)
+        return package
+
+def _measure_server(kind: str, connections: int, moves: int, port: int,
+                    seed: int) -> None:
+    games = -(-connections // 3)
+    context = multiprocessing.get_context('fork')
+    ready = context.Event()
+    process = context.Process(target=_serve_games,
+                              args=(kind, games, port, ready),
+                              daemon=True)
+    process.start()
+    ready.wait()
+    time.sleep(0.5)
+    before = _process_status(process.pid)
+
+    start = time.perf_counter()
+    bots = []
+    for game in range(games):
+        # seat by seat: a full table deals on every name sent, and the
+        # threaded server races on names sent at once
+        seats = []
+        for index in range(3):
+            if kind == 'rooms':
+                bot = _Bot(socket.create_connection(('127.0.0.1', port)))
+                bot.sock.sendall(encodePackage(Package.JoinRoom(f'{game}')))
+            else:
+                bot = _Bot(socket.create_connection(('127.0.0.1',
+                                                     port + game)))
+            bot.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            bot.sock.settimeout(10)
+            bot.sock.sendall(encodePackage(Package.SendName(f'bot{index}')))
+            while index < 2 and not isinstance(bot.recv(), Package.GetPlayer):
+                pass
+            seats.append(bot)
+        for bot in seats:
+            while not isinstance(bot.recv(), Package.SyncGame):
+                pass
+        bots.append(seats)
+    setup = time.perf_counter() - start
+    time.sleep(0.5)
+    after = _process_status(process.pid)
+    rss = (int(after['VmRSS'].split()[0])
+           - int(before['VmRSS'].split()[0])) * 1024
+
+    rng = random.Random(seed)
+    seats = bots[0]
+    latencies = []
+    while len(latencies) < moves:
+        table = seats[0].table
+        if not table.game_playing:
+            seats[0].sock.sendall(encodePackage(Package.AgainChk(True)))
+            for bot in seats:
+                bot.recv()
+            continue
+        mover = next(bot for bot in seats
+                     if bot.id == table.get_player_index())
+        start = time.perf_counter()
+        mover.play(rng)
+        for bot in seats:
+            if bot is not mover:
+                bot.recv()
+        latencies.append(time.perf_counter() - start)
+
+    process.terminate()
+    process.join()
+    for game in bots:
+        for bot in game:
+            bot.sock.close()
+    latencies.sort()
+    print(f'{kind:<6}: {connections} connections in {games} games, '
+          f'{rss / connections / 1024:6.1f} KiB and '
+          f'{setup / connections * 1e6:5.0f} us setup per connection, '
+          f'{after["Threads"].strip()} threads')
+    print(f'{"":<6}  move relay latency: median '
+          f'{statistics.median(latencies) * 1e6:6.0f} us, 99% '
+          f'{latencies[int(len(latencies) * 0.99)] * 1e6:6.0f} us')
+
+async def _play_room(port: int, room: str, deadline: float,
+                     rng: random.Random) -> int:
+    """Play random games in a room until deadline, return the moves."""
+    async def recv(reader: asyncio.StreamReader) -> Package.Package:
+        header = await reader.readexactly(4)
+        return decode(await reader.readexactly(
+            struct.unpack('!I', header)[0]))
+    seats = []
+    for index in range(3):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(encodePackage(Package.JoinRoom(room))
+                     + encodePackage(Package.SendName(f'bot{index}')))
+        bot = _Bot()
+        while index < 2 and not isinstance(bot.apply(await recv(reader)),
+                                           Package.GetPlayer):
+            pass
+        seats.append((bot, reader, writer))
+    for bot, reader, _ in seats:
+        while not isinstance(bot.apply(await recv(reader)),
+                             Package.SyncGame):
+            pass
+    moves = 0
+    while time.perf_counter() < deadline:
+        table = seats[0][0].table
+        if not table.game_playing:
+            seats[0][2].write(encodePackage(Package.AgainChk(True)))
+            for bot, reader, _ in seats:
+                bot.apply(await recv(reader))
+            continue
+        mover, _, writer = next(seat for seat in seats
+                                if seat[0].id == table.get_player_index())
+        writer.write(encodePackage(mover.move(rng)))
+        for bot, reader, _ in seats:
+            if bot is not mover:
+                bot.apply(await recv(reader))
+        moves += 1
+    for _, _, writer in seats:
+        writer.close()
+    return moves
+
+def _load_client(port: int, client: int, games: int, seconds: float,
+                 results) -> None:
+    """Play games in rooms of a server for some seconds, put the moves."""
+    async def load() -> int:
+        deadline = time.perf_counter() + seconds
+        moves = await asyncio.gather(*(
+            _play_room(port, f'{client}-{game}', deadline,
+                       random.Random(client << 32 | game))
+            for game in range(games)))
+        return sum(moves)
+    results.put(asyncio.run(load()))
+
+def bench_cluster(args: argparse.Namespace) -> None:
+    logging.getLogger('server').setLevel(logging.WARNING)
+    sys.stdout.flush()
+    context = multiprocessing.get_context('fork')
+    for workers in args.workers:
+        supervisor = Supervisor('127.0.0.1', args.port, workers)
+        stdout, sys.stdout = sys.stdout, open(os.devnull, 'w')
+        try:
+            supervisor.start()
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        results = context.Queue()
+        clients = [context.Process(target=_load_client,
+                                   args=(args.port, client, args.games,
+                                         args.seconds, results))
+                   for client in range(args.clients)]
+        for client in clients:
+            client.start()
+        moves = sum(results.get() for _ in clients)
+        for client in clients:
+            client.join()
+        supervisor.stop()
+        print(f'{workers:>2} workers: {moves / args.seconds:>9,.0f} moves/s '
+              f'({args.clients} clients x {args.games} rooms, '
+              f'{os.cpu_count()} cores)')
+
+def bench_server(args: argparse.Namespace) -> None:
+    for kind in args.servers:
+        _measure_server(kind, args.connections, args.moves, args.port,
+                        args.seed)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    make_unmake = commands.add_parser('make-unmake')
+    make_unmake.add_argument('--depth', type=int, default=4)
+    make_unmake.add_argument('--width', type=int, default=4)
+    make_unmake.add_argument('--positions', type=int, default=20)
+    make_unmake.add_argument('--seed', type=int, default=0)
+    make_unmake.set_defaults(run=bench_make_unmake)
+
+    server = commands.add_parser('server')
+    server.add_argument('--connections', type=int, default=3000)
+    server.add_argument('--moves', type=int, default=2000)
+    server.add_argument('--port', type=int, default=20000,
+                        help='the first of the ports of the games')
+    server.add_argument('--servers', nargs='+', default=['thread', 'async'],
+                        choices=('thread', 'async', 'rooms'))
+    server.add_argument('--seed', type=int, default=0)
+    server.set_defaults(run=bench_server)
+
+    codec = commands.add_parser('codec')
+    codec.add_argument('--tables', type=int, default=200,
+                       help='SyncGame tables in the middle of random games')
+    codec.add_argument('--seed', type=int, default=0)
+    codec.set_defaults(run=bench_codec)
+
+    sync = commands.add_parser('sync')
+    sync.add_argument('--games', type=int, default=200)
+    sync.add_argument('--rejects', type=float, default=0.05,
+                      help='the share of the moves the server rejects')
+    sync.add_argument('--seed', type=int, default=0)
+    sync.set_defaults(run=bench_sync)
+
+    cluster = commands.add_parser('cluster')
+    cluster.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    cluster.add_argument('--clients', type=int, default=2,
+                         help='load processes')
+    cluster.add_argument('--games', type=int, default=50,
+                         help='rooms played at once by each load process')
+    cluster.add_argument('--seconds', type=float, default=10)
+    cluster.add_argument('--port', type=int, default=20000)
+    cluster.set_defaults(run=bench_cluster)
+
+    args = parser.parse_args()
+    args.run(args)
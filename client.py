@@ -1,6 +1,6 @@
 from utilities import TableClassic, Hand
-import pickle
-from package import Package
+from package import Package, sync_hash
+from codec import encode, decode
 from PySide6.QtCore import Qt, Signal, QObject
 from PySide6.QtNetwork import QTcpSocket, QAbstractSocket
 from logger import ConnectionLogger
@@ -12,9 +12,8 @@ class ClientHandler(QObject):
     gameover = Signal(str)
     update_players = Signal(list, int)
     connection_lose = Signal()
-    sync_game = Signal(TableClassic, int)
-    others_play_hand = Signal(Hand, int)
-    others_erase_hand = Signal(int, int)
+    # a package that changes the game, see `GameCoreClient.applyUpdate`
+    game_update = Signal(object)
     connection_error = Signal(str)
 
     def __init__(self):
@@ -27,30 +26,35 @@ class ClientHandler(QObject):
 
         self.logger = ConnectionLogger('client')
 
-    def connect_to_server(self, ip: str, port:int, name: str):
+    def connect_to_server(self, ip: str, port:int, name: str, room: Optional[str] = None, player_count: int = 0):
+        """Connect to a server, to a room of it if room is given (see `rooms`)"""
         self.socket.connectToHost(ip, port)
         self.name = name
+        self.room = room
+        self.player_count = player_count
         
     def disconnect_from_server(self):
         self.socket.disconnectFromHost()
 
     def on_connected(self):
         self.logger.log('connect', self.socket, '')
+        if self.room is not None:
+            self.sendPackage(Package.JoinRoom(self.room, self.player_count))
         self.sendPackage(Package.SendName(self.name))
 
     def on_ready_read(self):
         header = self.socket.read(4).data()  # Read the 4-byte header
         length = struct.unpack("!I", header)[0]  # Unpack the message length from network byte order
         data = self.socket.read(length).data()
-        package = pickle.loads(data)
+        package = decode(data)
         self.logger.log('recv', self.socket, str(package))
 
         match package:
             case Package.GameOver():  self.gameover.emit(package.winner)
             case Package.GetPlayer(): self.update_players.emit(package.players, package.full_count)
-            case Package.SyncGame():  self.sync_game.emit(package.table, package.id)
-            case Package.PlayCard():  self.others_play_hand.emit(package.hand, package.id)
-            case Package.PlayErase(): self.others_erase_hand.emit(package.card, package.id)
+            case Package.SyncGame() | Package.GameStart() | Package.PlayCard() \
+                 | Package.PlayErase() | Package.MoveRejected():
+                                      self.game_update.emit(package)
             case _:                    raise NotImplementedError
         
     def on_disconnected(self):
@@ -64,7 +68,7 @@ class ClientHandler(QObject):
             self.connection_error.emit(f'連線錯誤:{socketError}')
 
     def sendPackage(self, package:Package.Package):
-        package_byte = pickle.dumps(package)
+        package_byte = encode(package)
         message_length = len(package_byte)
         header = struct.pack("!I", message_length)  # "!I" indicates network byte order for an unsigned int
         self.socket.write(header + package_byte)
@@ -73,8 +77,15 @@ class ClientHandler(QObject):
 class GameCoreClient:
     def __init__(self):
         self.network_handler = ClientHandler()
-
-    def setup(self, table: TableClassic, index: int):
+        self.table: Optional[TableClassic] = None
+        # the number of changes of the game applied to the table
+        self.seq = 0
+        # the `move_record` of the own move the server may still reject
+        self.pending: Optional[tuple] = None
+        # a `Package.SyncReq` is sent, the changes wait for the table
+        self.syncing = False
+
+    def setup(self, table: TableClassic, index: int, seq: int = 0):
         self.table = table
         self.players: list[PlayerUtilityInterface] = []
         
@@ -86,6 +97,55 @@ class GameCoreClient:
                 self.players.append(self.current_player)
 
         self.current_player_index = index
+        self.seq = seq
+        self.pending = None
+        self.syncing = False
+
+    def applyUpdate(self, package: Package.Package) -> bool:
+        """Apply a change of the game from the server to the table.
+
+        Return False when the table is out of sync instead: the change is
+        ignored and the whole table is asked for once (`Package.SyncReq`).
+        """
+        if isinstance(package, Package.SyncGame):
+            self.setup(package.table, package.id, package.seq)
+            return True
+        if self.syncing:
+            return False
+        if self.table is None:
+            return self.requestSync()
+        if isinstance(package, Package.MoveRejected):
+            if self.pending is None or package.seq != self.seq - 1:
+                return self.requestSync()
+            self.table.undo_move(self.pending)
+        elif package.seq != self.seq + 1:
+            return self.requestSync()
+        else:
+            match package:
+                case Package.GameStart():
+                    self.table.start_seen(package.id, package.cards,
+                                          package.card_counts, package.dealer)
+                case Package.PlayCard():
+                    self.othersPlayHand(package.id, package.hand)
+                case Package.PlayErase():
+                    self.othersEraseHand(package.id, package.card)
+        self.seq = package.seq
+        self.pending = None
+        if sync_hash(self.table) != package.hash:
+            return self.requestSync()
+        return True
+
+    def requestSync(self) -> bool:
+        """Ask the server for the whole table, return False"""
+        self.syncing = True
+        self.network_handler.sendPackage(Package.SyncReq())
+        return False
+
+    def playedOwn(self, record: tuple) -> None:
+        """Count an own move, the server may still reject it: record is
+        the `TableClassic.move_record` of before the move"""
+        self.pending = record
+        self.seq += 1
 
     def selectCards(self, cards: list[int]):
         current_player = self.current_player
@@ -97,7 +157,7 @@ class GameCoreClient:
                 raise NotImplementedError
         else:
             if len(cards) == 1:
-                if self.table.turn == 1 and 1 not in self.table.cards:
+                if self.table.turn == 1 and not self.table.card_mask & 1 << 1:
                     if cards[0] != 1:
                         return
                 current_player.avalhands = [Hand((cards[0],))]
@@ -106,6 +166,7 @@ class GameCoreClient:
     def passTurn(self):
         current_player = self.current_player
 
+        record = self.table.move_record()
         if self.current_player.for_erase:
             valid = current_player.play_erase(None)
             if valid:
@@ -114,6 +175,8 @@ class GameCoreClient:
             valid = current_player.pass_turn()
             if valid:
                 self.network_handler.sendPackage(Package.PlayCard(-1, None)) 
+        if valid:
+            self.playedOwn(record)
 
         if not valid:
             raise NotImplementedError
@@ -124,7 +187,7 @@ class GameCoreClient:
         if hand is None:
             return current_player.pass_turn()
 
-        if len(current_player.player.cards) < len(hand.card):
+        if current_player.player.card_count() < len(hand.card):
             return False
 
         success = current_player.play_hand(hand)
@@ -142,6 +205,7 @@ class GameCoreClient:
         current_player = self.current_player
 
         # put played card onto table
+        record = self.table.move_record()
         if current_player.for_erase:
             valid = current_player.play_erase(hand.card[0])
             self.network_handler.sendPackage(Package.PlayErase(-1, hand.card[0]))
@@ -151,6 +215,7 @@ class GameCoreClient:
 
         if not valid:
             raise NotImplementedError
+        self.playedOwn(record)
 
     def getRule(self) -> tuple[bool, bool, bool]:
         return self.table.rule9, self.table.rule19, self.table.rule29
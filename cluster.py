@@ -0,0 +1,319 @@
+# -*- coding: UTF-8 -*-
+"""Game server sharded by room over worker processes.
+
+One Python process serves one core at most. A `Supervisor` forks N
+workers, each an `aserver.AsyncServer` with its own rooms, and restarts
+any worker that dies. Every room has an owner: worker
+`room_owner(room_id, N)`, a stable hash of the room id. The owner is the
+only worker that ever hosts the room.
+
+All workers accept on the same port with SO_REUSEPORT, so the kernel
+spreads the connections over them. A worker reads the first package of a
+connection, which names the room (see `rooms`). When the room belongs to
+another worker, it hands the socket off to the owner, with the package
+already read, over a Unix socket (SCM_RIGHTS); the client sees
+nothing of it. Without SO_REUSEPORT only worker 0 accepts, and hands
+every other room off. While the owner is down, the hand-off is tried
+again until the supervisor has restarted it, for `_RESTART_WAIT` seconds
+at most, then the connection is logged and closed.
+
+Classes
+----------
+Worker -- One worker process: accept, route and serve the rooms it owns.
+Supervisor -- Fork the workers and keep them running.
+
+Functions
+----------
+room_owner -- The index of the worker that owns a room.
+
+Usage
+----------
+python cluster.py --port 8888 --workers 4
+"""
+
+from typing import Optional
+import argparse
+import array
+import asyncio
+import multiprocessing
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import time
+import zlib
+from package import Package
+from codec import decode
+from aserver import AsyncServer, AsyncServerHandler
+from rooms import DEFAULT_ROOM
+
+__all__ = [
+    'room_owner',
+    'Worker',
+    'Supervisor'
+]
+
+_REUSE_PORT = hasattr(socket, 'SO_REUSEPORT')
+# The largest first package handed off with its socket.
+_MAX_FRAME = 1 << 16
+# The seconds a hand-off waits for its owner to be restarted.
+_RESTART_WAIT = 5.0
+
+def room_owner(room_id: str, workers: int) -> int:
+    """The index of the worker that owns a room, among a number of them.
+
+    The same in every process: it does not depend on the hash seed.
+    """
+    return zlib.crc32(room_id.encode()) % workers
+
+def _hand_off_path(directory: str, index: int) -> str:
+    return os.path.join(directory, f'worker{index}.sock')
+
+class Worker:
+    """One worker process: accept, route and serve the rooms it owns.
+
+    Instance variables
+    ----------
+    index : int
+        The index of the worker, the rooms it owns are those of
+        `room_owner(room_id, workers) == index`.
+    workers : int
+        The number of workers.
+    host, port : str, int
+        The address all the workers accept on.
+    directory : str
+        The directory of the Unix sockets connections are handed off
+        through.
+    server : AsyncServer
+        The rooms of the worker.
+    """
+    logger = AsyncServerHandler.logger
+
+    def __init__(self, index: int, workers: int, host: str, port: int,
+                 directory: str, player_count: int = 3,
+                 rare_rule: bool = False) -> None:
+        self.index = index
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.directory = directory
+        self.server = AsyncServer(player_count, rare_rule)
+        self._hand_off: Optional[socket.socket] = None
+        # the event loop only keeps weak references to tasks
+        self._tasks: set[asyncio.Task] = set()
+
+    async def run(self, ready=None) -> None:
+        """Serve until the process ends, set ready once accepting."""
+        loop = asyncio.get_running_loop()
+        path = _hand_off_path(self.directory, self.index)
+        if os.path.exists(path):
+            os.unlink(path)
+        self._hand_off = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._hand_off.bind(path)
+        self._hand_off.setblocking(False)
+        loop.add_reader(self._hand_off, self._adopt)
+
+        listener = None
+        if _REUSE_PORT or self.index == 0:
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if _REUSE_PORT:
+                listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            listener.bind((self.host, self.port))
+            listener.listen(1024)
+            listener.setblocking(False)
+        if ready is not None:
+            ready.set()
+        if listener is None:
+            await asyncio.Event().wait()
+        while True:
+            conn, address = await loop.sock_accept(listener)
+            conn.setblocking(False)
+            self._spawn(self._route(conn, address))
+
+    async def _route(self, conn: socket.socket, address: tuple) -> None:
+        """Serve a new connection, or hand it off to the owner of its room."""
+        frame = await self._recv_frame(conn)
+        if frame is None:
+            conn.close()
+            return
+        try:
+            package = decode(frame[4:])
+        except ValueError:
+            conn.close()
+            return
+        room_id = (package.room if isinstance(package, Package.JoinRoom)
+                   else DEFAULT_ROOM)
+        owner = room_owner(room_id, self.workers)
+        if owner == self.index:
+            await self._serve(conn, package)
+            return
+        # socket.send_fds drops its address before Python 3.12
+        fds = [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                array.array('i', [conn.fileno()]))]
+        path = _hand_off_path(self.directory, owner)
+        deadline = time.monotonic() + _RESTART_WAIT
+        while True:
+            try:
+                self._hand_off.sendmsg([frame], fds, 0, path)
+            except BlockingIOError:
+                # the queue of the owner is full, wait for it to adopt
+                await asyncio.sleep(0.001)
+                continue
+            except OSError as error:
+                # the owner is down, wait for the supervisor to restart it
+                if time.monotonic() < deadline:
+                    await asyncio.sleep(0.05)
+                    continue
+                self.logger.log('disconnect', address,
+                                f'hand-off to worker {owner} failed: {error}')
+            break
+        conn.close()
+
+    async def _recv_frame(self, conn: socket.socket) -> Optional[bytes]:
+        """Read exactly one frame, header included, None if it fails.
+
+        Nothing past the frame is read: the rest stays in the socket for
+        whichever worker serves it.
+        """
+        loop = asyncio.get_running_loop()
+        async def recv_exact(size: int) -> Optional[bytes]:
+            data = b''
+            while len(data) < size:
+                chunk = await loop.sock_recv(conn, size - len(data))
+                if not chunk:
+                    return None
+                data += chunk
+            return data
+        try:
+            header = await recv_exact(4)
+            if header is None:
+                return None
+            length = struct.unpack("!I", header)[0]
+            if length + 4 > _MAX_FRAME:
+                return None
+            payload = await recv_exact(length)
+        except OSError:
+            return None
+        return None if payload is None else header + payload
+
+    def _adopt(self) -> None:
+        """Serve the sockets handed off by the other workers."""
+        while True:
+            try:
+                frame, fds, _, _ = socket.recv_fds(self._hand_off,
+                                                   _MAX_FRAME, 1)
+            except BlockingIOError:
+                return
+            if not fds:
+                continue
+            conn = socket.socket(fileno=fds[0])
+            conn.setblocking(False)
+            self._spawn(self._serve(conn, decode(frame[4:])))
+
+    def _spawn(self, coroutine) -> None:
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _serve(self, conn: socket.socket,
+                     package: Package.Package) -> None:
+        reader, writer = await asyncio.open_connection(sock=conn)
+        await AsyncServerHandler(self.server, reader, writer).handle(package)
+
+def _run_worker(worker: Worker, ready) -> None:
+    asyncio.run(worker.run(ready))
+
+class Supervisor:
+    """Fork the workers and keep them running.
+
+    Instance variables
+    ----------
+    host, port : str, int
+        The address the workers accept on.
+    workers : int
+        The number of worker processes.
+    player_count : int
+        The number of players of a room opened without one.
+    rare_rule : bool
+        Whether the rooms play with rule 'rare'.
+    processes : list[multiprocessing.Process]
+        processes[N] runs worker N.
+    """
+    def __init__(self, host: str, port: int, workers: int = os.cpu_count(),
+                 player_count: int = 3, rare_rule: bool = False) -> None:
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.player_count = player_count
+        self.rare_rule = rare_rule
+        self.processes: list[multiprocessing.Process] = []
+        self._directory = ''
+        self._context = multiprocessing.get_context('fork')
+
+    def start(self) -> None:
+        """Fork the workers, return once all of them accept."""
+        self._directory = tempfile.mkdtemp(prefix='cardgame-')
+        self.processes = [self._fork(index) for index in range(self.workers)]
+
+    def _fork(self, index: int) -> multiprocessing.Process:
+        worker = Worker(index, self.workers, self.host, self.port,
+                        self._directory, self.player_count, self.rare_rule)
+        ready = self._context.Event()
+        process = self._context.Process(target=_run_worker,
+                                        args=(worker, ready), daemon=True)
+        process.start()
+        ready.wait()
+        return process
+
+    def check(self) -> int:
+        """Restart the workers that died, return how many were.
+
+        The rooms of a restarted worker are lost, their players have to
+        join again.
+        """
+        restarted = 0
+        for index, process in enumerate(self.processes):
+            if not process.is_alive():
+                process.join()
+                self.processes[index] = self._fork(index)
+                restarted += 1
+        return restarted
+
+    def serve_forever(self, interval: float = 1.0) -> None:
+        """Check the workers every interval seconds, until interrupted."""
+        try:
+            while True:
+                time.sleep(interval)
+                self.check()
+        finally:
+            self.stop()
+
+    def stop(self) -> None:
+        """Terminate the workers."""
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join()
+        self.processes = []
+        shutil.rmtree(self._directory, ignore_errors=True)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--players', type=int, default=3, choices=(2, 3))
+    parser.add_argument('--rare', action='store_true',
+                        help="play with rule 'rare'")
+    args = parser.parse_args()
+
+    supervisor = Supervisor(args.host, args.port, args.workers, args.players,
+                            args.rare)
+    supervisor.start()
+    print(f'serve on {args.host}:{args.port} with {args.workers} workers')
+    try:
+        supervisor.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,311 @@
+# -*- coding: UTF-8 -*-
+"""Binary wire format of the `Package` messages.
+
+A package is encoded as the codec version, a byte, then the tag of its
+type, a byte, then its fields in the order of the schema of the type.
+Every field has a fixed layout, in network byte order:
+
+- a card is one byte, the cards on a table one byte each;
+- a set of cards (a hand, the cards of a player) is its card set bitmask
+  in 4 bytes (see `cards_to_mask`);
+- the rank of a hand is one byte, its position in `hand_ranking`;
+- a string is its length in 2 bytes then its UTF-8 bytes.
+
+Unlike pickle, decoding only ever builds packages and tables, and hands
+are looked up among those of the deck, so it is safe on bytes from the
+network, and it needs no class or module name on the wire: a `SyncGame`
+is a few dozen bytes.
+
+A table is sent as the state the players can see, its hashes and
+`reprc_left` are recomputed on decoding (`TableClassic.rehash`). The
+selected cards of the players stay on the side that selected them.
+
+Add a type of package to `_SCHEMAS` with a new tag, and change a schema
+only together with `CODEC_VERSION`: a decoder refuses the packages of
+any other version.
+
+Global variable
+----------
+CODEC_VERSION : int
+    The version of the format, first byte of every encoded package.
+
+Functions
+----------
+encode -- Encode a package into bytes.
+decode -- Decode a package from bytes.
+
+Usage
+----------
+data = encode(Package.PlayErase(0, 17))
+package = decode(data)
+"""
+
+from dataclasses import fields
+from typing import Any, Optional
+import struct
+from package import Package
+from utilities import (Hand, TableClassic, Player, NONE_HAND, ALL_HANDS,
+                       hand_ranking, rare_twins)
+
+__all__ = [
+    'CODEC_VERSION',
+    'encode',
+    'decode'
+]
+
+CODEC_VERSION = 2
+
+# rank byte of a hand, 0 is a missing hand (a pass)
+_RANK_BYTES = dict(hand_ranking)
+
+class _Field:
+    """The layout of a field: appends a value to bytes, reads it back."""
+    def pack(self, value: Any, out: bytearray) -> None:
+        raise NotImplementedError
+    def unpack(self, data: bytes, offset: int) -> tuple[Any, int]:
+        """Return the value at offset and the offset past it."""
+        raise NotImplementedError
+
+class _Scalar(_Field):
+    def __init__(self, form: str) -> None:
+        self.struct = struct.Struct('!' + form)
+    def pack(self, value: Any, out: bytearray) -> None:
+        out += self.struct.pack(value)
+    def unpack(self, data: bytes, offset: int) -> tuple[Any, int]:
+        return (self.struct.unpack_from(data, offset)[0],
+                offset + self.struct.size)
+
+class _Card(_Field):
+    """An optional card, 0 for None (skip an erase)."""
+    def pack(self, value: Optional[int], out: bytearray) -> None:
+        out.append(0 if value is None else value)
+    def unpack(self, data: bytes, offset: int) -> tuple[Optional[int], int]:
+        card = data[offset]
+        if card > 31:
+            raise ValueError('card that is not in the deck')
+        return card or None, offset + 1
+
+class _ByteList(_Field):
+    """A list of numbers of 0 to 255, e.g. numbers of cards."""
+    def pack(self, value: list[int], out: bytearray) -> None:
+        out.append(len(value))
+        out += bytes(value)
+    def unpack(self, data: bytes, offset: int) -> tuple[list[int], int]:
+        end = offset + 1 + data[offset]
+        if end > len(data):
+            raise ValueError('list past the end of the package')
+        return list(data[offset + 1:end]), end
+
+class _String(_Field):
+    _length = struct.Struct('!H')
+    def pack(self, value: str, out: bytearray) -> None:
+        raw = value.encode()
+        out += self._length.pack(len(raw))
+        out += raw
+    def unpack(self, data: bytes, offset: int) -> tuple[str, int]:
+        length, = self._length.unpack_from(data, offset)
+        offset += 2
+        if offset + length > len(data):
+            raise ValueError('string past the end of the package')
+        return bytes(data[offset:offset + length]).decode(), offset + length
+
+class _StringList(_Field):
+    def pack(self, value: list[str], out: bytearray) -> None:
+        out.append(len(value))
+        for string in value:
+            _STRING.pack(string, out)
+    def unpack(self, data: bytes, offset: int) -> tuple[list[str], int]:
+        strings = []
+        count = data[offset]
+        offset += 1
+        for _ in range(count):
+            string, offset = _STRING.unpack(data, offset)
+            strings.append(string)
+        return strings, offset
+
+class _Hand(_Field):
+    """An optional hand: its rank byte, 0 for None (a pass), then its card
+    set bitmask, value, suit and whether it is eraseable.
+
+    Only a hand of the deck is decoded: `NONE_HAND`, one of `ALL_HANDS`
+    or its variant of rule 'rare', the shared object its cards make. The table checks it
+    is the one its rules make (`PlayerUtility.play_hand`).
+    """
+    _body = struct.Struct('!Ibb?')
+    def __init__(self) -> None:
+        # the hands of the deck by their bytes
+        self._hands: dict[bytes, Hand] = {}
+        for hand in ((NONE_HAND,) + ALL_HANDS
+                     + tuple(rare for _, rare in rare_twins())):
+            raw = bytearray()
+            self.pack(hand, raw)
+            self._hands[bytes(raw)] = hand
+    def pack(self, value: Optional[Hand], out: bytearray) -> None:
+        if value is None:
+            out.append(0)
+            return
+        out.append(_RANK_BYTES[value.rank])
+        out += self._body.pack(value.mask, value.value, value.suit,
+                               value.eraseable)
+    def unpack(self, data: bytes, offset: int) -> tuple[Optional[Hand], int]:
+        if data[offset] == 0:
+            return None, offset + 1
+        end = offset + 1 + self._body.size
+        hand = self._hands.get(bytes(data[offset:end]))
+        if hand is None:
+            raise ValueError('not a hand of the deck')
+        return hand, end
+
+class _Table(_Field):
+    """A table as its players see it.
+
+    Layout: flags (rule9, rule19, rule29, rare_rule, for_erase,
+    game_playing), turn, deal, token holder, the previous hand, the cards
+    on the table in the order they were played, then each player: name,
+    card set bitmask, number of hidden cards and flags (lastplayed,
+    his_turn, in_game).
+
+    No hash is written: the decoder recomputes them from the cards it
+    gets, so `hands_hash` never carries the hidden hands to a client.
+    """
+    _head = struct.Struct('!BIqb')
+    _player = struct.Struct('!IBB')
+    _TABLE_FLAGS = ('rule9', 'rule19', 'rule29', 'rare_rule', '_for_erase',
+                    'game_playing')
+    _PLAYER_FLAGS = ('lastplayed', 'his_turn', 'in_game')
+
+    @staticmethod
+    def _flags(obj: Any, names: tuple[str, ...]) -> int:
+        flags = 0
+        for bit, name in enumerate(names):
+            if getattr(obj, name):
+                flags |= 1 << bit
+        return flags
+
+    def pack(self, value: TableClassic, out: bytearray) -> None:
+        out += self._head.pack(self._flags(value, self._TABLE_FLAGS),
+                               value.turn, value.deal, value._token)
+        _HAND.pack(value.previous_hand, out)
+        out.append(len(value.cards))
+        out += bytes(value.cards)
+        out.append(len(value.players))
+        for player in value.players:
+            _STRING.pack(player.name, out)
+            out += self._player.pack(player.card_mask, player.hidden_count,
+                                     self._flags(player, self._PLAYER_FLAGS))
+
+    def unpack(self, data: bytes, offset: int) -> tuple[TableClassic, int]:
+        table = TableClassic()
+        flags, table.turn, table.deal, table._token = \
+            self._head.unpack_from(data, offset)
+        table.rule9 = bool(flags & 1)
+        table.rule19 = bool(flags & 2)
+        table.rule29 = bool(flags & 4)
+        table.rare_rule = bool(flags & 8)
+        table._for_erase = bool(flags & 16)
+        table.game_playing = bool(flags & 32)
+        offset += self._head.size
+        hand, offset = _HAND.unpack(data, offset)
+        if hand is not None:
+            table.previous_hand = hand
+        count = data[offset]
+        offset += 1
+        table.cards = list(data[offset:offset + count])
+        if len(table.cards) != count:
+            raise ValueError('cards past the end of the package')
+        offset += count
+        for card in table.cards:
+            if not 1 <= card <= 31:
+                raise ValueError('table card that is not in the deck')
+            table.card_mask |= 1 << card
+        players = data[offset]
+        offset += 1
+        for _ in range(players):
+            player = Player()
+            player.name, offset = _STRING.unpack(data, offset)
+            player.card_mask, player.hidden_count, flags = \
+                self._player.unpack_from(data, offset)
+            offset += self._player.size
+            if player.card_mask & 1:
+                raise ValueError('player card that is not in the deck')
+            player.lastplayed = bool(flags & 1)
+            player.his_turn = bool(flags & 2)
+            player.in_game = bool(flags & 4)
+            table.players.append(player)
+        table.rehash()
+        return table, offset
+
+_INT8 = _Scalar('b')
+_UINT8 = _Scalar('B')
+_UINT32 = _Scalar('I')
+_BOOL = _Scalar('?')
+_CARD = _Card()
+_STRING = _String()
+_HAND = _Hand()
+
+# type: (tag, fields in the order they are encoded)
+_SCHEMAS: dict[type, tuple[int, tuple[tuple[str, _Field], ...]]] = {
+    Package.PlayCard:  (1, (('id', _INT8), ('hand', _HAND),
+                            ('seq', _UINT32), ('hash', _UINT32))),
+    Package.PlayErase: (2, (('id', _INT8), ('card', _CARD),
+                            ('seq', _UINT32), ('hash', _UINT32))),
+    Package.SyncGame:  (3, (('table', _Table()), ('id', _INT8),
+                            ('seq', _UINT32))),
+    Package.GameOver:  (4, (('winner', _STRING),)),
+    Package.SendName:  (5, (('name', _STRING),)),
+    Package.GetPlayer: (6, (('players', _StringList()),
+                            ('full_count', _UINT8))),
+    Package.AgainChk:  (7, (('agree', _BOOL),)),
+    Package.SyncReq:   (8, ()),
+    Package.JoinRoom:  (9, (('room', _STRING), ('player_count', _UINT8))),
+    Package.GameStart: (10, (('seq', _UINT32), ('id', _INT8),
+                             ('cards', _UINT32),
+                             ('card_counts', _ByteList()),
+                             ('dealer', _INT8), ('hash', _UINT32))),
+    Package.MoveRejected: (11, (('seq', _UINT32), ('hash', _UINT32))),
+}
+_TYPES = {tag: (kind, schema) for kind, (tag, schema) in _SCHEMAS.items()}
+
+def _check_schemas() -> None:
+    """Every type of package has a schema of all its fields."""
+    for name, kind in vars(Package).items():
+        if not isinstance(kind, type) or kind is Package.Package:
+            continue
+        if kind not in _SCHEMAS:
+            raise TypeError(f'Package.{name} has no schema')
+        names = [name for name, _ in _SCHEMAS[kind][1]]
+        if names != [field.name for field in fields(kind)]:
+            raise TypeError(f'the schema of Package.{name} is not its fields')
+_check_schemas()
+
+def encode(package: Package.Package) -> bytes:
+    """Encode a package into bytes, see the module docstring."""
+    tag, schema = _SCHEMAS[type(package)]
+    out = bytearray((CODEC_VERSION, tag))
+    for name, field in schema:
+        field.pack(getattr(package, name), out)
+    return bytes(out)
+
+def decode(data: bytes) -> Package.Package:
+    """Decode a package from the bytes of `encode`.
+
+    Raises ValueError when the bytes are not a package of this version.
+    """
+    if len(data) < 2 or data[0] != CODEC_VERSION:
+        raise ValueError('not a package of codec version '
+                         f'{CODEC_VERSION}')
+    if data[1] not in _TYPES:
+        raise ValueError(f'unknown package tag {data[1]}')
+    kind, schema = _TYPES[data[1]]
+    values = []
+    offset = 2
+    try:
+        for _, field in schema:
+            value, offset = field.unpack(data, offset)
+            values.append(value)
+    except (struct.error, IndexError, KeyError) as error:
+        raise ValueError(f'malformed {kind.__name__} package') from error
+    if offset != len(data):
+        raise ValueError(f'{len(data) - offset} bytes past the end of a '
+                         f'{kind.__name__} package')
+    return kind(*values)
@@ -0,0 +1,166 @@
+# -*- coding: UTF-8 -*-
+"""Precomputed "beats" relation between all possible hands.
+
+For every previous hand and every combination of rule9/19/29, the set of
+hands that can be played onto it is stored once as a bitset over hand ids
+(positions in `utilities.ALL_HANDS`). The empty previous hand has the id
+`len(ALL_HANDS)`. A previous hand can also be a hand of rule 'rare' (see
+`utilities.rare_twins`), stored after it; the bitsets hold the hands of
+`ALL_HANDS` only, a rare hand is never in them.
+
+Functions
+----------
+beats -- Return whether a hand can be played onto a previous hand.
+hands_beating -- Return the bitset of hands that can be played onto a hand.
+count_beating -- Count the hands that can be played onto a hand.
+strength_percentile -- Return the share of same-size hands weaker than a hand.
+bitset_hands -- Return the hands of a bitset.
+
+`batch_env` builds its playable tables from `hands_beating`. Running this
+module checks `hands_beating` against `TableClassic.is_playable_hand` for
+every hand, previous hand and rules.
+"""
+
+from bisect import bisect_left
+import time
+from utilities import (Hand, TableClassic, ALL_HANDS, NONE_HAND, hand_id,
+                       hands_of_size, keys_of_size, rare_twins)
+
+__all__ = [
+    'beats',
+    'hands_beating',
+    'count_beating',
+    'strength_percentile',
+    'bitset_hands'
+]
+
+def _rule_index(rule9: bool, rule19: bool, rule29: bool) -> int:
+    return rule9 | rule19 << 1 | rule29 << 2
+
+_RARE_HANDS = tuple(rare for _, rare in rare_twins())
+_rare_ids = {id(rare): len(ALL_HANDS) + 1 + index
+             for index, rare in enumerate(_RARE_HANDS)}
+
+def _build_beats() -> list[list[int]]:
+    """beats[rules][previous] is the bitset of hands playable onto previous.
+
+    Within a size, `ALL_HANDS` is sorted by key, so the hands that beat a
+    previous hand of the same size are one contiguous range of ids.
+    """
+    first = {}
+    position = 0
+    for size in (1, 2, 3):
+        first[size] = position
+        position += len(hands_of_size(size))
+    def span(size: int, start: int = 0) -> int:
+        stop = len(hands_of_size(size))
+        return ((1 << stop - start) - 1) << first[size] + start
+
+    everything = (1 << len(ALL_HANDS)) - 1
+    table = []
+    for rules in range(8):
+        rule9, rule19, rule29 = rules & 1, rules & 2, rules & 4
+        row = []
+        for previous in ALL_HANDS + (NONE_HAND,) + _RARE_HANDS:
+            if previous.rank == 'None':
+                row.append(everything)
+                continue
+            size = len(previous)
+            if previous.rank in ('triangle', 'straight', 'square'):
+                lowest = previous.key
+            else:
+                lowest = previous.key + 1
+            bitset = span(size, bisect_left(keys_of_size(size), lowest))
+            if size == 1 and rule9:
+                bitset |= span(2)
+            if size == 1 and rule29:
+                bitset |= span(3)
+            if size == 2 and rule19:
+                bitset |= span(3)
+            row.append(bitset)
+        table.append(row)
+    return table
+
+_beats = _build_beats()
+_counts = [[bitset.bit_count() for bitset in row] for row in _beats]
+
+def _previous_id(previous: Hand) -> int:
+    if previous.rank == 'None':
+        return len(ALL_HANDS)
+    index = hand_id(previous)
+    if index == -1:
+        index = _rare_ids.get(id(previous), -1)
+    if index == -1:
+        raise ValueError(f'{previous} is not a hand of the deck')
+    return index
+
+def hands_beating(previous: Hand, rule9: bool = False, rule19: bool = False,
+                  rule29: bool = False) -> int:
+    """Return the bitset of hands that can be played onto a previous hand.
+
+    Bit N is set when `ALL_HANDS[N]` is playable onto `previous` under the
+    given rules, as `TableClassic.is_playable_hand` decides after the
+    first turn.
+    """
+    rules = _rule_index(rule9, rule19, rule29)
+    return _beats[rules][_previous_id(previous)]
+
+def beats(hand: Hand, previous: Hand, rule9: bool = False,
+          rule19: bool = False, rule29: bool = False) -> bool:
+    """Return whether a hand can be played onto a previous hand."""
+    index = hand_id(hand)
+    if index == -1:
+        raise ValueError(f'{hand} is not a hand of the deck')
+    return bool(hands_beating(previous, rule9, rule19, rule29) >> index & 1)
+
+def count_beating(previous: Hand, rule9: bool = False, rule19: bool = False,
+                  rule29: bool = False) -> int:
+    """Count the hands that can be played onto a previous hand."""
+    rules = _rule_index(rule9, rule19, rule29)
+    return _counts[rules][_previous_id(previous)]
+
+def strength_percentile(hand: Hand) -> float:
+    """Return the share of hands of the same size weaker than a hand.
+
+    0.0 for the weakest hands, close to 1.0 for the strongest ones.
+    """
+    keys = keys_of_size(len(hand))
+    return bisect_left(keys, hand.key) / len(keys)
+
+def bitset_hands(bitset: int) -> list[Hand]:
+    """Return the hands of a bitset, weakest first within each size."""
+    hands = []
+    while bitset:
+        low = bitset & -bitset
+        hands.append(ALL_HANDS[low.bit_length() - 1])
+        bitset ^= low
+    return hands
+
+def _check() -> int:
+    """Check `hands_beating` against `TableClassic.is_playable_hand` after
+    the first turn, for every hand, previous hand (rare ones too) and
+    rules. Return the number of (hand, previous hand, rules) checked."""
+    table = TableClassic()
+    table.turn = 2
+    checked = 0
+    for rules in range(8):
+        table.rule9, table.rule19, table.rule29 = (bool(rules & 1),
+                                                   bool(rules & 2),
+                                                   bool(rules & 4))
+        for previous in (NONE_HAND,) + ALL_HANDS + _RARE_HANDS:
+            table.previous_hand = previous
+            # hands are equal by strength, the same hand is the same object
+            playable = {id(hand) for hand in bitset_hands(hands_beating(
+                previous, table.rule9, table.rule19, table.rule29))}
+            for hand in ALL_HANDS:
+                if table.is_playable_hand(hand)[0] != (id(hand) in playable):
+                    raise AssertionError(f'hands_beating({previous}) '
+                                         f'differs on {hand}, rules {rules}')
+            checked += len(ALL_HANDS)
+    return checked
+
+if __name__ == '__main__':
+    start = time.perf_counter()
+    checked = _check()
+    print(f'checked {checked} (hand, previous hand, rules) against '
+          f'is_playable_hand in {time.perf_counter() - start:.1f}s')
@@ -0,0 +1,144 @@
+# -*- coding: UTF-8 -*-
+"""Perfect-information endgame solver.
+
+With every hand known, the solver decides whether the seat to move can
+force a win, i.e. play all of his cards before any other seat still in the
+game, whatever the others do. With 3 players the two others are assumed
+to play together against him. The search follows the real `TableClassic`
+rules through `apply_move` / `undo_move`: passing, lastplayed resets,
+erase follow-ups and the rule9/19/29 toggles.
+
+Positions are cached in a transposition table by `TableClassic.state_hash`,
+and moves that play more cards are tried first. With a `tablebase.Tablebase`
+the positions it holds are looked up instead of searched.
+
+Classes
+----------
+EndgameSolver -- Solve endgames, keeping a transposition table.
+SolveResult -- The result of a solved position.
+
+Functions
+----------
+solve -- Solve the position of a table with a fresh solver.
+"""
+
+from dataclasses import dataclass
+from typing import Optional
+from utilities import TableClassic, Hand, enumerate_legal_moves
+
+__all__ = [
+    'SolveResult',
+    'EndgameSolver',
+    'solve'
+]
+
+@dataclass(init=True)
+class SolveResult():
+    """The result of a solved position.
+
+    Instance variables
+    ----------
+    win : bool
+        Whether the seat to move can force a win.
+    move : Hand | None
+        A winning move when `win`, else any legal move. None for passing
+        or skipping an erase, as in `enumerate_legal_moves`.
+    nodes : int
+        The number of positions searched.
+    """
+    win: bool
+    move: Optional[Hand]
+    nodes: int
+
+def _order(move: Optional[Hand]) -> tuple[int, int]:
+    """Sort key of moves: more cards first, then stronger, passing last."""
+    if move is None:
+        return (1, 0)
+    return (-len(move), -move.key)
+
+class EndgameSolver:
+    """Solve endgames, keeping a transposition table between positions.
+
+    Instance variables
+    ----------
+    table_size : int
+        The number of cached positions before the cache is cleared.
+    nodes : int
+        The number of positions searched by the last `solve`.
+    tablebase : tablebase.Tablebase | None
+        Solved positions to look up before searching.
+    """
+    def __init__(self, table_size: int = 1 << 20, tablebase=None) -> None:
+        self.table_size = table_size
+        self.tablebase = tablebase
+        self._cache: dict[tuple[int, int, bool], bool] = {}
+        self.nodes = 0
+
+    def solve(self, table: TableClassic) -> SolveResult:
+        """Solve the position of a table for the seat to move.
+
+        Every hand of the table has to be known (no -1 cards). The table is
+        left as it was.
+        """
+        if any(player.hidden_count for player in table.players):
+            raise ValueError('endgame solver needs every hand to be known')
+        if not table.game_playing:
+            raise ValueError('the game is over')
+        self.nodes = 0
+        if len(self._cache) > self.table_size:
+            self._cache.clear()
+        root = table.get_player_index()
+        moves = self._moves(table)
+        for move in moves:
+            if self._wins_after(table, move, root):
+                return SolveResult(True, move, self.nodes)
+        return SolveResult(False, moves[0], self.nodes)
+
+    def winning_moves(self, table: TableClassic) -> list[Optional[Hand]]:
+        """Return every move that keeps a forced win for the seat to move."""
+        root = table.get_player_index()
+        return [move for move in self._moves(table)
+                if self._wins_after(table, move, root)]
+
+    @staticmethod
+    def _moves(table: TableClassic) -> list[Optional[Hand]]:
+        moves = list(enumerate_legal_moves(table.get_player(), table))
+        moves.sort(key=_order)
+        return moves
+
+    def _wins_after(self, table: TableClassic, move: Optional[Hand],
+                    root: int) -> bool:
+        """Whether root can force a win after the seat to move plays move."""
+        seat = table.get_player_index()
+        record = table.apply_move(move)
+        if table.players[seat].card_mask == 0:
+            result = seat == root
+        else:
+            result = self._search(table, root)
+        table.undo_move(record)
+        return result
+
+    def _search(self, table: TableClassic, root: int) -> bool:
+        self.nodes += 1
+        key = (table.state_hash, root, table.turn == 1)
+        result = self._cache.get(key)
+        if result is not None:
+            return result
+        if self.tablebase is not None:
+            # only holds 2-player positions, where the other seat wins
+            # whenever the seat to move cannot
+            known = self.tablebase.probe(table)
+            if known is not None:
+                return known.win == (table.get_player_index() == root)
+        if table.get_player_index() == root:
+            result = any(self._wins_after(table, move, root)
+                         for move in self._moves(table))
+        else:
+            result = all(self._wins_after(table, move, root)
+                         for move in self._moves(table))
+        self._cache[key] = result
+        return result
+
+def solve(table: TableClassic) -> SolveResult:
+    """Solve the position of a table with a fresh solver."""
+    return EndgameSolver().solve(table)
@@ -0,0 +1,343 @@
+# -*- coding: UTF-8 -*-
+"""Fixed-length feature vectors of game states, for bots and analysis.
+
+A state is encoded from the view of one seat (by default the seat to
+move) into FEATURE_SIZE float32 values, without any hidden card: a table
+at a client side, where other hands are -1, gives the same vector as the
+full table at the server side.
+
+Columns
+----------
+0 ~ 30      own cards, card N at column N-1
+31 ~ 61     cards on the table
+62 ~ 92     cards of the previous hand
+93 ~ 105    rank of the previous hand, one-hot by `hand_ranking` - 1
+106, 107    (value + 1) / 31 and (suit + 1) / 31 of the previous hand
+108, 109    card counts / 12 of the next seat and the one after (0 if none)
+110 ~ 112   rule9, rule19, rule29
+113 ~ 115   seat that played last: self, next seat, the one after
+116 ~ 118   for_erase, first turn, 3-player game
+119 ~ 128   share of each representative digit 0~9 that is on the table
+
+The batched encoders work on NumPy arrays, `encode` of one table uses the
+same code on a batch of one.
+
+Functions
+----------
+encode -- Encode the state of a table from the view of a seat.
+encode_batch -- Encode many tables at once.
+encode_env -- Encode every game of a `BatchEnv` for its seat to move.
+replay -- Replay a game from its deal and moves, yield each state.
+encode_game -- Encode every state of a game with the move played in it.
+iter_selfplay -- Play games and yield the encoded states of each one.
+write_replays -- Write games to a replay log.
+read_replays -- Read the games of a replay log.
+
+Usage
+----------
+python features.py -n 200 --strategies greedy random
+python features.py --replays games.jsonl
+"""
+
+from typing import Iterable, Iterator, Optional
+import argparse
+import json
+import time
+import numpy as np
+from utilities import (TableClassic, Player, Hand, ALL_HANDS, NONE_HAND,
+                       hand_ranking, hand_id, rarify, rare_twins)
+from batch_env import BatchEnv, action_to_move, move_to_action, popcount
+from simulate import STRATEGIES, GameResult, game_rng, play_game
+
+__all__ = [
+    'FEATURE_SIZE',
+    'encode',
+    'encode_batch',
+    'encode_env',
+    'replay',
+    'encode_game',
+    'iter_selfplay',
+    'write_replays',
+    'read_replays'
+]
+
+FEATURE_SIZE = 129
+
+_cards = np.arange(1, 32, dtype=np.uint32)
+# Previous hand attributes by hand id + 1, row 0 for nothing to beat,
+# then the hands of rule 'rare' after the last hand id.
+_previous = ((NONE_HAND,) + ALL_HANDS
+             + tuple(rare for _, rare in rare_twins()))
+_rare_ids = {id(rare): len(ALL_HANDS) + index
+             for index, (_, rare) in enumerate(rare_twins())}
+_previous_mask = np.array([hand.mask for hand in _previous], np.uint32)
+_previous_rank = np.array([hand_ranking[hand.rank] - 1
+                           for hand in _previous], np.intp)
+_previous_value = np.array([(hand.value + 1) / 31 for hand in _previous],
+                           np.float32)
+_previous_suit = np.array([(hand.suit + 1) / 31 for hand in _previous],
+                          np.float32)
+# _digits[N - 1, D]: number of representative digits D of card N,
+# divided by the number of them in the deck.
+_digits = np.zeros((31, 10), np.float32)
+for _card in range(1, 32):
+    if _card >= 10:
+        _digits[_card - 1, _card // 10] += 1
+    _digits[_card - 1, _card % 10] += 1
+_digits /= _digits.sum(axis=0)
+del _card
+
+def _encode(own: np.ndarray, played: np.ndarray, previous: np.ndarray,
+            counts: np.ndarray, rules: np.ndarray, leader: np.ndarray,
+            for_erase: np.ndarray, first: np.ndarray,
+            three: np.ndarray) -> np.ndarray:
+    """Encode a batch of states given as arrays, see module docstring.
+
+    own, played are uint32 card set bitmasks, previous hand ids (-1 for
+    nothing), counts (N, 2), rules 3 bits, leader the seat offset of the
+    seat that played last (-1 for none). Previous hands of rule 'rare'
+    take the ids after `ALL_HANDS`.
+    """
+    n = len(own)
+    features = np.zeros((n, FEATURE_SIZE), np.float32)
+    played_cards = played[:, None] >> _cards & 1
+    features[:, 0:31] = own[:, None] >> _cards & 1
+    features[:, 31:62] = played_cards
+    previous = previous + 1
+    features[:, 62:93] = _previous_mask[previous][:, None] >> _cards & 1
+    features[np.arange(n), 93 + _previous_rank[previous]] = 1
+    features[:, 106] = _previous_value[previous]
+    features[:, 107] = _previous_suit[previous]
+    features[:, 108:110] = counts / 12
+    features[:, 110:113] = rules[:, None] >> np.arange(3) & 1
+    has_leader = leader >= 0
+    features[np.nonzero(has_leader)[0], 113 + leader[has_leader]] = 1
+    features[:, 116] = for_erase
+    features[:, 117] = first
+    features[:, 118] = three
+    features[:, 119:129] = played_cards.astype(np.float32) @ _digits
+    return features
+
+def encode_batch(tables: list[TableClassic],
+                 seats: Optional[list[int]] = None) -> np.ndarray:
+    """Encode many tables at once, float32 (N, FEATURE_SIZE).
+
+    Argument
+    ----------
+    tables : list[TableClassic]
+        The tables, they can have different numbers of players.
+    seats : list[int], optional (default is the seat to move of each)
+        The seat of each table whose view is encoded.
+    """
+    if seats is None:
+        seats = [table.get_player_index() for table in tables]
+    return _encode_states([_state_of(table, seat)
+                           for table, seat in zip(tables, seats)])
+
+def encode(table: TableClassic, seat: Optional[int] = None) -> np.ndarray:
+    """Encode the state of a table from the view of a seat.
+
+    Returns float32 (FEATURE_SIZE,), seat is the seat to move by default.
+    Same as a row of `encode_batch`, with less overhead for one table.
+    """
+    if seat is None:
+        seat = table.get_player_index()
+    (own, played, previous, count1, count2, rules, leader, for_erase,
+     first, three) = _state_of(table, seat)
+    features = np.zeros(FEATURE_SIZE, np.float32)
+    played_cards = _unpack(played)
+    features[0:31] = _unpack(own)
+    features[31:62] = played_cards
+    previous += 1
+    features[62:93] = _unpack(int(_previous_mask[previous]))
+    features[93 + _previous_rank[previous]] = 1
+    features[106] = _previous_value[previous]
+    features[107] = _previous_suit[previous]
+    features[108] = count1 / 12
+    features[109] = count2 / 12
+    features[110:113] = (rules & 1, rules >> 1 & 1, rules >> 2)
+    if leader >= 0:
+        features[113 + leader] = 1
+    features[116:119] = (for_erase, first, three)
+    features[119:129] = played_cards @ _digits
+    return features
+
+def _unpack(mask: int) -> np.ndarray:
+    """float32 (31,), the cards 1~31 of a card set bitmask."""
+    return np.unpackbits(np.frombuffer(mask.to_bytes(4, 'little'), np.uint8),
+                         bitorder='little')[1:].astype(np.float32)
+
+def encode_env(env: BatchEnv) -> np.ndarray:
+    """Encode every game of a `BatchEnv` for its seat to move."""
+    rows = np.arange(env.num_games)
+    players = env.num_players
+    token = env.token.astype(np.intp)
+    counts = popcount(env.hands)
+    following = np.zeros((env.num_games, 2), np.float32)
+    leader = np.full(env.num_games, -1, np.intp)
+    for shift in range(players):
+        seat = (token + shift) % players
+        if shift:
+            following[:, shift - 1] = counts[rows, seat]
+        leader[env.lastplayed[rows, seat]] = shift
+    first = (env.turn == 1) & (env.table & 1 << 1 == 0)
+    return _encode(env.hands[rows, token], env.table,
+                   env.previous.astype(np.intp), following, env.rules,
+                   leader, env.for_erase, first,
+                   np.full(env.num_games, players == 3))
+
+def replay(deal: int, num_player: int, moves: Iterable[Optional[Hand]],
+           rare_rule: bool = False) -> Iterator[TableClassic]:
+    """Replay a game from its deal and moves, yield each state.
+
+    The same table is yielded before each move, and the move is played
+    when the next state is asked for, so copy the table to keep a state.
+    With rare_rule, a hand is played as rule 'rare' makes it, so the moves
+    of `action_to_move` replay the game.
+    """
+    table = TableClassic()
+    table.rare_rule = rare_rule
+    for seat in range(num_player):
+        table.join(Player(f'bot{seat}'))
+    table.start(deal=deal)
+    for move in moves:
+        yield table
+        if rare_rule and move is not None:
+            move = rarify(move, table.reprc_left)
+        table.apply_move(move)
+
+def encode_game(deal: int, num_player: int,
+                moves: list[Optional[Hand]], rare_rule: bool = False
+                ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Encode every state of a game with the move played in it, see
+    `replay` for rare_rule.
+
+    Returns
+    ----------
+    features : np.ndarray
+        float32 (moves, FEATURE_SIZE), the view of the seat to move.
+    actions : np.ndarray
+        The action of the move played, as `batch_env.move_to_action`.
+    seats : np.ndarray
+        The seat that played the move.
+    """
+    rows = []
+    seats = []
+    for table in replay(deal, num_player, moves, rare_rule):
+        seat = table.get_player_index()
+        rows.append(_state_of(table, seat))
+        seats.append(seat)
+    features = _encode_states(rows)
+    actions = np.array([move_to_action(move) for move in moves], np.intp)
+    return features, actions, np.array(seats, np.intp)
+
+def _state_of(table: TableClassic, seat: int) -> tuple:
+    """The arrays row of `_encode` of a table from the view of a seat."""
+    players = table.players
+    num_player = len(players)
+    counts = [players[(seat + shift) % num_player].card_count()
+              for shift in range(1, num_player)] + [0] * (3 - num_player)
+    leader = -1
+    for shift in range(num_player):
+        if players[(seat + shift) % num_player].lastplayed:
+            leader = shift
+    return (players[seat].card_mask, table.card_mask,
+            -1 if table.previous_hand is NONE_HAND
+            else _rare_ids.get(id(table.previous_hand))
+            or hand_id(table.previous_hand),
+            counts[0], counts[1],
+            table.rule9 | table.rule19 << 1 | table.rule29 << 2, leader,
+            table.for_erase, table.turn == 1 and not table.card_mask & 1 << 1,
+            num_player == 3)
+
+def _encode_states(rows: list[tuple]) -> np.ndarray:
+    """`_encode` of the rows of `_state_of`."""
+    if not rows:
+        return np.zeros((0, FEATURE_SIZE), np.float32)
+    columns = np.array(rows, np.int64).T
+    return _encode(columns[0].astype(np.uint32), columns[1].astype(np.uint32),
+                   columns[2], columns[3:5].T.astype(np.float32),
+                   columns[5].astype(np.uint8), columns[6],
+                   columns[7], columns[8], columns[9])
+
+def iter_selfplay(n_games: int, seed: int = 0,
+                  strategies: tuple[str, ...] = ('random', 'random'),
+                  rare_rule: bool = False
+                  ) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray,
+                                      GameResult]]:
+    """Play games and yield the encoded states of each one.
+
+    Games are those of `simulate.simulate` with the same arguments. Each
+    game yields `encode_game` of it and its `GameResult`.
+    """
+    players = [STRATEGIES[name] for name in strategies]
+    for index in range(n_games):
+        result = play_game(players, game_rng(seed, index),
+                           rare_rule=rare_rule)
+        yield (*encode_game(result.deal, len(players), result.log,
+                            rare_rule), result)
+
+def write_replays(path: str, games: Iterable[tuple[int, GameResult]]) -> int:
+    """Write games to a replay log, return the number of games.
+
+    Each game is given as (number of players, result), and written as one
+    JSON line of its number of players, deal, winner, rule 'rare' and
+    actions.
+    """
+    count = 0
+    with open(path, 'w') as file:
+        for num_player, result in games:
+            file.write(json.dumps({
+                'players': num_player, 'deal': result.deal,
+                'winner': result.winner, 'rare_rule': result.rare_rule,
+                'actions': [move_to_action(move) for move in result.log]
+            }) + '\n')
+            count += 1
+    return count
+
+def read_replays(path: str) -> Iterator[tuple[int, int, int,
+                                              list[Optional[Hand]], bool]]:
+    """Read the games of a replay log written by `write_replays`.
+
+    Yields (number of players, deal, winner, moves, rare_rule) of each
+    game, the arguments of `replay` and `encode_game`.
+    """
+    with open(path) as file:
+        for line in file:
+            game = json.loads(line)
+            yield (game['players'], game['deal'], game['winner'],
+                   [action_to_move(action) for action in game['actions']],
+                   game.get('rare_rule', False))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--games', type=int, default=200)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--strategies', nargs='+', default=['random', 'random'],
+                        choices=sorted(STRATEGIES), help='one per seat')
+    parser.add_argument('--rare', action='store_true',
+                        help="play with rule 'rare'")
+    parser.add_argument('--replays', help='encode the games of a replay log '
+                        'instead of playing')
+    args = parser.parse_args()
+
+    states = 0
+    start = time.perf_counter()
+    if args.replays:
+        for num_player, deal, winner, moves, rare_rule in read_replays(
+                args.replays):
+            states += len(encode_game(deal, num_player, moves,
+                                      rare_rule)[0])
+    else:
+        for features, actions, seats, result in iter_selfplay(
+                args.games, args.seed, args.strategies, args.rare):
+            states += len(features)
+    elapsed = time.perf_counter() - start
+    print(f'{states} states in {elapsed:.2f}s ({states / elapsed:,.0f}/s)')
+
+    env = BatchEnv(4096, len(args.strategies), check=False)
+    start = time.perf_counter()
+    for _ in range(20):
+        encode_env(env)
+    elapsed = time.perf_counter() - start
+    print(f'encode_env: {20 * 4096 / elapsed:,.0f} states/s')
@@ -1,5 +1,6 @@
-from typing import Optional
-from utilities import TableClassic, Player, Hand, evaluate_cards
+from typing import Iterator, Optional
+from utilities import (TableClassic, Player, Hand, cards_to_mask,
+                       evaluate_mask, enumerate_legal_moves)
 
 
 class PlayerUtilityInterface:
@@ -42,7 +43,35 @@ class PlayerUtility(PlayerUtilityInterface):
     """
     def __init__(self, player: Player, table: TableClassic) -> None:
         super().__init__(player, table)
-        self.for_erase = False
+    @property
+    def for_erase(self) -> bool:
+        """True when the player has to erase a card after an eraseable hand.
+
+        The state is kept by the table (`TableClassic.for_erase`), so it is
+        only True for the active player.
+        """
+        return (self.table.for_erase
+                and self.table.get_player() is self.player)
+    @for_erase.setter
+    def for_erase(self, value: bool) -> None:
+        self.table.for_erase = value
+    def legal_moves(self) -> Iterator[Optional[Hand]]:
+        """Yield every legal move of the player, None for passing.
+
+        See `utilities.enumerate_legal_moves`.
+        """
+        return enumerate_legal_moves(self.player, self.table, self.for_erase)
+    def play_move(self, move: Optional[Hand]) -> bool:
+        """Play a move as yielded by `legal_moves`.
+
+        It dispatches to `play_erase`, `pass_turn` or `play_hand`, with the
+        same checking as them.
+        """
+        if self.for_erase:
+            return self.play_erase(None if move is None else move.card[0])
+        if move is None:
+            return self.pass_turn()
+        return self.play_hand(move)
     def pass_turn(self) -> bool:
         """A player pass his turn.
         
@@ -58,17 +87,23 @@ class PlayerUtility(PlayerUtilityInterface):
         
         It checks whether the timing is right, 
         checks whether a player has those cards,
-        and checks if the hand is playable.
+        checks that the hand is the one those cards make on the table
+        (rule 'rare' included), and checks if the hand is playable.
         """
-        cards_tbp = hand.card
         if self.for_erase:
             return False
-        if any(card not in self.player.cards for card in cards_tbp):
+        if not self.player.has_cards(hand.mask):
             return False
-        if not self.table.is_playable_hand(hand):
+        made = evaluate_mask(
+            hand.mask, self.table.reprc_left if self.table.rare_rule else None
+        )
+        # hands are equal by strength, the same hand is the same object
+        if not any(hand is other for other in made):
+            return False
+        if not self.table.is_playable_hand(hand)[0]:
             return False
         self.table.play_hand(hand)
-        self.player.remove_cards(cards_tbp)
+        self.player.card_mask &= ~hand.mask
         if not hand.eraseable:
             self.table.turn_forward(played_hand=True)
         else:
@@ -77,7 +112,8 @@ class PlayerUtility(PlayerUtilityInterface):
     def play_erase(self, card: Optional[int]) -> bool:
         """A player erase a card.
         
-        For turn 1, it checks whether it is allowed to erase a card.
+        For turn 1, it checks whether it is allowed to erase a card,
+        and it checks whether a player has that card.
         """
         if not self.for_erase:
             return False
@@ -85,7 +121,8 @@ class PlayerUtility(PlayerUtilityInterface):
             return False
 
         if card is not None and card != -1:
-            self.player.remove_cards([card])
+            if not self.player.remove_cards([card]):
+                return False
             self.table.erase(card)
         self.table.turn_forward(played_hand=True)
         self.for_erase = False
@@ -109,6 +146,8 @@ class RemotePlayerUtility(PlayerUtilityInterface):
         self.table.play_hand(hand)
         if not hand.eraseable:
             self.table.turn_forward(played_hand=True)
+        else:
+            self.table.for_erase = True
         return True
     def play_erase(self, card: Optional[int]) -> bool:
         """A remote player play a erase card.
@@ -119,6 +158,7 @@ class RemotePlayerUtility(PlayerUtilityInterface):
             self.player.remove_cards([-1])
             self.table.erase(card)
         self.table.turn_forward(played_hand=True)
+        self.table.for_erase = False
         return True
     def pass_turn(self) -> bool:
         """A remote player pass his turn.
@@ -150,7 +190,10 @@ class LocalPlayerUtility(PlayerUtility, PlayerUtilityInterface):
         self.avalhands = []
         self.avalhands_info = []
         if not self.for_erase:
-            avalhands = evaluate_cards(self.player.selected_cards)
+            avalhands = evaluate_mask(
+                self.player.selected_mask,
+                self.table.reprc_left if self.table.rare_rule else None
+            )
             self.avalhands = avalhands
             for avalhand in avalhands:
                 playable, info = self.table.is_playable_hand(avalhand)
@@ -159,7 +202,7 @@ class LocalPlayerUtility(PlayerUtility, PlayerUtilityInterface):
                 else:
                     self.avalhands_info.append(info)
         else:
-            if len(self.player.selected_cards) != 1:
+            if self.player.selected_mask.bit_count() != 1:
                 return
             card_tbe = self.player.selected_cards[0]
             avalhands = [Hand((card_tbe,), rank='erase')]
@@ -175,8 +218,9 @@ class LocalPlayerUtility(PlayerUtility, PlayerUtilityInterface):
         It checks whether a player have the selected cards in hand,
         then update hands info.
         """
-        if any(card not in self.player.cards for card in cards):
+        mask = cards_to_mask(cards)
+        if not self.player.has_cards(mask):
             return False
-        self.player.selected_cards = cards
+        self.player.selected_mask = mask
         self.update_handsinfo()
         return True
\ No newline at end of file
@@ -0,0 +1,222 @@
+# -*- coding: UTF-8 -*-
+"""Information-set Monte Carlo tree search computer player.
+
+The bot only uses what its seat can see: its own cards, the cards on the
+table and the number of cards of each opponent, as in a `SyncGame` where
+other hands are -1. Every iteration deals the unseen cards to opponents at
+random (a determinization) and walks one shared tree of moves (single
+observer ISMCTS), so hidden information is averaged over instead of
+peeked at.
+
+The search runs on one private copy of the table per decision, every move
+is played with `TableClassic.apply_move` and taken back with `undo_move`.
+
+Classes
+----------
+ISMCTSBot -- Choose moves with ISMCTS under a wall-clock budget.
+BotPlayerUtility -- A player utility that plays its turns with a bot.
+
+Functions
+----------
+ismcts_strategy -- A `simulate` strategy using a 50 ms ISMCTS bot.
+"""
+
+from copy import deepcopy
+from math import log, sqrt
+from typing import Optional
+import random
+import time
+from utilities import (TableClassic, Player, Hand, enumerate_legal_moves,
+                       mask_to_cards)
+from game import PlayerUtility, PlayerUtilityInterface
+
+__all__ = [
+    'ISMCTSBot',
+    'BotPlayerUtility',
+    'ismcts_strategy'
+]
+
+_DECK_MASK = ((1 << 32) - 1) & ~1
+
+def _move_key(move: Optional[Hand]) -> Optional[tuple[int, int]]:
+    return None if move is None else (move.mask, move.key)
+
+def _finished(table: TableClassic, seat: int) -> bool:
+    """Whether the seat that just moved has played all of his cards."""
+    return table.players[seat].card_mask == 0
+
+class _Node:
+    __slots__ = ('seat', 'children', 'visits', 'wins', 'available')
+
+    def __init__(self, seat: int) -> None:
+        self.seat = seat    # the seat that played the move into this node
+        self.children: dict[Optional[tuple[int, int]], _Node] = {}
+        self.visits = 0
+        self.wins = 0.0
+        self.available = 0
+
+class ISMCTSBot:
+    """Choose moves with ISMCTS under a wall-clock budget.
+
+    Instance variables
+    ----------
+    budget : float
+        Seconds of search per move.
+    exploration : float
+        The exploration constant of the UCB selection.
+    last_iterations : int
+        The number of iterations of the last search.
+    last_rate : float
+        Iterations per second of the last search.
+    """
+    def __init__(self, budget: float = 0.05, exploration: float = 0.7,
+                 rng: Optional[random.Random] = None) -> None:
+        self.budget = budget
+        self.exploration = exploration
+        self.rng = rng or random.Random()
+        self.last_iterations = 0
+        self.last_rate = 0.0
+
+    def choose_move(self, seat: PlayerUtilityInterface) -> Optional[Hand]:
+        """Choose a move for a seat whose turn it is.
+
+        The seat's table is never modified.
+        """
+        moves = list(enumerate_legal_moves(seat.player, seat.table))
+        if len(moves) == 1:
+            self.last_iterations = 0
+            return moves[0]
+
+        table = deepcopy(seat.table)
+        me = seat.table.players.index(seat.player)
+        unseen, counts = self._unseen(table, me)
+        root = _Node(seat=-1)
+        iterations = 0
+        start = time.perf_counter()
+        deadline = start + self.budget
+        while True:
+            self._determinize(table, me, unseen, counts)
+            self._iterate(table, root)
+            iterations += 1
+            if time.perf_counter() >= deadline:
+                break
+        elapsed = time.perf_counter() - start
+        self.last_iterations = iterations
+        self.last_rate = iterations / elapsed
+
+        best = max(moves, key=lambda move:
+                   root.children[_move_key(move)].visits
+                   if _move_key(move) in root.children else -1)
+        return best
+
+    @staticmethod
+    def _unseen(table: TableClassic, me: int) -> tuple[int, list[int]]:
+        """The cards the seat cannot see, and each opponent's card count.
+
+        Hidden cards of the copy are cleared, opponents' hands are then set
+        by `_determinize`.
+        """
+        unseen = _DECK_MASK & ~table.card_mask & ~table.players[me].card_mask
+        counts = [player.card_count() for player in table.players]
+        for seat, player in enumerate(table.players):
+            if seat != me:
+                player.hidden_count = 0
+        return unseen, counts
+
+    def _determinize(self, table: TableClassic, me: int, unseen: int,
+                     counts: list[int]) -> None:
+        """Deal the unseen cards to opponents at random, keeping counts."""
+        cards = mask_to_cards(unseen)
+        self.rng.shuffle(cards)
+        position = 0
+        for seat, player in enumerate(table.players):
+            if seat == me:
+                continue
+            mask = 0
+            for card in cards[position:position + counts[seat]]:
+                mask |= 1 << card
+            position += counts[seat]
+            player.card_mask = mask
+
+    def _iterate(self, table: TableClassic, root: _Node) -> None:
+        """One selection, expansion, playout and backpropagation."""
+        rng = self.rng
+        records = []
+        path = [root]
+        node = root
+        winner = -1
+        # selection and expansion
+        while table.game_playing and winner == -1:
+            seat = table.get_player_index()
+            moves = list(enumerate_legal_moves(table.players[seat], table))
+            untried = []
+            for move in moves:
+                child = node.children.get(_move_key(move))
+                if child is None:
+                    untried.append(move)
+                else:
+                    child.available += 1
+            if untried:
+                move = rng.choice(untried)
+                child = _Node(seat)
+                child.available = 1
+                node.children[_move_key(move)] = child
+            else:
+                move, child = self._select(node, moves)
+            records.append(table.apply_move(move))
+            if _finished(table, seat):
+                winner = seat
+            node = child
+            path.append(node)
+            if untried:
+                break
+        # playout
+        while table.game_playing and winner == -1:
+            seat = table.get_player_index()
+            moves = list(enumerate_legal_moves(table.players[seat], table))
+            records.append(table.apply_move(rng.choice(moves)))
+            if _finished(table, seat):
+                winner = seat
+        # backpropagation
+        for node in path:
+            node.visits += 1
+            if node.seat == winner:
+                node.wins += 1
+        for record in reversed(records):
+            table.undo_move(record)
+
+    def _select(self, node: _Node, moves: list[Optional[Hand]]
+                ) -> tuple[Optional[Hand], _Node]:
+        """Pick the child with the best UCB among the available moves."""
+        best_move, best_child, best_score = None, None, -1.0
+        for move in moves:
+            child = node.children[_move_key(move)]
+            score = (child.wins / child.visits + self.exploration
+                     * sqrt(log(child.available) / child.visits))
+            if score > best_score:
+                best_move, best_child, best_score = move, child, score
+        return best_move, best_child
+
+class BotPlayerUtility(PlayerUtility):
+    """A player utility that plays its turns with a bot.
+
+    It has the same checking as `PlayerUtility`, and can take a seat on
+    either the server side or a client side.
+    """
+    def __init__(self, player: Player, table: TableClassic,
+                 bot: Optional[ISMCTSBot] = None) -> None:
+        super().__init__(player, table)
+        self.bot = bot or ISMCTSBot()
+    def play_turn(self) -> Optional[Hand]:
+        """Choose a move with the bot and play it, return the move."""
+        move = self.bot.choose_move(self)
+        if not self.play_move(move):
+            raise RuntimeError(f'bot chose an illegal move {move}')
+        return move
+
+_strategy_bot = ISMCTSBot()
+
+def ismcts_strategy(seat: PlayerUtility, rng: random.Random) -> Optional[Hand]:
+    """A `simulate` strategy using a 50 ms ISMCTS bot."""
+    _strategy_bot.rng = rng
+    return _strategy_bot.choose_move(seat)
@@ -13,7 +13,11 @@ class ConnectionLogger:
         handler.setFormatter(formatter)
         self.logger.addHandler(handler)
 
-    def log(self, type:Literal['recv','send', 'connect', 'disconnect'], target_socket: socket.socket|QTcpSocket, msg: str):
+    def log(self, type:Literal['recv','send', 'connect', 'disconnect'], target_socket: socket.socket|QTcpSocket|tuple, msg: str):
+        """Log a message of a connection, given by its socket or its peer
+        address (ip, port)"""
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
         match type:
             case 'recv':       status = '<<<'
             case 'send':       status = '>>>'
@@ -24,6 +28,8 @@ class ConnectionLogger:
         elif isinstance(target_socket, QTcpSocket):
             ip = target_socket.peerAddress().toString()
             port = target_socket.peerPort()
+        else:
+            ip, port = target_socket[:2]
         
         self.logger.info(f'{status} {ip:>16}:{port:<5}]{msg}')
         
\ No newline at end of file
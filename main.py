@@ -8,10 +8,11 @@ from PlayAgainDialog_ui import Ui_Dialog as Ui_PlayAgainDialog
 from canva import Canva
 from utilities import TableClassic, Hand
 from hand import HandSelector, CardTypeBlock
-from server import startServer
+from aserver import startAsyncServer
 import os
 import winsound
 from client import GameCoreClient
+from package import Package
 from typing import Optional
 
 """
@@ -165,10 +166,8 @@ class MainWindow(QMainWindow):
         self.core = GameCoreClient()
         self.core.network_handler.gameover.connect(self.gameover)
         self.core.network_handler.update_players.connect(self.dialog.updatePlayers)
-        self.core.network_handler.sync_game.connect(self.syncGame)
+        self.core.network_handler.game_update.connect(self.gameUpdate)
         self.core.network_handler.connection_lose.connect(self.connectionLose)
-        self.core.network_handler.others_play_hand.connect(self.othersPlayerHand)
-        self.core.network_handler.others_erase_hand.connect(self.othersEraseHand)
         self.core.network_handler.connection_error.connect(self.connect_failed)
 
         self.scene = Canva()
@@ -214,7 +213,7 @@ class MainWindow(QMainWindow):
     def makeConnection(self, type:str, ip:str, port: int, player_count: int):
         if type == 'server':
             try:
-                startServer("0.0.0.0", port, player_count)
+                startAsyncServer("0.0.0.0", port, player_count)
             except OSError as e:
                 print(e)
                 self.connect_failed.emit('無法啟動伺服器!')
@@ -223,37 +222,33 @@ class MainWindow(QMainWindow):
         self.core.network_handler.connect_to_server(ip, port, 
                                                     self.dialog.ui.name.text())
 
-    @Slot(Hand, int)
-    def othersPlayerHand(self, hand:Optional[Hand], id: int):
-        success = self.core.othersPlayHand(id, hand)
+    @Slot(object)
+    def gameUpdate(self, package: Package.Package):
+        # the table waits for the server to send it whole again
+        if not self.core.applyUpdate(package):
+            return
 
-        # TODO: success check
-        if not success:
-            print('not success')
-            pass
-        
+        match package:
+            case Package.PlayCard():  self.othersPlayerHand(package.hand)
+            case Package.PlayErase(): self.othersEraseHand(package.card)
+            case _:                   self.syncGame()
+
+    def othersPlayerHand(self, hand:Optional[Hand]):
         if hand is not None:
             for card in hand.card:
                 self.scene.playCard(card)
 
         self.updateGameStatus()
 
-    @Slot(int, int)
-    def othersEraseHand(self, card: int, id: int):
-        success = self.core.othersEraseHand(id, card)
-
-        # TODO: success check
-        if not success:
-            print('not success')
-            pass
-
-        self.scene.playCard(card)
+    def othersEraseHand(self, card: Optional[int]):
+        if card is not None:
+            self.scene.playCard(card)
 
         self.updateGameStatus()
 
-    @Slot(TableClassic, int)
-    def syncGame(self, table: TableClassic, id: int):
-        self.core.setup(table, id)
+    def syncGame(self):
+        """Show the table of the game again, from scratch"""
+        table = self.core.table
 
         player_utility = self.core.current_player
         player = player_utility.player
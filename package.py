@@ -2,24 +2,52 @@ import enum
 from utilities import *
 from dataclasses import dataclass
 
+def sync_hash(table: TableClassic) -> int:
+    """The hash of a table a change of the game carries, to detect a
+    desync: the low 32 bits of `TableClassic.public_hash`"""
+    return table.public_hash & 0xFFFFFFFF
+
 class Package:
     class Package:
         hash: int
 
+    # A change of the game the server sends carries seq, the number of
+    # changes of the game so far, and hash, the `sync_hash` of the table
+    # once changed. Both are 0 in a move a client sends.
+
     @dataclass(init=True)
     class PlayCard(Package):
         id: int
         hand: Hand
+        seq: int = 0
+        hash: int = 0
 
     @dataclass(init=True)
     class PlayErase(Package):
         id: int
         card: int
+        seq: int = 0
+        hash: int = 0
 
     @dataclass(init=True)
     class SyncGame(Package):
         table: TableClassic
         id: int
+        seq: int = 0
+
+    @dataclass(init=True)
+    class GameStart(Package):
+        seq: int
+        id: int
+        cards: int # the card set bitmask dealt to the receiver
+        card_counts: list[int]
+        dealer: int
+        hash: int
+
+    @dataclass(init=True)
+    class MoveRejected(Package):
+        seq: int
+        hash: int
 
     @dataclass(init=True)
     class GameOver(Package):
@@ -40,4 +68,9 @@ class Package:
 
     @dataclass(init=True)
     class SyncReq(Package):
-        pass
\ No newline at end of file
+        pass
+
+    @dataclass(init=True)
+    class JoinRoom(Package):
+        room: str
+        player_count: int = 0 # the player count of a new room, 0 for the server's
@@ -0,0 +1,177 @@
+# -*- coding: UTF-8 -*-
+"""Linear policy computer player, NumPy only.
+
+A move is scored by a bilinear form of the state and the move:
+`score = move_features(move) @ weights @ [features.encode(state), 1]`, the
+bot plays the legal move of highest score. With under 7k weights a
+decision costs tens of microseconds, and the same weights score every
+game of a `BatchEnv` at once for training (see `train_policy`).
+
+Move features are fixed per action of `batch_env`: its cards, rank, number
+of cards, strength among the hands of its size, value, eraseable, and
+whether it is a pass or an erase.
+
+Classes
+----------
+LinearPolicy -- Score moves with a linear function of state and move.
+
+Functions
+----------
+move_features -- The features of every action.
+sample_actions -- Draw an action of every row from the softmax of logits.
+"""
+
+from typing import Optional
+import random
+import numpy as np
+from utilities import (Hand, ALL_HANDS, hand_ranking, rarify,
+                       enumerate_legal_moves)
+from batch_env import (BatchEnv, ERASE_ACTION, PASS_ACTION, NUM_ACTIONS,
+                       legal_actions, action_to_move, move_to_action)
+from features import FEATURE_SIZE, encode, encode_env
+from game import PlayerUtilityInterface
+
+__all__ = [
+    'MOVE_FEATURES',
+    'STATE_FEATURES',
+    'LinearPolicy',
+    'move_features',
+    'sample_actions'
+]
+
+MOVE_FEATURES = 53
+STATE_FEATURES = FEATURE_SIZE + 1
+_VERSION = 1
+
+def _build_move_features() -> np.ndarray:
+    """float32 (NUM_ACTIONS, MOVE_FEATURES), the features of each action.
+
+    Columns: cards (31), rank one-hot (13), 1/2/3 cards, erase, pass,
+    value / 31, eraseable, strength among the hands of its size,
+    constant 1.
+    """
+    moves = np.zeros((NUM_ACTIONS, MOVE_FEATURES), np.float32)
+    moves[:, 52] = 1
+    for action, hand in enumerate(ALL_HANDS):
+        moves[action, [card - 1 for card in hand.card]] = 1
+        moves[action, 30 + hand_ranking[hand.rank]] = 1
+        moves[action, 43 + len(hand)] = 1
+        moves[action, 49] = hand.value / 31
+        moves[action, 50] = hand.eraseable
+    for size in (1, 2, 3):
+        actions = [action for action, hand in enumerate(ALL_HANDS)
+                   if len(hand) == size]
+        moves[actions, 51] = np.arange(len(actions)) / len(actions)
+    for card in range(1, 32):
+        moves[ERASE_ACTION + card, card - 1] = 1
+    moves[ERASE_ACTION:PASS_ACTION, 47] = 1
+    moves[PASS_ACTION, 48] = 1
+    return moves
+
+_moves = _build_move_features()
+_moves.flags.writeable = False
+
+def move_features() -> np.ndarray:
+    """Return float32 (NUM_ACTIONS, MOVE_FEATURES), the features of each
+    action, see `_build_move_features`. The array is read-only."""
+    return _moves
+
+class LinearPolicy:
+    """Score moves with a linear function of state and move.
+
+    Instance variables
+    ----------
+    weights : np.ndarray
+        float32 (MOVE_FEATURES, STATE_FEATURES).
+    """
+    def __init__(self, weights: Optional[np.ndarray] = None) -> None:
+        if weights is None:
+            weights = np.zeros((MOVE_FEATURES, STATE_FEATURES), np.float32)
+        if weights.shape != (MOVE_FEATURES, STATE_FEATURES):
+            raise ValueError(f'weights should be of shape '
+                             f'{(MOVE_FEATURES, STATE_FEATURES)}')
+        self.weights = weights.astype(np.float32)
+
+    @classmethod
+    def load(cls, path: str) -> "LinearPolicy":
+        """Load a policy from a weight file written by `save`."""
+        with np.load(path) as file:
+            if int(file['version']) != _VERSION:
+                raise ValueError(f'{path} is not a policy of version '
+                                 f'{_VERSION}')
+            return cls(file['weights'])
+
+    def save(self, path: str) -> None:
+        """Write the weights to a .npz file."""
+        np.savez(path, version=_VERSION, weights=self.weights)
+
+    def logits(self, states: np.ndarray) -> np.ndarray:
+        """Score every action, float32 (N, NUM_ACTIONS).
+
+        Argument
+        ----------
+        states : np.ndarray
+            float32 (N, FEATURE_SIZE), from `features.encode_batch` or
+            `features.encode_env`.
+        """
+        return (states @ self.weights[:, :-1].T
+                + self.weights[:, -1]) @ _moves.T
+
+    def act(self, env: BatchEnv, rng: Optional[np.random.Generator] = None
+            ) -> np.ndarray:
+        """Choose the action of every game of a `BatchEnv`.
+
+        The best legal action, or one drawn from the softmax of the
+        scores when rng is given.
+        """
+        logits = self.logits(encode_env(env))
+        legal = env.legal_mask()
+        if rng is None:
+            logits[~legal] = -np.inf
+            return logits.argmax(axis=1)
+        return sample_actions(logits, legal, rng)[0]
+
+    def choose_move(self, seat: PlayerUtilityInterface) -> Optional[Hand]:
+        """Choose the best legal move for a seat whose turn it is.
+
+        Under rule 'rare' a rare hand is scored as the action of the same
+        hand without the rule, and played as the rule makes it.
+        """
+        table = seat.table
+        state = encode(table, table.players.index(seat.player))
+        scores = _moves @ (self.weights[:, :-1] @ state + self.weights[:, -1])
+        if table.rare_rule:
+            legal = np.zeros(NUM_ACTIONS, np.bool_)
+            legal[[move_to_action(move) for move in
+                   enumerate_legal_moves(table.get_player(), table)]] = True
+        else:
+            legal = legal_actions(table)
+        scores[~legal] = -np.inf
+        move = action_to_move(int(scores.argmax()))
+        if table.rare_rule and move is not None and move.rank != 'erase':
+            move = rarify(move, table.reprc_left)
+        return move
+
+    def strategy(self, seat: PlayerUtilityInterface,
+                 rng: random.Random) -> Optional[Hand]:
+        """`choose_move` as a `simulate` strategy."""
+        return self.choose_move(seat)
+
+def sample_actions(logits: np.ndarray, legal: np.ndarray,
+                   rng: np.random.Generator
+                   ) -> tuple[np.ndarray, np.ndarray]:
+    """Draw an action of every row from the softmax of legal logits.
+
+    Returns the actions and the probabilities (N, NUM_ACTIONS). A row
+    without legal action gets action 0.
+    """
+    logits = np.where(legal, logits, -np.inf)
+    top = logits.max(axis=1, keepdims=True)
+    top[~np.isfinite(top)] = 0
+    probabilities = np.exp(logits - top)
+    total = probabilities.sum(axis=1, keepdims=True)
+    probabilities /= np.where(total > 0, total, 1)
+    draw = rng.random((len(logits), 1)) * probabilities.sum(axis=1,
+                                                             keepdims=True)
+    actions = (probabilities.cumsum(axis=1) < draw).sum(axis=1)
+    return np.minimum(actions, NUM_ACTIONS - 1), probabilities
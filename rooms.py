@@ -0,0 +1,151 @@
+# -*- coding: UTF-8 -*-
+"""Many independent games in one server process.
+
+A `Room` is one `GameCoreServer` with the connections of its players, the
+state `server.PackageHandler` shares between the connections of a game.
+A `RoomManager` creates rooms by id on the first join, looks them up, and
+tears them down when their last player leaves, so a process hosts any
+number of 2- and 3-player tables. Packages of a connection only reach the
+room it is bound to: a broadcast costs the size of the room.
+
+A client picks its room with a `Package.JoinRoom` as first package. A
+client that starts with any other package joins `DEFAULT_ROOM`, so a
+server with rooms still plays with clients that know nothing of them.
+
+Classes
+----------
+Room -- One game of a server and the connections of its players.
+RoomManager -- Create, look up and tear down the rooms of a server.
+
+Usage
+----------
+manager = RoomManager(player_count=3)
+room, player_id = manager.join('table-42', connection)
+...
+room.leave(player_id)
+manager.release(room)
+"""
+
+from typing import Any, Iterator, Optional
+from server import GameCoreServer
+
+__all__ = [
+    'DEFAULT_ROOM',
+    'Room',
+    'RoomManager'
+]
+
+DEFAULT_ROOM = ''
+
+class Room:
+    """One game of a server and the connections of its players.
+
+    Instance variables
+    ----------
+    room_id : str
+        The id clients join the room with.
+    core : GameCoreServer
+        The game.
+    clients : list
+        clients[N] is the connection of player N of the game.
+    """
+    def __init__(self, room_id: str, player_count: int = 3,
+                 rare_rule: bool = False) -> None:
+        self.room_id = room_id
+        self.core = GameCoreServer()
+        self.core.max_player_count = player_count
+        self.core.table.rare_rule = rare_rule
+        self.clients: list = []
+
+    def __len__(self) -> int:
+        return len(self.clients)
+
+    def __repr__(self) -> str:
+        return (f'Room({self.room_id!r}, {len(self.clients)}/'
+                f'{self.core.max_player_count} players)')
+
+    def join(self, client: Any) -> int:
+        """Seat a connection, return its player id, -1 if join failed."""
+        if self.core.isPlayerFull():
+            return -1
+        player_id = self.core.join()
+        if player_id != -1:
+            self.clients.append(client)
+        return player_id
+
+    def leave(self, player_id: int) -> None:
+        """Take a player and its connection out of the game."""
+        self.core.leave(player_id)
+        del self.clients[player_id]
+
+class RoomManager:
+    """Create, look up and tear down the rooms of a server.
+
+    Instance variables
+    ----------
+    player_count : int
+        The number of players of a room created without one.
+    rare_rule : bool
+        Whether the rooms play with rule 'rare'.
+    rooms : dict[str, Room]
+        The open rooms by id.
+    """
+    def __init__(self, player_count: int = 3, rare_rule: bool = False) -> None:
+        self.player_count = player_count
+        self.rare_rule = rare_rule
+        self.rooms: dict[str, Room] = {}
+
+    def __len__(self) -> int:
+        return len(self.rooms)
+
+    def __iter__(self) -> Iterator[Room]:
+        return iter(list(self.rooms.values()))
+
+    def get(self, room_id: str) -> Optional[Room]:
+        """Return the room of an id, None if it is not open."""
+        return self.rooms.get(room_id)
+
+    def create(self, room_id: str, player_count: int = 0) -> Room:
+        """Open a room, of `self.player_count` players when it is 0.
+
+        Raises ValueError when the room is already open or the number of
+        players is not 2 or 3.
+        """
+        if room_id in self.rooms:
+            raise ValueError(f'room {room_id!r} is already open')
+        player_count = player_count or self.player_count
+        if player_count not in (2, 3):
+            raise ValueError('a room is for 2 or 3 players')
+        room = Room(room_id, player_count, self.rare_rule)
+        self.rooms[room_id] = room
+        return room
+
+    def join(self, room_id: str, client: Any,
+             player_count: int = 0) -> tuple[Optional[Room], int]:
+        """Seat a connection in a room, opening the room if needed.
+
+        player_count is the number of players of a room opened by this
+        join, 0 for `self.player_count`; it is ignored for an open room.
+
+        Returns
+        ----------
+        room : Room | None
+            The room, None when it cannot be opened.
+        player_id : int
+            The player id of the connection in the room, -1 if join failed.
+        """
+        room = self.rooms.get(room_id)
+        if room is None:
+            try:
+                room = self.create(room_id, player_count)
+            except ValueError:
+                return None, -1
+        player_id = room.join(client)
+        if player_id == -1:
+            self.release(room)
+        return room, player_id
+
+    def release(self, room: Room) -> None:
+        """Tear down a room once its last player has left."""
+        if not room.clients and self.rooms.get(room.room_id) is room:
+            del self.rooms[room.room_id]
@@ -0,0 +1,110 @@
+# -*- coding: UTF-8 -*-
+"""Self-play spread over a pool of processes.
+
+Games are split into chunks of consecutive game indices. Every game draws
+from its own generator `simulate.game_rng(seed, index)`, so a batch gives
+the same results whatever the number of workers and the chunk size, and
+any game can be played again on its own. Each worker sends back one
+`SimulationSummary` per chunk, which is merged as soon as it arrives, so
+no game is kept in memory.
+
+Functions
+----------
+iter_summaries -- Play games in a pool, yield the summary of each chunk.
+simulate_parallel -- Play games in a pool and merge their summaries.
+
+Usage
+----------
+python selfplay_pool.py -n 20000 --workers 4 --strategies greedy random
+python selfplay_pool.py -n 20000 --scaling    # 1, 2, ... cpu_count workers
+python selfplay_pool.py -n 20000 --rare       # with rule 'rare'
+"""
+
+from multiprocessing import Pool
+from typing import Iterator, Optional
+import argparse
+import os
+import time
+from simulate import STRATEGIES, SimulationSummary, game_rng, play_game
+
+__all__ = [
+    'iter_summaries',
+    'simulate_parallel'
+]
+
+def _play_chunk(task: tuple[int, int, int, tuple[str, ...], bool]
+                ) -> SimulationSummary:
+    """Play the games [start, stop) of a seeded batch in a worker."""
+    seed, start, stop, names, rare_rule = task
+    strategies = [STRATEGIES[name] for name in names]
+    summary = SimulationSummary(wins=[0] * len(strategies))
+    begin = time.perf_counter()
+    for index in range(start, stop):
+        summary.add(play_game(strategies, game_rng(seed, index),
+                              rare_rule=rare_rule))
+    summary.elapsed = time.perf_counter() - begin
+    return summary
+
+def iter_summaries(n_games: int, seed: int = 0,
+                   strategies: tuple[str, ...] = ('random', 'random'),
+                   workers: Optional[int] = None,
+                   chunk_size: int = 250,
+                   rare_rule: bool = False) -> Iterator[SimulationSummary]:
+    """Play games in a pool of processes, yield the summary of each chunk.
+
+    Summaries are yielded in completion order. Strategies are given by
+    their names in `simulate.STRATEGIES`, so that workers can find them.
+    rare_rule plays with rule 'rare'.
+    """
+    strategies = tuple(strategies)
+    tasks = [(seed, start, min(start + chunk_size, n_games), strategies,
+              rare_rule) for start in range(0, n_games, chunk_size)]
+    with Pool(processes=workers) as pool:
+        yield from pool.imap_unordered(_play_chunk, tasks)
+
+def simulate_parallel(n_games: int, seed: int = 0,
+                      strategies: tuple[str, ...] = ('random', 'random'),
+                      workers: Optional[int] = None,
+                      chunk_size: int = 250,
+                      rare_rule: bool = False) -> SimulationSummary:
+    """Play games in a pool of processes and merge their summaries.
+
+    The result equals `simulate.simulate` with the same arguments, except
+    that `elapsed` is the wall-clock time of the whole pool.
+    """
+    summary = SimulationSummary(wins=[0] * len(strategies))
+    start = time.perf_counter()
+    for chunk in iter_summaries(n_games, seed, strategies, workers,
+                                chunk_size, rare_rule):
+        summary.merge(chunk)
+    summary.elapsed = time.perf_counter() - start
+    return summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--games', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--strategies', nargs='+', default=['random', 'random'],
+                        choices=sorted(STRATEGIES), help='one per seat')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=250)
+    parser.add_argument('--rare', action='store_true',
+                        help="play with rule 'rare'")
+    parser.add_argument('--scaling', action='store_true',
+                        help='benchmark 1, 2, ... up to --workers workers')
+    args = parser.parse_args()
+
+    if not args.scaling:
+        print(simulate_parallel(args.games, args.seed, args.strategies,
+                                args.workers, args.chunk_size,
+                                args.rare).report())
+    else:
+        base = None
+        for workers in range(1, args.workers + 1):
+            summary = simulate_parallel(args.games, args.seed,
+                                        args.strategies, workers,
+                                        args.chunk_size, args.rare)
+            rate = summary.games / summary.elapsed
+            base = base or rate
+            print(f'{workers:>3} workers: {rate:>10,.1f} games/s '
+                  f'(x{rate / base:.2f})')
@@ -1,7 +1,7 @@
 import socketserver
 import socket
-from package import Package
-import pickle
+from package import Package, sync_hash
+from codec import encode, decode
 from utilities import *
 import threading
 import struct
@@ -19,10 +19,17 @@ class GameCoreServer:
         
         self.max_player_count = 3
         self.allow_start: list[bool] = []
+        # the number of changes of the table, and whether each player has
+        # a table to apply them to, see `PackageHandler`
+        self.seq = 0
+        self.synced: list[bool] = []
 
     def start(self):
         self.winner = None
-        return self.table.start()
+        success = self.table.start()
+        if success:
+            self.seq += 1
+        return success
 
     def getPlayersName(self) -> list[str]:
         """Return all exists players' name"""
@@ -64,6 +71,8 @@ class GameCoreServer:
         if accept:
             self.allow_start.append(True)
             self.players.append(PlayerUtility(player, self.table))
+            # the tables of the players miss the new one
+            self.synced = [False] * len(self.table.players)
             return len(self.table.players) - 1
         return -1
 
@@ -72,6 +81,7 @@ class GameCoreServer:
         del self.table.players[player_index]
         del self.allow_start[player_index]
         del self.players[player_index]
+        self.synced = [False] * len(self.table.players)
 
     @staticmethod
     def _yourTurn(player:PlayerUtility):
@@ -82,42 +92,61 @@ class GameCoreServer:
         if not self._yourTurn(current_player):
             return False
         
-        return current_player.play_hand(hand)
+        return self._changed(current_player.play_hand(hand))
         
     def playErase(self, player_index: int, card: int) -> bool:
         current_player = self.players[player_index]
         if not self._yourTurn(current_player):
             return False
         
-        return current_player.play_erase(card)
+        return self._changed(current_player.play_erase(card))
     
     def passTurn(self, player_index:int):
         current_player = self.players[player_index]
         if not self._yourTurn(current_player):
             return False
-        return current_player.pass_turn() 
+        return self._changed(current_player.pass_turn())
+
+    def _changed(self, success: bool) -> bool:
+        if success:
+            self.seq += 1
+        return success
     
     def allPlayerReady(self):
         """Return if all players are ready to play the games"""
         return all(self.allow_start)
 
 
-class ServerHandler(socketserver.BaseRequestHandler):
-    clients:list[socket.socket] = []
-    core = GameCoreServer()
+def encodePackage(package: Package.Package) -> bytes:
+    """Return the bytes of a package on the wire: a 4-byte length header
+    in network byte order, then the package encoded by `codec`"""
+    package_byte = encode(package)
+    return struct.pack("!I", len(package_byte)) + package_byte
+
+class PackageHandler:
+    """The `Package` protocol of one connection to a game, apart from the
+    transport: subclasses send packages and close their connection.
+
+    `clients[N]` is the connection of player N of `core`, shared by all
+    the connections to the same game.
+
+    A player gets the whole table (`Package.SyncGame`) once, when a game
+    starts after players joined or left, and on a `Package.SyncReq`. Then
+    it only gets the changes of the game: a new deal (`Package.GameStart`),
+    the moves of the others, and a `Package.MoveRejected` that takes back
+    its own move. Each change carries its sequence number and the hash of
+    the table, a client that misses one or ends up with another table
+    asks for the whole table again.
+    """
+    clients: list
+    core: GameCoreServer
     logger = ConnectionLogger('server')
-    init = False
 
-    def setPlayerCount(self, count: int):
-        self.core.max_player_count = count
+    def sendPackage(self, client, package: Package.Package):
+        raise NotImplementedError
 
-    def sendPackage(self, client:socket.socket, package: Package.Package):
-        #print(f'send package: {package}')
-        self.logger.log('send', client, str(package))
-        package_byte = pickle.dumps(package)
-        message_length = len(package_byte)
-        header = struct.pack("!I", message_length)  # "!I" indicates network byte order for an unsigned int
-        client.sendall(header + package_byte)
+    def closeConnection(self, player_id:int, reason:str):
+        raise NotImplementedError
 
     def broadcastPackage(self, package: Package.Package):
         for client in self.clients:
@@ -142,8 +171,11 @@ class ServerHandler(socketserver.BaseRequestHandler):
         table = deepcopy(self.core.table)
         for i in range(len(table.players)):
             if i != id:
-                table.players[i].cards = [-1] * len(table.players[i].cards)
-        package = Package.SyncGame(table,id)
+                table.players[i].cards = [-1] * table.players[i].card_count()
+        # the deal gives away every hand
+        table.deal = -1
+        package = Package.SyncGame(table, id, self.core.seq)
+        self.core.synced[id] = True
         self.sendPackage(self.clients[id], package)
 
     def startGame(self):
@@ -152,7 +184,20 @@ class ServerHandler(socketserver.BaseRequestHandler):
         if not success:
             return success
         
-        self.syncGame()
+        table = self.core.table
+        card_counts = [player.card_count() for player in table.players]
+        for id, client in enumerate(self.clients):
+            if not self.core.synced[id]:
+                self.syncGameTo(id)
+                continue
+            self.sendPackage(client, Package.GameStart(
+                self.core.seq, id, table.players[id].card_mask, card_counts,
+                table.get_player_index(), sync_hash(table)))
+
+    def rejectMove(self, player_id: int):
+        """Take back the move a player has played on its own table"""
+        self.sendPackage(self.clients[player_id], Package.MoveRejected(
+            self.core.seq, sync_hash(self.core.table)))
 
     def gameover(self, winner_id: int):
         winner = self.core.getPlayerById(winner_id)
@@ -168,34 +213,29 @@ class ServerHandler(socketserver.BaseRequestHandler):
             success = self.core.playHand(player_id, hand)
             
         if not success:
-            self.syncGameTo(player_id)
+            self.rejectMove(player_id)
             return
 
         # update table for all player
-        self.broadcastPackageExcept(Package.PlayCard(player_id, hand), player_id)
+        self.broadcastPackageExcept(Package.PlayCard(
+            player_id, hand, self.core.seq, sync_hash(self.core.table)),
+            player_id)
 
     def playErase(self, player_id: int, card: int):
         success = self.core.playErase(player_id, card)
             
         if not success:
-            self.syncGameTo(player_id)
+            self.rejectMove(player_id)
             return
 
         # update table for all player
-        self.broadcastPackageExcept(Package.PlayErase(player_id, card), player_id)
+        self.broadcastPackageExcept(Package.PlayErase(
+            player_id, card, self.core.seq, sync_hash(self.core.table)),
+            player_id)
 
     def updatePlayer(self):
         self.broadcastPackage(Package.GetPlayer(self.core.getPlayersName(), self.core.max_player_count))
 
-    def closeConnection(self, player_id:int, reason:str):
-        self.logger.log('disconnect', self.request, reason)
-        self.core.leave(player_id)
-        del self.clients[player_id]
-        
-        self.updatePlayer()
-        self.request.shutdown(socket.SHUT_RDWR)
-        self.request.close()
-
     def initPlayerName(self, player_id:int, name:str):
         success = self.core.setName(player_id, name)
         if not success:
@@ -215,22 +255,65 @@ class ServerHandler(socketserver.BaseRequestHandler):
         else:
             self.closeConnection(player_id, 'leave game')
 
+    def handlePackage(self, player_id: int, package: Package.Package):
+        """Act on a package received from a player"""
+        match package:
+            case Package.PlayCard(): self.playHand(player_id, package.hand)
+            case Package.SendName(): self.initPlayerName(player_id, package.name)
+            case Package.AgainChk(): self.againCheck(player_id, package.agree)
+            case Package.PlayErase():self.playErase(player_id, package.card)
+            case Package.SyncReq():  self.syncGameTo(player_id)
+            case _:
+                # a package only the server sends, or a second JoinRoom
+                self.closeConnection(player_id,
+                                     f'unexpected {type(package).__name__}')
+
+
+class ServerHandler(PackageHandler, socketserver.BaseRequestHandler):
+    clients:list[socket.socket] = []
+    core = GameCoreServer()
+    # one thread a client: the changes of the game are made one at a time,
+    # in the order of their `GameCoreServer.seq`
+    lock = threading.RLock()
+    init = False
+
+    def setPlayerCount(self, count: int):
+        self.core.max_player_count = count
+
+    def sendPackage(self, client:socket.socket, package: Package.Package):
+        #print(f'send package: {package}')
+        self.logger.log('send', client, str(package))
+        client.sendall(encodePackage(package))
+
+    def closeConnection(self, player_id:int, reason:str):
+        self.logger.log('disconnect', self.request, reason)
+        with self.lock:
+            # the seat may have moved since player_id was read
+            player_id = self.clients.index(self.request)
+            self.core.leave(player_id)
+            del self.clients[player_id]
             
+            self.updatePlayer()
+        self.request.shutdown(socket.SHUT_RDWR)
+        self.request.close()
+
     def handle(self):
         # Only run at first time
         if not self.init:
             self.init = True
             self.setPlayerCount(self.server.player_count)
+            self.core.table.rare_rule = self.server.rare_rule
 
         self.logger.log('connect', self.request, '')
-        player_id = self.core.join()
-        if player_id == -1:
-            self.logger.log('disconnect', self.request, 'join not accept')
-            return
+        with self.lock:
+            player_id = self.core.join()
+            if player_id == -1:
+                self.logger.log('disconnect', self.request, 'join not accept')
+                return
+            self.clients.append(self.request)
         
         self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         
-        self.clients.append(self.request)
         while self.request.fileno() != -1:
             # self.request is the TCP socket connected to the client
             try:
@@ -244,21 +327,22 @@ class ServerHandler(socketserver.BaseRequestHandler):
             except (ConnectionResetError, OSError):
                 self.closeConnection(player_id, 'player disconnect')
                 break
-            player_id = self.clients.index(self.request)
+            with self.lock:
+                player_id = self.clients.index(self.request)
 
-            package = pickle.loads(self.data)
-            self.logger.log('recv', self.request, str(package))
+                try:
+                    package = decode(self.data)
+                except ValueError:
+                    self.closeConnection(player_id, 'malformed package')
+                    break
+                self.logger.log('recv', self.request, str(package))
 
-            match package:
-                case Package.PlayCard(): self.playHand(player_id, package.hand)
-                case Package.SendName(): self.initPlayerName(player_id, package.name)
-                case Package.AgainChk(): self.againCheck(player_id, package.agree)
-                case Package.PlayErase():self.playErase(player_id, package.card)
-                case _:                  raise NotImplementedError
+                self.handlePackage(player_id, package)
 
-def startServer(host:str, port:int, player_count:int):
+def startServer(host:str, port:int, player_count:int, rare_rule:bool = False):
     server = socketserver.ThreadingTCPServer((host, port), ServerHandler)
     server.player_count = player_count
+    server.rare_rule = rare_rule
     print(f'serve on {host}:{port}')
 
     server_thread = threading.Thread(target=server.serve_forever)
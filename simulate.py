@@ -0,0 +1,255 @@
+# -*- coding: UTF-8 -*-
+"""Headless self-play of the classic game, no Qt and no sockets.
+
+Bots play complete games through `PlayerUtility`, the same checked
+`play_hand` / `play_erase` / `pass_turn` API the server uses, so this is
+both a balance tool and the reference benchmark of the rules engine.
+
+Functions
+----------
+play_game -- Play one complete game between strategies.
+game_rng -- The random generator of a game of a seeded simulation.
+simulate -- Play many games and summarize them.
+random_strategy -- Play a uniformly random legal move.
+greedy_strategy -- Play the weakest legal hand, never pass when able to play.
+
+Classes
+----------
+GameResult -- The result of one game.
+SimulationSummary -- Aggregated results of many games.
+
+Usage
+----------
+python simulate.py -n 1000 --seed 0 --strategies random greedy greedy
+"""
+
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+import argparse
+import random
+import time
+from utilities import TableClassic, Player, Hand
+from game import PlayerUtility
+
+__all__ = [
+    'Strategy',
+    'STRATEGIES',
+    'GameResult',
+    'SimulationSummary',
+    'random_strategy',
+    'greedy_strategy',
+    'game_rng',
+    'play_game',
+    'simulate'
+]
+
+# A strategy picks a move of `seat.legal_moves()` for the seat to move.
+Strategy = Callable[[PlayerUtility, random.Random], Optional[Hand]]
+
+def random_strategy(seat: PlayerUtility, rng: random.Random) -> Optional[Hand]:
+    """Play a uniformly random legal move."""
+    return rng.choice(list(seat.legal_moves()))
+
+def greedy_strategy(seat: PlayerUtility, rng: random.Random) -> Optional[Hand]:
+    """Play the weakest legal hand, never pass when able to play.
+
+    Among hands of equal strength the one with most cards is played, and
+    an erase always erases the largest card.
+    """
+    moves = [move for move in seat.legal_moves() if move is not None]
+    if not moves:
+        return None
+    if seat.for_erase:
+        return moves[-1]
+    return min(moves, key=lambda move: (move.key, -len(move)))
+
+def _ismcts_strategy(seat: PlayerUtility, rng: random.Random
+                     ) -> Optional[Hand]:
+    """`ismcts.ismcts_strategy`, the search bot is only loaded once a
+    game uses it."""
+    from ismcts import ismcts_strategy
+    return ismcts_strategy(seat, rng)
+
+STRATEGIES: dict[str, Strategy] = {
+    'random': random_strategy,
+    'greedy': greedy_strategy,
+    'ismcts': _ismcts_strategy,
+}
+
+@dataclass(init=True)
+class GameResult():
+    """The result of one game.
+
+    Instance variables
+    ----------
+    winner : int
+        The seat that played all of his cards first.
+    turns : int
+        The number of turns of the game.
+    moves : int
+        The number of moves, including passes and erases.
+    hand_counts : Counter
+        The number of played hands of each rank.
+    deal : int
+        The deal of the game, see `TableClassic.deal`.
+    log : list[Hand | None]
+        Every move of the game in order, as in `enumerate_legal_moves`, so
+        the game can be replayed from its deal.
+    rare_rule : bool
+        Whether the game is played with rule 'rare'.
+    """
+    winner: int
+    turns: int
+    moves: int
+    hand_counts: Counter = field(default_factory=Counter)
+    deal: int = -1
+    log: list[Optional[Hand]] = field(default_factory=list)
+    rare_rule: bool = False
+
+@dataclass(init=True)
+class SimulationSummary():
+    """Aggregated results of many games.
+
+    Instance variables
+    ----------
+    games : int
+        The number of games.
+    wins : list[int]
+        wins[N] is the number of games won by seat N.
+    turns : int
+        The total number of turns.
+    moves : int
+        The total number of moves.
+    hand_counts : Counter
+        The total number of played hands of each rank.
+    elapsed : float
+        Wall-clock seconds spent playing the games.
+    """
+    games: int = 0
+    wins: list[int] = field(default_factory=list)
+    turns: int = 0
+    moves: int = 0
+    hand_counts: Counter = field(default_factory=Counter)
+    elapsed: float = 0.0
+
+    def add(self, result: GameResult) -> None:
+        """Add the result of one game."""
+        while len(self.wins) <= result.winner:
+            self.wins.append(0)
+        self.games += 1
+        self.wins[result.winner] += 1
+        self.turns += result.turns
+        self.moves += result.moves
+        self.hand_counts.update(result.hand_counts)
+
+    def merge(self, other: "SimulationSummary") -> None:
+        """Add the results of another summary."""
+        while len(self.wins) < len(other.wins):
+            self.wins.append(0)
+        for seat, wins in enumerate(other.wins):
+            self.wins[seat] += wins
+        self.games += other.games
+        self.turns += other.turns
+        self.moves += other.moves
+        self.hand_counts.update(other.hand_counts)
+        self.elapsed += other.elapsed
+
+    def report(self) -> str:
+        """Return a human readable report."""
+        games = max(self.games, 1)
+        lines = [
+            f'games         : {self.games}',
+            f'games/second  : {self.games / max(self.elapsed, 1e-9):,.1f}',
+            f'average turns : {self.turns / games:.2f}',
+            f'average moves : {self.moves / games:.2f}',
+        ]
+        for seat, wins in enumerate(self.wins):
+            lines.append(f'seat {seat} wins   : {wins / games:.2%}')
+        hands = max(sum(self.hand_counts.values()), 1)
+        for rank, count in self.hand_counts.most_common():
+            lines.append(f'{rank:<13} : {count / hands:.2%} of hands')
+        return '\n'.join(lines)
+
+def game_rng(seed: int, index: int) -> random.Random:
+    """The random generator of the index-th game of a seeded simulation.
+
+    It only depends on the seed and the index, so any game of a batch can
+    be played again on its own.
+    """
+    return random.Random(seed << 32 | index)
+
+def play_game(strategies: list[Strategy], rng: random.Random,
+              max_moves: int = 10000, rare_rule: bool = False) -> GameResult:
+    """Play one complete game between strategies, one strategy per seat.
+
+    The game is played until only one seat has cards left, the seat that
+    played all of his cards first is the winner. rare_rule plays with
+    rule 'rare' (see `TableClassic`).
+    """
+    table = TableClassic()
+    table.rare_rule = rare_rule
+    for seat in range(len(strategies)):
+        table.join(Player(f'bot{seat}'))
+    if not table.start(rng):
+        raise ValueError('a game needs 2 or 3 strategies')
+    seats = [PlayerUtility(player, table) for player in table.players]
+
+    result = GameResult(winner=-1, turns=0, moves=0, deal=table.deal,
+                        rare_rule=rare_rule)
+    while table.game_playing:
+        if result.moves == max_moves:
+            raise RuntimeError(f'game not finished after {max_moves} moves')
+        index = table.get_player_index()
+        seat = seats[index]
+        move = strategies[index](seat, rng)
+        for_erase = seat.for_erase
+        if not seat.play_move(move):
+            raise RuntimeError(f'seat {index} played an illegal move {move}')
+        result.moves += 1
+        result.log.append(move)
+        if move is not None and not for_erase:
+            result.hand_counts[move.rank] += 1
+        if result.winner == -1 and seat.player.card_count() == 0:
+            result.winner = index
+    result.turns = table.turn
+    return result
+
+def simulate(n_games: int, seed: int = 0,
+             strategies: list[Strategy | str] = ('random', 'random'),
+             rare_rule: bool = False) -> SimulationSummary:
+    """Play many games and summarize them.
+
+    Argument
+    ----------
+    n_games : int
+        The number of games to play.
+    seed : int, optional (default is 0)
+        Games of the same seed and strategies are the same.
+    strategies : list, optional (default is two random players)
+        One strategy, or its name in `STRATEGIES`, per seat.
+    rare_rule : bool, optional (default is False)
+        Play with rule 'rare'.
+    """
+    strategies = [STRATEGIES[strategy] if isinstance(strategy, str)
+                  else strategy for strategy in strategies]
+    summary = SimulationSummary(wins=[0] * len(strategies))
+    start = time.perf_counter()
+    for index in range(n_games):
+        summary.add(play_game(strategies, game_rng(seed, index),
+                              rare_rule=rare_rule))
+    summary.elapsed = time.perf_counter() - start
+    return summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--games', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--strategies', nargs='+', default=['random', 'random'],
+                        choices=sorted(STRATEGIES), help='one per seat')
+    parser.add_argument('--rare', action='store_true',
+                        help="play with rule 'rare'")
+    args = parser.parse_args()
+
+    print(simulate(args.games, args.seed, args.strategies,
+                   args.rare).report())
@@ -0,0 +1,204 @@
+# -*- coding: UTF-8 -*-
+"""Endgame tablebase of small 2-player positions.
+
+The tablebase stores, for every 2-player position where the seat to move
+leads a new round (nothing to beat and he played last) with at most N
+cards per player, whether the seat to move can force a win and a winning
+(or best effort) hand. Each round of an endgame starts in such a
+position, so `EndgameSolver(tablebase=...)` only searches until the next
+round before it finds the answer here.
+
+A position is keyed by the cards of the seat to move, the cards of the
+other seat (card 1 is always played after the first turn, so cards 2~31
+fit in 30 bits each) and rule9/19/29, in one 64-bit integer.
+
+File format (little endian)
+----------
+header : 8s magic, I version, I max cards, Q number of positions
+keys   : Q[number of positions], sorted
+values : H[number of positions], bit 15 for a win, bits 0~14 the hand id
+         of the best move in `utilities.ALL_HANDS`
+
+The file is `mmap`ed and searched in place, nothing is parsed at load.
+
+Classes
+----------
+Tablebase -- A memory-mapped tablebase file.
+
+Functions
+----------
+generate -- Solve every position of up to N cards per player in parallel.
+position_key -- The key of a lead position.
+
+Usage
+----------
+python tablebase.py endgame.tb --cards 2 --workers 4
+"""
+
+from bisect import bisect_left
+from itertools import combinations
+from multiprocessing import Pool
+from typing import Optional
+import argparse
+import mmap
+import os
+import struct
+import time
+from utilities import (TableClassic, Player, ALL_HANDS, NONE_HAND,
+                       hand_id, cards_to_mask, mask_to_cards)
+from endgame import EndgameSolver, SolveResult
+
+__all__ = [
+    'Tablebase',
+    'generate',
+    'position_key'
+]
+
+_MAGIC = b'CARD31TB'
+_VERSION = 1
+_HEADER = struct.Struct('<8sIIQ')
+_WIN = 1 << 15
+
+def position_key(mover: int, other: int, rule9: bool, rule19: bool,
+                 rule29: bool) -> int:
+    """The key of a lead position from the card set bitmasks of both seats."""
+    return (mover >> 2 | other >> 2 << 30
+            | (rule9 | rule19 << 1 | rule29 << 2) << 60)
+
+def _lead_table(mover: int, other: int, rules: int) -> TableClassic:
+    """A 2-player table where seat 0 leads, every other card is played."""
+    table = TableClassic()
+    for _ in range(2):
+        table.join(Player())
+    table.players[0].card_mask = mover
+    table.players[1].card_mask = other
+    for player in table.players:
+        player.in_game = True
+    table.players[0].lastplayed = True
+    table.players[0].his_turn = True
+    table.cards = mask_to_cards(((1 << 32) - 2) & ~mover & ~other)
+    table.card_mask = cards_to_mask(table.cards)
+    table.previous_hand = NONE_HAND
+    table.rule9 = bool(rules & 1)
+    table.rule19 = bool(rules & 2)
+    table.rule29 = bool(rules & 4)
+    table._token = 0
+    table.turn = 2
+    table.game_playing = True
+    table.rehash()
+    return table
+
+def _hands(max_cards: int) -> list[int]:
+    """Every card set bitmask of 1 to max_cards cards of 2~31."""
+    return [cards_to_mask(cards) for size in range(1, max_cards + 1)
+            for cards in combinations(range(2, 32), size)]
+
+def _solve_chunk(task: tuple[list[int], int]) -> list[tuple[int, int]]:
+    """Solve every position whose seat to move holds one of the hands."""
+    movers, max_cards = task
+    solver = EndgameSolver()
+    others = _hands(max_cards)
+    entries = []
+    for mover in movers:
+        for other in others:
+            if mover & other:
+                continue
+            for rules in range(8):
+                table = _lead_table(mover, other, rules)
+                result = solver.solve(table)
+                value = hand_id(result.move) | (_WIN if result.win else 0)
+                entries.append((position_key(mover, other, rules & 1,
+                                             rules >> 1 & 1, rules >> 2),
+                                value))
+    return entries
+
+def generate(path: str, max_cards: int = 2, workers: Optional[int] = None,
+             chunk_size: int = 16) -> int:
+    """Solve every position of up to max_cards per player and write a file.
+
+    Returns the number of positions.
+    """
+    movers = _hands(max_cards)
+    tasks = [(movers[i:i + chunk_size], max_cards)
+             for i in range(0, len(movers), chunk_size)]
+    entries: list[tuple[int, int]] = []
+    with Pool(processes=workers) as pool:
+        for chunk in pool.imap_unordered(_solve_chunk, tasks):
+            entries.extend(chunk)
+    entries.sort()
+    with open(path, 'wb') as file:
+        file.write(_HEADER.pack(_MAGIC, _VERSION, max_cards, len(entries)))
+        file.write(struct.pack(f'<{len(entries)}Q',
+                               *(key for key, _ in entries)))
+        file.write(struct.pack(f'<{len(entries)}H',
+                               *(value for _, value in entries)))
+    return len(entries)
+
+class Tablebase:
+    """A memory-mapped tablebase file.
+
+    Instance variables
+    ----------
+    max_cards : int
+        The most cards per player of the stored positions.
+    """
+    def __init__(self, path: str) -> None:
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.max_cards, count = _HEADER.unpack_from(
+            self._mmap)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f'{path} is not a tablebase of version {_VERSION}')
+        keys_end = _HEADER.size + 8 * count
+        memory = memoryview(self._mmap)
+        self._keys = memory[_HEADER.size:keys_end].cast('Q')
+        self._values = memory[keys_end:keys_end + 2 * count].cast('H')
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def close(self) -> None:
+        self._keys.release()
+        self._values.release()
+        self._mmap.close()
+
+    def probe(self, table: TableClassic) -> Optional[SolveResult]:
+        """Look up the position of a table for the seat to move.
+
+        Returns None when the position is not in the tablebase: not a
+        2-player lead position, too many cards, or rule 'rare'.
+        """
+        if (len(table.players) != 2 or table.for_erase or table.turn == 1
+                or table.rare_rule
+                or table.previous_hand.rank != 'None'
+                or not table.game_playing):
+            return None
+        seat = table.get_player_index()
+        mover = table.players[seat]
+        other = table.players[1 - seat]
+        if (not mover.lastplayed or mover.hidden_count or other.hidden_count
+                or not mover.in_game or not other.in_game
+                or (mover.card_mask | other.card_mask) & 1 << 1
+                or mover.card_mask.bit_count() > self.max_cards
+                or other.card_mask.bit_count() > self.max_cards):
+            return None
+        key = position_key(mover.card_mask, other.card_mask,
+                           table.rule9, table.rule19, table.rule29)
+        index = bisect_left(self._keys, key)
+        if index == len(self._keys) or self._keys[index] != key:
+            return None
+        value = self._values[index]
+        return SolveResult(bool(value & _WIN), ALL_HANDS[value & ~_WIN], 0)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path')
+    parser.add_argument('--cards', type=int, default=2,
+                        help='most cards per player')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = generate(args.path, args.cards, args.workers)
+    print(f'{count} positions in {time.perf_counter() - start:.1f}s '
+          f'-> {args.path} ({os.path.getsize(args.path):,} bytes)')
@@ -0,0 +1,7 @@
+# -*- coding: UTF-8 -*-
+"""The modules of the game sit at the top of the repository."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,31 @@
+# -*- coding: UTF-8 -*-
+from itertools import combinations
+import numpy as np
+import pytest
+from batch_eval import evaluate_cards_batch
+from utilities import hand_id, hand_ranking, _evaluate_cards
+
+def _deck_rows() -> np.ndarray:
+    """Every 1/2/3-card combination of the deck, padded with 0."""
+    return np.array([(0,) * (3 - size) + cards for size in (1, 2, 3)
+                     for cards in combinations(range(1, 32), size)], np.int8)
+
+@pytest.mark.parametrize('shuffle', [False, True])
+def test_batch_matches_reference_evaluator(shuffle):
+    rows = _deck_rows()
+    if shuffle:
+        rows = np.random.default_rng(0).permuted(rows, axis=1)
+    batch = evaluate_cards_batch(rows)
+    expected = []
+    for i, row in enumerate(rows.tolist()):
+        for hand in _evaluate_cards([card for card in row if card != 0]):
+            expected.append((i, hand_id(hand), hand_ranking[hand.rank],
+                             hand.value, hand.suit, hand.eraseable))
+    assert list(zip(batch.row.tolist(), batch.hand.tolist(),
+                    batch.rank.tolist(), batch.value.tolist(),
+                    batch.suit.tolist(), batch.eraseable.tolist())) == expected
+
+def test_rows_that_are_not_card_sets_make_no_hand():
+    rows = np.array([(0, 0, 0), (0, 5, 5), (0, 0, 32), (-1, 2, 3),
+                     (7, 7, 7)], np.int8)
+    assert len(evaluate_cards_batch(rows)) == 0
@@ -0,0 +1,13 @@
+# -*- coding: UTF-8 -*-
+from dominance import _check, hands_beating, count_beating
+from utilities import ALL_HANDS, NONE_HAND, rare_twins
+
+def test_hands_beating_matches_is_playable_hand():
+    assert _check() > 0
+
+def test_rare_previous_hand():
+    for hand, rare in rare_twins():
+        # a rare hand is stronger, fewer hands beat it
+        assert hands_beating(rare) & ~hands_beating(hand) == 0
+        assert count_beating(rare) <= count_beating(hand)
+    assert count_beating(NONE_HAND) == len(ALL_HANDS)
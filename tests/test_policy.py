@@ -0,0 +1,23 @@
+# -*- coding: UTF-8 -*-
+import numpy as np
+import pytest
+from policy import LinearPolicy, MOVE_FEATURES, STATE_FEATURES
+from simulate import game_rng, play_game
+from utilities import hand_id
+
+@pytest.mark.parametrize('num_players', [2, 3])
+@pytest.mark.parametrize('rare_rule', [False, True])
+def test_policy_plays_legal_moves(num_players, rare_rule):
+    weights = np.random.default_rng(num_players).standard_normal(
+        (MOVE_FEATURES, STATE_FEATURES))
+    policy = LinearPolicy(weights.astype(np.float32))
+    rare_hands = 0
+    for index in range(50):
+        # play_game raises RuntimeError on an illegal move
+        result = play_game([policy.strategy] * num_players,
+                           game_rng(0, index), rare_rule=rare_rule)
+        assert result.winner != -1
+        # the hands rule 'rare' makes are not in ALL_HANDS
+        rare_hands += sum(move is not None and move.rank != 'erase'
+                          and hand_id(move) == -1 for move in result.log)
+    assert (rare_hands > 0) == rare_rule
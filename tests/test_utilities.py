@@ -0,0 +1,6 @@
+# -*- coding: UTF-8 -*-
+from utilities import _check_lookup
+
+def test_lookup_matches_evaluate_cards():
+    # every 1/2/3-card combination in every order, and some bad inputs
+    assert _check_lookup() == 27939
@@ -0,0 +1,106 @@
+# -*- coding: UTF-8 -*-
+"""Incremental card counting of a table, from the view of one seat.
+
+A `CardTracker` listens to a `TableClassic` and keeps, in O(1) per card
+played, what its seat cannot see yet and the number of cards left to each
+seat. Anything that would otherwise rescan `table.cards` (hints, bots) can
+ask the tracker instead. The number of each representative digit not on
+the table yet is counted by the table itself (`TableClassic.reprc_left`),
+the tracker reads it from there.
+
+The tracker is kept up to date by the table events of `TableListener`:
+a new deal, a hand played, a card erased, and moves taken back with
+`TableClassic.undo_move`, so search on the tracked table keeps it right.
+Tables are sent and copied without their listeners, attach a tracker
+again to a table received in a `SyncGame`.
+
+Classes
+----------
+CardTracker -- Keep count of the unseen cards of a table for one seat.
+"""
+
+from typing import Optional
+from utilities import (TableClassic, TableListener, Hand, cards_to_mask,
+                       mask_to_cards)
+
+__all__ = [
+    'CardTracker'
+]
+
+_DECK_MASK = ((1 << 32) - 1) & ~1
+
+class CardTracker(TableListener):
+    """Keep count of the unseen cards of a table for one seat.
+
+    Instance variables
+    ----------
+    table : TableClassic | None
+        The tracked table.
+    seat : int | None
+        The seat whose view is tracked, None for a seat that holds no card
+        (e.g. a spectator): then only the table cards are seen.
+    unseen_mask : int
+        The cards the seat has not seen, as a card set bitmask: neither in
+        its hand nor on the table.
+    card_counts : list[int]
+        card_counts[N] is the number of cards seat N has left.
+    reprc_left : list[int]
+        reprc_left[D] is the number of representative digits D of the
+        cards not on the table yet, in any hand: `table.reprc_left`.
+    """
+    def __init__(self, table: Optional[TableClassic] = None,
+                 seat: Optional[int] = None) -> None:
+        self.table: Optional[TableClassic] = None
+        self.seat = seat
+        self.unseen_mask = 0
+        self.card_counts: list[int] = []
+        if table is not None:
+            self.attach(table, seat)
+
+    def attach(self, table: TableClassic, seat: Optional[int] = None) -> None:
+        """Track a table from the view of a seat, counting from scratch."""
+        self.detach()
+        self.table = table
+        self.seat = seat
+        table.add_listener(self)
+        self.on_start(table)
+
+    def detach(self) -> None:
+        """Stop tracking the table."""
+        if self.table is not None:
+            self.table.remove_listener(self)
+            self.table = None
+
+    @property
+    def reprc_left(self) -> list[int]:
+        return self.table.reprc_left
+
+    def unseen_cards(self) -> list[int]:
+        """Return the sorted cards the seat has not seen."""
+        return mask_to_cards(self.unseen_mask)
+
+    def is_unseen(self, card: int) -> bool:
+        """Return whether the seat has not seen a card."""
+        return bool(self.unseen_mask >> card & 1)
+
+    def on_start(self, table: TableClassic) -> None:
+        own = 0 if self.seat is None else table.players[self.seat].card_mask
+        self.unseen_mask = _DECK_MASK & ~table.card_mask & ~own
+        self.card_counts = [player.card_count() for player in table.players]
+
+    def on_play_hand(self, table: TableClassic, seat: int,
+                     hand: Hand) -> None:
+        self._played(seat, hand.card)
+
+    def on_erase(self, table: TableClassic, seat: int, card: int) -> None:
+        self._played(seat, (card,))
+
+    def on_undo(self, table: TableClassic, seat: int,
+                cards: list[int]) -> None:
+        if seat != self.seat:
+            self.unseen_mask |= cards_to_mask(cards)
+        self.card_counts[seat] += len(cards)
+
+    def _played(self, seat: int, cards: tuple[int, ...]) -> None:
+        self.unseen_mask &= ~cards_to_mask(cards)
+        self.card_counts[seat] -= len(cards)
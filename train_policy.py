@@ -0,0 +1,167 @@
+# -*- coding: UTF-8 -*-
+"""Train a `policy.LinearPolicy` from self-play and write its weight file.
+
+Every iteration plays a batch of games in a `BatchEnv`, every seat drawing
+its moves from the softmax of the current policy, then moves the weights
+along the REINFORCE gradient: the log-probability of each move played is
+raised for the winner of its game and lowered for the others. Between
+reports the policy is evaluated against `simulate.greedy_strategy` on the
+scalar engine, taking every seat in turn. `BatchEnv` has no rule 'rare',
+so --rare only evaluates the policy under it.
+
+Functions
+----------
+train -- Train a policy from self-play.
+evaluate -- The share of games a policy wins against a strategy.
+
+Usage
+----------
+python train_policy.py policy.npz --iterations 200 --games 1024
+python train_policy.py policy.npz --iterations 200 --rare
+"""
+
+from typing import Callable, Optional
+import argparse
+import time
+import numpy as np
+from batch_env import BatchEnv
+from features import encode_env
+from policy import LinearPolicy, move_features, sample_actions
+from simulate import STRATEGIES, game_rng, play_game
+
+__all__ = [
+    'train',
+    'evaluate'
+]
+
+def _self_play_gradient(policy: LinearPolicy, env: BatchEnv,
+                        rng: np.random.Generator) -> np.ndarray:
+    """Play every game of env to the end, return the mean gradient."""
+    steps = []
+    while env.playing.any():
+        live = np.nonzero(env.playing)[0]
+        states = encode_env(env)
+        actions, probabilities = sample_actions(policy.logits(states),
+                                                env.legal_mask(), rng)
+        moves = move_features()
+        advantage = moves[actions[live]] - probabilities[live] @ moves
+        steps.append((live, env.token[live].copy(), states[live], advantage))
+        env.step(actions)
+    players = env.num_players
+    reward = np.full((env.num_games, players), -1 / (players - 1),
+                     np.float32)
+    reward[np.arange(env.num_games), env.winner] = 1
+    gradient = np.zeros_like(policy.weights)
+    samples = 0
+    for live, seats, states, advantage in steps:
+        advantage *= reward[live, seats][:, None]
+        gradient[:, :-1] += advantage.T @ states
+        gradient[:, -1] += advantage.sum(axis=0)
+        samples += len(live)
+    return gradient / samples
+
+def train(iterations: int, games: int = 1024, num_players: int = 2,
+          learning_rate: float = 5.0, seed: int = 0,
+          policy: Optional[LinearPolicy] = None,
+          report: Optional[Callable[[int, LinearPolicy], None]] = None
+          ) -> LinearPolicy:
+    """Train a policy from self-play.
+
+    Argument
+    ----------
+    iterations : int
+        The number of batches of games.
+    games : int, optional (default is 1024)
+        The number of games of a batch, played in lockstep.
+    num_players : int, optional (default is 2)
+        The number of players of every game.
+    learning_rate : float, optional (default is 5.0)
+        The step size of the gradient ascent.
+    seed : int, optional (default is 0)
+        The same seed and arguments train the same policy.
+    policy : LinearPolicy, optional
+        The policy to train further, a zero policy by default.
+    report : callable, optional
+        Called with the iteration number and the policy after each batch.
+    """
+    policy = policy or LinearPolicy()
+    rng = np.random.default_rng(seed)
+    env = BatchEnv(games, num_players, check=False)
+    for iteration in range(iterations):
+        env.reset(rng.integers(1 << 63))
+        policy.weights += learning_rate * _self_play_gradient(policy, env,
+                                                              rng)
+        if report is not None:
+            report(iteration, policy)
+    return policy
+
+def evaluate(policy: LinearPolicy, n_games: int, opponent: str = 'greedy',
+             num_players: int = 2, seed: int = 0,
+             rare_rule: bool = False) -> float:
+    """The share of games a policy wins against a `simulate` strategy.
+
+    The policy takes seat N of the N-th game modulo the number of players,
+    the other seats play the opponent strategy. rare_rule plays the games
+    with rule 'rare'.
+    """
+    wins = 0
+    for index in range(n_games):
+        strategies = [STRATEGIES[opponent]] * num_players
+        seat = index % num_players
+        strategies[seat] = policy.strategy
+        wins += play_game(strategies, game_rng(seed, index),
+                          rare_rule=rare_rule).winner == seat
+    return wins / n_games
+
+def _decision_time(policy: LinearPolicy, num_players: int,
+                   n_games: int = 50, rare_rule: bool = False) -> float:
+    """Mean seconds of `LinearPolicy.choose_move` over self-play games."""
+    elapsed = 0.0
+    decisions = 0
+    def timed(seat, rng):
+        nonlocal elapsed, decisions
+        start = time.perf_counter()
+        move = policy.choose_move(seat)
+        elapsed += time.perf_counter() - start
+        decisions += 1
+        return move
+    for index in range(n_games):
+        play_game([timed] * num_players, game_rng(0, index),
+                  rare_rule=rare_rule)
+    return elapsed / decisions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='the weight file to write')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--games', type=int, default=1024)
+    parser.add_argument('--players', type=int, default=2, choices=(2, 3))
+    parser.add_argument('--lr', type=float, default=5.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--resume', action='store_true',
+                        help='train the policy of path further')
+    parser.add_argument('--eval-games', type=int, default=400)
+    parser.add_argument('--eval-every', type=int, default=20)
+    parser.add_argument('--rare', action='store_true',
+                        help="evaluate with rule 'rare'")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    def report(iteration: int, policy: LinearPolicy) -> None:
+        if (iteration + 1) % args.eval_every:
+            return
+        rate = evaluate(policy, args.eval_games, 'greedy', args.players,
+                        1 << 20, args.rare)
+        print(f'iteration {iteration + 1:>5}: {rate:.1%} wins against '
+              f'greedy ({time.perf_counter() - start:.0f}s)', flush=True)
+        policy.save(args.path)
+    policy = train(args.iterations, args.games, args.players, args.lr,
+                   args.seed, LinearPolicy.load(args.path)
+                   if args.resume else None, report)
+    policy.save(args.path)
+
+    wins = evaluate(policy, args.eval_games, 'greedy', args.players,
+                    1 << 21, args.rare)
+    seconds = _decision_time(policy, args.players, rare_rule=args.rare)
+    print(f'{args.path}: {wins:.1%} wins against greedy, '
+          f'{seconds * 1e6:.0f} us per decision')
@@ -5,41 +5,153 @@ Global variable
 ----------
 hand_ranking : dict
     A dictionary that returns the rank of a hand pattern.
+NONE_HAND : Hand
+    The shared empty hand, previous hand of a table with nothing to beat.
+ALL_HANDS : tuple[Hand]
+    Every distinct hand that can be made from the deck, ordered by number
+    of cards then by strength, so a position in it is a stable hand id.
+CARD_DIGITS : tuple[tuple[int]]
+    CARD_DIGITS[N] is the representative digits of card N (1~31).
 
     
 Functions
 ----------
 evaluate_cards -- Evaluate all available hands that can be made.
+evaluate_mask -- Evaluate all available hands of a card set bitmask.
+enumerate_legal_moves -- Yield every legal move of a player on a table.
+hand_id -- Return the position of a hand in ALL_HANDS.
+card_set_hands -- Yield every card set of the deck with its hands.
+hands_of_size -- Return every hand of a number of cards, weakest first.
+keys_of_size -- Return the keys of `hands_of_size`.
+rarify -- Return a hand as it is under rule 'rare'.
+rare_twins -- Yield every hand that rule 'rare' can change, with its rare one.
 ind_higher_ranking -- compaire the rank of two hands.
+strength_key -- Pack rank, value and suit of a hand into one integer.
+cards_to_mask -- Convert cards to a card set bitmask.
+encode_deal -- Encode the dealt hands of a game as one integer.
+decode_deal -- Decode the dealt hands of a game.
+mask_to_cards -- Convert a card set bitmask to sorted cards.
 
 Classes
 ----------
 Hand -- A hand object that stores cards, rank, value and suit of a hand.
 TableClassic -- A game table for player to play a game with classic game mode.
+TableListener -- Receive the changes of a table.
 Player -- A game player.
+
+Running this module checks `evaluate_cards` and `evaluate_mask` against
+the reference evaluator over every combination of the deck.
 """
 
 from collections import Counter
-from dataclasses import dataclass
-from typing import Literal, Optional
+from itertools import combinations, permutations
+from bisect import bisect_left
+from typing import Iterator, Literal, Optional
 import random
 __all__ = [
     'Hand',
+    'NONE_HAND',
+    'ALL_HANDS',
+    'CARD_DIGITS',
     'hand_ranking',
     'evaluate_cards',
+    'evaluate_mask',
+    'enumerate_legal_moves',
+    'hand_id',
+    'card_set_hands',
+    'hands_of_size',
+    'keys_of_size',
+    'rarify',
+    'rare_twins',
     'ind_higher_ranking',
+    'strength_key',
+    'cards_to_mask',
+    'encode_deal',
+    'decode_deal',
+    'mask_to_cards',
     'TableClassic',
+    'TableListener',
     'Player'
 ]
 
-@dataclass(init=True)
+def cards_to_mask(cards: tuple | list) -> int:
+    """Convert cards to a card set bitmask.
+
+    Card N is stored at bit N, so a set of deck cards fits in 32 bits.
+    Anything that is not a deck card (e.g. the -1 of a hidden card) sets
+    bit 0, which no hand of a player ever has.
+    """
+    mask = 0
+    for card in cards:
+        if 1 <= card <= 31:
+            mask |= 1 << card
+        else:
+            mask |= 1
+    return mask
+
+def mask_to_cards(mask: int) -> list[int]:
+    """Convert a card set bitmask to the sorted list of its cards."""
+    cards = []
+    while mask:
+        low = mask & -mask
+        cards.append(low.bit_length() - 1)
+        mask ^= low
+    return cards
+
 class Hand():
-    """A hand object that stores cards, rank, value and suit of a hand."""
-    card: tuple | list
-    rank: str = 'None'
-    value: int = -1
-    suit: int = -1
-    eraseable: bool = False
+    """A hand object that stores cards, rank, value and suit of a hand.
+
+    Hands are immutable and interned: creating a hand with the same cards,
+    rank, value, suit and eraseable returns the same shared object, so
+    hands can also be compared by identity.
+
+    `key` packs rank, value and suit into one integer, a larger key is a
+    stronger hand, so hands are compared by comparing their keys.
+    """
+    __slots__ = ('card', 'rank', 'value', 'suit', 'eraseable', 'mask', 'key')
+    _interned: dict[tuple, "Hand"] = {}
+
+    card: tuple[int, ...]
+    rank: str
+    value: int
+    suit: int
+    eraseable: bool
+    mask: int
+    key: int
+
+    def __new__(cls, card: tuple | list, rank: str = 'None', value: int = -1,
+                suit: int = -1, eraseable: bool = False) -> "Hand":
+        card = tuple(sorted(card))
+        ident = (card, rank, value, suit, eraseable)
+        hand = cls._interned.get(ident)
+        if hand is None:
+            hand = super().__new__(cls)
+            for name, attr in (('card', card), ('rank', rank),
+                               ('value', value), ('suit', suit),
+                               ('eraseable', eraseable),
+                               ('mask', cards_to_mask(card)),
+                               ('key', strength_key(rank, value, suit))):
+                object.__setattr__(hand, name, attr)
+            cls._interned[ident] = hand
+        return hand
+
+    def __setattr__(self, name: str, value) -> None:
+        raise AttributeError("'Hand' object is immutable")
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError("'Hand' object is immutable")
+    def __reduce__(self):
+        return (Hand, (self.card, self.rank, self.value,
+                       self.suit, self.eraseable))
+    def __copy__(self) -> "Hand":
+        return self
+    def __deepcopy__(self, memo) -> "Hand":
+        return self
+    def __repr__(self) -> str:
+        return (f'Hand(card={self.card!r}, rank={self.rank!r}, '
+                f'value={self.value!r}, suit={self.suit!r}, '
+                f'eraseable={self.eraseable!r})')
+    def __hash__(self) -> int:
+        return self.key
 
     def is_none(self) -> bool:
         if self.rank == 'None':
@@ -48,35 +160,15 @@ class Hand():
             return False
 
     def __gt__(self, other: "Hand") -> bool:
-        if ind_higher_ranking(self, other) == 1:
-            return True
-        elif ind_higher_ranking(self, other) == 2:
-            return False
-        else: # equal rank
-            if self.value > other.value:
-                return True 
-            elif self.value < other.value:
-                return False
-            else: # equal value
-                if self.suit > other.suit:
-                    return True
-                elif self.value < other.value:
-                    return False
-                else:
-                    return False
+        return self.key > other.key
     def __eq__(self, other: "Hand") -> bool:
-        if (ind_higher_ranking(self, other) == 0 and
-            self.value == other.value and
-            self.suit == other.suit):
-            return True
-        else:
-            return False
+        return self.key == other.key
     def __lt__(self, other: "Hand") -> bool:
-        return not (self.__eq__(other) or self.__gt__(other))
+        return self.key < other.key
     def __le__(self, other: "Hand"):
-        return (self.__eq__(other) or self.__lt__(other))
+        return self.key <= other.key
     def __ge__(self, other: "Hand"):
-        return (self.__eq__(other) or self.__gt__(other))
+        return self.key >= other.key
     def __len__(self) -> int:
         return len(self.card)
 
@@ -102,6 +194,15 @@ for i in range(len(hand_ranking_table)):
     hand_ranking[hand_ranking_table[i]] = i + 1
 del hand_ranking_table, i
 
+def strength_key(rank: str, value: int, suit: int) -> int:
+    """Pack rank, value and suit of a hand into one comparable integer.
+
+    Rank takes the high bits (a higher ranking gives a larger number),
+    then value and suit take 8 bits each, shifted by one so that -1 is 0.
+    """
+    return (((len(hand_ranking) - hand_ranking[rank]) << 16)
+            | ((value + 1) << 8) | (suit + 1))
+
 def ind_higher_ranking(hand1: Hand, hand2: Hand) -> Literal[0, 1, 2]:
     """compaire the rank of two hands.
 
@@ -119,22 +220,11 @@ def ind_higher_ranking(hand1: Hand, hand2: Hand) -> Literal[0, 1, 2]:
     if rank1 == rank2: result = 0
     return result
 
-def evaluate_cards(cards: tuple[int] | list[int]) -> list[Hand]:
-    """Evaluate all available hands that can be made.
+def _evaluate_cards(cards: tuple[int] | list[int]) -> list[Hand]:
+    """Evaluate all available hands that can be made, from scratch.
 
-    Argument
-    ----------
-    cards : tuple
-        The playing card.
-    reprc_count : list[int], optinal
-        reprc_left[N] contains the number of remaining unplayed
-        representative cards. used for game rule 'rare'.
-        (NOT YET DEVELOP, IT HAS NO EFFECT NOW)
-
-    Returns
-    ----------
-    avaliable : list[Hand]
-        A list that contains all avaliable hands.
+    Reference evaluator used to build `_hands_lookup`, and the fallback of
+    `evaluate_cards` for inputs that are not a set of 1~3 deck cards.
     """
     # find representative card
     reprc = []
@@ -224,17 +314,217 @@ def evaluate_cards(cards: tuple[int] | list[int]) -> list[Hand]:
                 value = reprc[0]
                 suit = reprc[1]
                 avaliable.append( Hand(cards, rank, value, suit) )
-    for hand in avaliable:
+    for i, hand in enumerate(avaliable):
         if (len(set(str(hand.value) + str(hand.suit))) == 1 and
             hand.suit != -1):
-            hand.eraseable = True
+            avaliable[i] = Hand(hand.card, hand.rank, hand.value,
+                                hand.suit, True)
 
     return avaliable
 
+NONE_HAND = Hand((), 'None', -1, -1)
+
+# Every 1/2/3-card combination of the deck (1~31) evaluated once.
+# Keyed by the bitmask of the cards, so the lookup is order-independent.
+_hands_lookup: dict[int, tuple[Hand, ...]] = {}
+for _size in (1, 2, 3):
+    for _cards in combinations(range(1, 32), _size):
+        _mask = 0
+        for _card in _cards:
+            _mask |= 1 << _card
+        _hands_lookup[_mask] = tuple(_evaluate_cards(_cards))
+del _size, _cards, _mask, _card
+
+# All distinct hands grouped by number of cards, weakest first, with
+# their keys alongside so a strength threshold is a bisection.
+_hands_by_size: dict[int, tuple[Hand, ...]] = {}
+_keys_by_size: dict[int, tuple[int, ...]] = {}
+for _size in (1, 2, 3):
+    _hands_by_size[_size] = tuple(sorted(
+        (hand for hands in _hands_lookup.values() for hand in hands
+         if len(hand) == _size),
+        key=lambda hand: (hand.key, hand.card)
+    ))
+    _keys_by_size[_size] = tuple(hand.key for hand in _hands_by_size[_size])
+del _size
+ALL_HANDS = _hands_by_size[1] + _hands_by_size[2] + _hands_by_size[3]
+# Hands are interned, so the object identity finds the hand id.
+_hand_ids = {id(hand): i for i, hand in enumerate(ALL_HANDS)}
+
+def hand_id(hand: Hand) -> int:
+    """Return the position of a hand in `ALL_HANDS`, -1 if it is not there."""
+    return _hand_ids.get(id(hand), -1)
+
+def card_set_hands() -> Iterator[tuple[int, tuple[Hand, ...]]]:
+    """Yield every 1/2/3-card set of the deck as (card set bitmask, hands),
+    its hands as `evaluate_mask` returns them."""
+    return iter(_hands_lookup.items())
+
+def hands_of_size(size: int) -> tuple[Hand, ...]:
+    """Return every distinct hand of 1, 2 or 3 cards, weakest first.
+
+    They are the hands of that size in `ALL_HANDS`, in the same order.
+    """
+    return _hands_by_size[size]
+
+def keys_of_size(size: int) -> tuple[int, ...]:
+    """Return the keys of `hands_of_size`, so a strength threshold is a
+    bisection."""
+    return _keys_by_size[size]
+
+# The representative digits of each card, card N at index N.
+CARD_DIGITS = tuple((card % 10,) if card < 10 else (card // 10, card % 10)
+                     for card in range(32))
+# Every representative digit of the deck (1~31), by digit.
+_DECK_DIGITS = tuple(sum(CARD_DIGITS[card].count(digit)
+                         for card in range(1, 32)) for digit in range(10))
+
+# The 'rare' variant of each single, double and triple of value 1~9 that
+# is not already rare, keyed by hand identity: (value, number of the
+# value digit among the representative cards of the hand, rare hand).
+# A hand is rare when no copy of its value digit is left outside of it.
+_rare: dict[int, tuple[int, int, Hand]] = {}
+for _hand in ALL_HANDS:
+    if _hand.rank in ('single', 'double', 'triple') and _hand.value != 0:
+        _copies = sum(CARD_DIGITS[_card].count(_hand.value)
+                      for _card in _hand.card)
+        _rare[id(_hand)] = (_hand.value, _copies,
+                            Hand(_hand.card, 'rare ' + _hand.rank,
+                                 _hand.value, _hand.suit, _hand.eraseable))
+del _hand, _copies
+
+def rarify(hand: Hand, reprc_count: list[int]) -> Hand:
+    """Return a hand as it is under rule 'rare', for the remaining digit
+    counts `reprc_count` (see `evaluate_cards`): its rare variant, or the
+    hand itself."""
+    rare = _rare.get(id(hand))
+    if rare is not None and reprc_count[rare[0]] == rare[1]:
+        return rare[2]
+    return hand
+
+def rare_twins() -> Iterator[tuple[Hand, Hand]]:
+    """Yield (hand, its rare variant) for every hand of `ALL_HANDS` that
+    rule 'rare' can change, in the order of `ALL_HANDS`."""
+    for hand in ALL_HANDS:
+        rare = _rare.get(id(hand))
+        if rare is not None:
+            yield hand, rare[2]
+
+def evaluate_cards(cards: tuple[int] | list[int],
+                   reprc_count: Optional[list[int]] = None) -> list[Hand]:
+    """Evaluate all available hands that can be made.
+
+    Argument
+    ----------
+    cards : tuple
+        The playing card.
+    reprc_count : list[int], optinal
+        reprc_count[N] contains the number of remaining unplayed
+        representative cards N, as `TableClassic.reprc_left`. used for game
+        rule 'rare': a single, double or triple that holds every remaining
+        representative card of its value becomes a rare one.
+
+    Returns
+    ----------
+    avaliable : list[Hand]
+        A list that contains all avaliable hands.
+    """
+    mask = cards_to_mask(cards)
+    hands = _hands_lookup.get(mask)
+    if hands is None or mask.bit_count() != len(cards):
+        hands = _evaluate_cards(cards)
+    if reprc_count is not None:
+        return [rarify(hand, reprc_count) for hand in hands]
+    return list(hands)
+
+def evaluate_mask(mask: int,
+                  reprc_count: Optional[list[int]] = None) -> list[Hand]:
+    """Evaluate all available hands of a card set bitmask.
+
+    Same as `evaluate_cards`, for cards already stored as a bitmask.
+    """
+    hands = _hands_lookup.get(mask, ())
+    if reprc_count is not None:
+        return [rarify(hand, reprc_count) for hand in hands]
+    return list(hands)
+
+def encode_deal(hands: list[int]) -> int:
+    """Encode the dealt hands of a game as one integer.
+
+    Card N gives the N-th base (players + 1) digit of the value: the seat
+    holding it, or the number of players for a card that is not dealt.
+    The value fits in 64 bits and can be logged to replay a game.
+
+    Argument
+    ----------
+    hands : list[int]
+        The card set bitmask of each seat.
+    """
+    base = len(hands) + 1
+    deal = 0
+    for card in range(31, 0, -1):
+        digit = base - 1
+        for seat, hand in enumerate(hands):
+            if hand >> card & 1:
+                digit = seat
+        deal = deal * base + digit
+    return deal
+
+def decode_deal(deal: int, num_player: int) -> list[int]:
+    """Decode the card set bitmask of each seat from `encode_deal`."""
+    base = num_player + 1
+    hands = [0] * num_player
+    for card in range(1, 32):
+        deal, digit = divmod(deal, base)
+        if digit < num_player:
+            hands[digit] |= 1 << card
+    return hands
+
+def _mix64(value: int) -> int:
+    """The splitmix64 finalizer, a well spread 64-bit hash of an integer."""
+    value = (value ^ value >> 30) * 0xbf58476d1ce4e5b9 & 0xffffffffffffffff
+    value = (value ^ value >> 27) * 0x94d049bb133111eb & 0xffffffffffffffff
+    return value ^ value >> 31
+
+# Zobrist keys of the game state, the same in every process.
+_zobrist = random.Random(31)
+_Z_SEAT_CARD = [[_zobrist.getrandbits(64) for card in range(32)]
+                for seat in range(3)]
+_Z_TABLE_CARD = [_zobrist.getrandbits(64) for card in range(32)]
+_Z_RULE = [_zobrist.getrandbits(64) for rule in range(3)]
+_Z_TOKEN = [_zobrist.getrandbits(64) for seat in range(3)]
+_Z_LASTPLAYED = [_zobrist.getrandbits(64) for seat in range(3)]
+_Z_IN_GAME = [_zobrist.getrandbits(64) for seat in range(3)]
+_Z_FOR_ERASE = _zobrist.getrandbits(64)
+_Z_RARE = _zobrist.getrandbits(64)
+del _zobrist
+
+def _hand_hash(hand: Hand) -> int:
+    """Zobrist key of a hand as the previous hand of a table."""
+    return _mix64(hand.mask << 20 | hand.key)
+_NONE_HAND_HASH = _hand_hash(NONE_HAND)
+
 class Table:
     def __init__(self) -> None:
         pass
 
+class TableListener:
+    """Receive the changes of a table, see `TableClassic.add_listener`.
+
+    Every method does nothing, subclasses override the events they need.
+    They are called after the table has changed.
+    """
+    def on_start(self, table: "TableClassic") -> None:
+        """A new game has been dealt."""
+    def on_play_hand(self, table: "TableClassic", seat: int,
+                     hand: Hand) -> None:
+        """A seat played a hand onto the table."""
+    def on_erase(self, table: "TableClassic", seat: int, card: int) -> None:
+        """A seat erased a card onto the table."""
+    def on_undo(self, table: "TableClassic", seat: int,
+                cards: list[int]) -> None:
+        """`undo_move` took back the cards a seat had put on the table."""
+
 class Player:
     """A game player. 
 
@@ -242,10 +532,18 @@ class Player:
     ----------
     name : string
         The name of player.
+    card_mask : int
+        The cards player has, as a card set bitmask.
+    hidden_count : int
+        The number of cards player has that are unknown (shown as -1),
+        e.g. other players' cards at a client side.
     cards : list[int]
-        The cards player has.
+        The cards player has, as a list. Known cards are sorted, followed
+        by a -1 for each hidden card.
+    selected_mask : int
+        The cards that player selected, as a card set bitmask.
     selected_cards : list[int]
-        The cards that player selected.
+        The cards that player selected, as a list.
     lastplayed : bool
         If all other players choose to pass their turn after a player 
         has played a hand, that player can play any hand on to the tabel
@@ -259,8 +557,9 @@ class Player:
     """
     def __init__(self, name = 'None') -> None:
         self.name = name
-        self.cards:list[int] = []
-        self.selected_cards:list[int] = []
+        self.card_mask = 0
+        self.hidden_count = 0
+        self.selected_mask = 0
         self.selected_hand: Optional[Hand] = None
         self.lastplayed = False
         self.his_turn = False
@@ -276,12 +575,39 @@ class Player:
             + f'selected_cards : {self.selected_cards}'
         )
         return string
+
+    @property
+    def cards(self) -> list[int]:
+        return mask_to_cards(self.card_mask) + [-1] * self.hidden_count
+    @cards.setter
+    def cards(self, cards: tuple | list) -> None:
+        self.hidden_count = sum(1 for card in cards if card == -1)
+        self.card_mask = cards_to_mask(card for card in cards if card != -1)
+
+    @property
+    def selected_cards(self) -> list[int]:
+        return mask_to_cards(self.selected_mask)
+    @selected_cards.setter
+    def selected_cards(self, cards: tuple | list) -> None:
+        self.selected_mask = cards_to_mask(cards)
+
+    def card_count(self) -> int:
+        """Return the number of cards player has."""
+        return self.card_mask.bit_count() + self.hidden_count
+    def has_cards(self, mask: int) -> bool:
+        """Return whether player has all cards of a card set bitmask."""
+        return mask & ~self.card_mask == 0
     def remove_cards(self, cards: tuple | list) -> bool:
-        try:
-            for card in cards:
-                self.cards.remove(card)
-        except ValueError:
+        """Remove cards from player, -1 removes a hidden card.
+
+        Return False and remove nothing if player does not have them.
+        """
+        hidden = sum(1 for card in cards if card == -1)
+        mask = cards_to_mask(card for card in cards if card != -1)
+        if not self.has_cards(mask) or hidden > self.hidden_count:
             return False
+        self.card_mask &= ~mask
+        self.hidden_count -= hidden
         return True
         
 
@@ -291,15 +617,20 @@ class TableClassic(Table):
     Instance variable
     ----------
     cards : list
-        Cards on the table.
+        Cards on the table, in the order they were played.
+    card_mask : int
+        Cards on the table, as a card set bitmask.
     players : list[Player]
         the players that joined the game
     turn : int
         n when it is n-th turn. 0 when game not started.
+    deal : int
+        The deal of the current game as a compact value, see `encode_deal`.
+        -1 when game not started.
     game_playing : bool
         True when a game is playing on the table.
     previous_hand : Hand
-        The previous played hand, defalut is: 
+        The previous played hand, defalut is the shared `NONE_HAND`:
         Hand(card=(), rank='None', value=-1, suit=-1)
     rule9 : bool
         Game rule that allows [2 cards hand] > [1 card hand].
@@ -307,28 +638,77 @@ class TableClassic(Table):
         Game rule that allows [3 cards hand] > [2 cards hand].
     rule29 : bool
         Game rule that allows [3 cards hand] > [1 card hand].
+    rare_rule : bool
+        Game rule 'rare', set before `start`: a single, double or triple
+        that holds every representative card of its value not on the table
+        yet is a rare one, see `evaluate_cards`.
+    reprc_left : list[int]
+        reprc_left[N] is the number of representative cards N of the cards
+        not on the table, kept up to date as cards are played.
+    for_erase : bool
+        True when the active player has played an eraseable hand and has
+        to erase a card (or skip it) before the turn goes forward.
+    state_hash : int
+        A 64-bit Zobrist hash of the game state: each player's cards, cards
+        on the table, previous hand, rule9/19/29/rare, token holder, lastplayed
+        and in_game flags and for_erase. It is `public_hash ^ hands_hash`,
+        both kept up to date by the methods that change the state.
+    public_hash : int
+        The part of `state_hash` that every player can see, everything but
+        the players' cards. Comparing it detects a desync between sides.
+    hands_hash : int
+        The part of `state_hash` from the players' cards. A table whose
+        hands are hidden (-1 cards) starts from the cards of the seats it
+        knows, then `play_hand` and `erase` XOR in the cards any seat
+        plays, so it differs from the full table's: compare `public_hash`
+        between sides.
     
     Public methods
     ----------
     join -- Make a player join this table, return False for join denied.
     start -- Start game.
+    start_seen -- Start a game as seen from a seat, the other hands hidden.
     is_playable_hand -- Evaluate whether a hand is playable now.
     play_hand -- play a hand onto table. Update rule9's if matches.
     erase -- Play one card onto table without any side effect.
     get_player -- Get the player object.
     turn_forward -- Make turn forward. check whether active player wins.
     empty_previous_hand -- Make previous played hand empty.
+    rehash -- Compute the state hashes and reprc_left from scratch.
+    add_listener -- Call a `TableListener` on every change of the cards.
+    remove_listener -- Stop calling a `TableListener`.
+    apply_move -- Play a move of the active player without any checking.
+    undo_move -- Take back a move played by `apply_move`.
+    move_record -- The state `undo_move` needs to take back the next move.
     """
     def __init__(self) -> None:
         self.cards:list[int] = []
+        self.card_mask = 0
         self.players: list[Player] = []
-        self.previous_hand = Hand((), 'None', -1, -1)
+        self.previous_hand = NONE_HAND
         self.turn = 0
+        self.deal = -1
         self._token = -1
         self.rule9 = False
         self.rule19 = False
         self.rule29 = False
+        self.rare_rule = False
+        self.reprc_left = list(_DECK_DIGITS)
+        self._for_erase = False
         self.game_playing = False
+        self.public_hash = 0
+        self.hands_hash = 0
+        self._listeners: list[TableListener] = []
+        self.rehash()
+    def __getstate__(self) -> dict:
+        # listeners belong to this side only, they are not pickled nor
+        # copied by deepcopy
+        state = self.__dict__.copy()
+        state['_listeners'] = []
+        return state
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.__dict__.setdefault('_listeners', [])
     def __repr__(self) -> str:
         string = ( "A table with cards:\n"
                  + str(self.cards) + '\n' 
@@ -346,40 +726,157 @@ class TableClassic(Table):
         self.players.append(player)
         return True
     
-    def start(self) -> bool:
-        "Start a new game. Return False for unable to start."
+    def start(self, rng: Optional[random.Random | int] = None,
+              deal: Optional[int] = None) -> bool:
+        """Start a new game. Return False for unable to start.
+
+        Argument
+        ----------
+        rng : random.Random | int, optional
+            The random generator (or its seed) the cards are dealt with,
+            the global one of module `random` by default.
+        deal : int, optional
+            Replay a deal recorded from `self.deal` instead of dealing.
+        """
         if len(self.players) not in (2, 3):
             return False
-        # initialize
+        self._reset_game()
+        # deal
+        if deal is None:
+            if rng is None:
+                rng = random
+            elif isinstance(rng, int):
+                rng = random.Random(rng)
+            deck = list(range(2, 32))
+            rng.shuffle(deck)
+            num_player = len(self.players)
+            dealer_ind = rng.randint(0, num_player - 1)
+            size = 10 if num_player == 3 else 12
+            hands = [cards_to_mask(deck[i*size:(i+1)*size])
+                     for i in range(num_player)]
+            hands[dealer_ind] |= 1 << 1
+            deal = encode_deal(hands)
+        else:
+            hands = decode_deal(deal, len(self.players))
+        for seat, (player, hand) in enumerate(zip(self.players, hands)):
+            player.card_mask = hand
+            if hand & 1 << 1:
+                dealer_ind = seat
+        self.deal = deal
+        self._open_game(dealer_ind)
+        return True
+
+    def start_seen(self, seat: int, card_mask: int, card_counts: list[int],
+                   dealer: int) -> bool:
+        """Start a new game as seen from a seat, the cards of the other
+        seats hidden (-1). Return False for unable to start.
+
+        It is the table `start` deals, as the seat sees it; `deal` is
+        unknown (-1).
+
+        Argument
+        ----------
+        seat : int
+            The seat whose cards are known.
+        card_mask : int
+            The cards dealt to seat, as a card set bitmask.
+        card_counts : list[int]
+            card_counts[N] is the number of cards dealt to seat N.
+        dealer : int
+            The seat dealt card 1, which plays first.
+        """
+        if (len(self.players) not in (2, 3)
+                or len(card_counts) != len(self.players)):
+            return False
+        self._reset_game()
+        for index, (player, count) in enumerate(zip(self.players,
+                                                    card_counts)):
+            if index == seat:
+                player.card_mask = card_mask
+            else:
+                player.hidden_count = count
+        self.deal = -1
+        self._open_game(dealer)
+        return True
+
+    def _reset_game(self) -> None:
         self.game_playing = True
+        self.for_erase = False
         self.empty_previous_hand()
+        self.cards = []
+        self.card_mask = 0
         for player in self.players:
-            player.cards = []
-            player.selected_cards = []
+            player.card_mask = 0
+            player.hidden_count = 0
+            player.selected_mask = 0
             player.lastplayed = False
             player.his_turn = False
             player.in_game = True
-        # deal
-        deck = list(range(2, 32))
-        random.shuffle(deck)
-        if len(self.players) == 3:
-            dealer_ind = random.randint(0, 2)
-            self.players[dealer_ind].cards.append(1)
-            self.players[0].cards += deck[0:10]
-            self.players[1].cards += deck[10:20]
-            self.players[2].cards += deck[20:30]
-            # deal
-        if len(self.players) == 2:
-            dealer_ind = random.randint(0, 1)
-            self.players[dealer_ind].cards.append(1)
-            self.players[0].cards += deck[0:12]
-            self.players[1].cards += deck[12:24]
-        self.players[dealer_ind].lastplayed = True
-        self.players[dealer_ind].his_turn = True
+
+    def _open_game(self, dealer: int) -> None:
+        self.players[dealer].lastplayed = True
+        self.players[dealer].his_turn = True
         # give token to delaer
-        self._token = dealer_ind
+        self._token = dealer
         self.turn = 1
-        return True
+        self.rehash()
+        for listener in self._listeners:
+            listener.on_start(self)
+
+    def add_listener(self, listener: TableListener) -> None:
+        """Call a `TableListener` on every change of the cards."""
+        self._listeners.append(listener)
+    def remove_listener(self, listener: TableListener) -> None:
+        """Stop calling a `TableListener`."""
+        self._listeners.remove(listener)
+
+    @property
+    def for_erase(self) -> bool:
+        return self._for_erase
+    @for_erase.setter
+    def for_erase(self, value: bool) -> None:
+        if value != self._for_erase:
+            self.public_hash ^= _Z_FOR_ERASE
+        self._for_erase = value
+
+    @property
+    def state_hash(self) -> int:
+        return self.public_hash ^ self.hands_hash
+
+    def rehash(self) -> None:
+        """Compute `public_hash`, `hands_hash` and `reprc_left` from scratch.
+
+        Call it after setting the state by hand.
+        """
+        public = _hand_hash(self.previous_hand) ^ self._rules_hash()
+        public ^= self._seats_hash()
+        self.reprc_left = list(_DECK_DIGITS)
+        for card in mask_to_cards(self.card_mask):
+            public ^= _Z_TABLE_CARD[card]
+            for digit in CARD_DIGITS[card]:
+                self.reprc_left[digit] -= 1
+        if self._for_erase:
+            public ^= _Z_FOR_ERASE
+        hands = 0
+        for seat, player in enumerate(self.players):
+            for card in mask_to_cards(player.card_mask):
+                hands ^= _Z_SEAT_CARD[seat][card]
+        self.public_hash = public
+        self.hands_hash = hands
+
+    def _rules_hash(self) -> int:
+        return ((_Z_RULE[0] if self.rule9 else 0)
+                ^ (_Z_RULE[1] if self.rule19 else 0)
+                ^ (_Z_RULE[2] if self.rule29 else 0)
+                ^ (_Z_RARE if self.rare_rule else 0))
+    def _seats_hash(self) -> int:
+        value = _Z_TOKEN[self._token] if self._token != -1 else 0
+        for seat, player in enumerate(self.players):
+            if player.lastplayed:
+                value ^= _Z_LASTPLAYED[seat]
+            if player.in_game:
+                value ^= _Z_IN_GAME[seat]
+        return value
 
     def is_playable_hand(self, newhand: Hand) -> tuple[bool, str]:
         """Evaluate whether a hand is playable now.
@@ -393,7 +890,7 @@ class TableClassic(Table):
             when the hand is playable.
         """
         if self.turn == 1:
-            if 1 not in newhand.card and not newhand.eraseable:
+            if not newhand.mask & 1 << 1 and not newhand.eraseable:
                 return False, "首家需要打出1"
         if self.previous_hand.rank == 'None':
             return True, ''
@@ -414,13 +911,13 @@ class TableClassic(Table):
                 return False, "3壓1✘"
 
         if self.previous_hand.rank in ('triangle', 'straight', 'square'):
-            if newhand >= self.previous_hand: return True, ''
+            if newhand.key >= self.previous_hand.key: return True, ''
         else:
-            if newhand > self.previous_hand: return True, ''
+            if newhand.key > self.previous_hand.key: return True, ''
         return False, "無法壓過場上的牌"
 
     def is_erasable_card(self, card:int) -> tuple[bool, str]:
-        if self.turn == 1 and 1 not in self.cards:
+        if self.turn == 1 and not self.card_mask & 1 << 1:
             if card != 1:
                 return False, '首家需要打出1'
         return True, ''
@@ -472,10 +969,15 @@ class TableClassic(Table):
             Input True when player plays a hand.
             Input False when player pass his trun.
         """
+        seats = self._seats_hash()
+        self._advance_turn(played_hand)
+        self.public_hash ^= seats ^ self._seats_hash()
+
+    def _advance_turn(self, played_hand: bool) -> None:
         active_player = self.get_player()
         next_active_player = self.get_player(+1)
         # check if active player wins and whether game ends
-        if len(active_player.cards) == 0:
+        if active_player.card_count() == 0:
             active_player.in_game = False
         if sum([1 if player.in_game else 0 for player in self.players]) == 1:
             self.game_playing = False
@@ -505,24 +1007,220 @@ class TableClassic(Table):
 
     def play_hand(self, newhand: Hand) -> None:
         """play a hand onto table. Update rule9's if matches."""
+        public = _hand_hash(self.previous_hand) ^ _hand_hash(newhand)
+        public ^= self._rules_hash()
+        seat_card = _Z_SEAT_CARD[self._token]
+        for card in newhand.card:
+            public ^= _Z_TABLE_CARD[card]
+            self.hands_hash ^= seat_card[card]
+            for digit in CARD_DIGITS[card]:
+                self.reprc_left[digit] -= 1
         self.previous_hand = newhand
         self.cards += list(newhand.card)
-        has9 = any(card == 9 for card in newhand.card)
-        has19 = any(card == 19 for card in newhand.card)
-        has29 = any(card == 29 for card in newhand.card)
-        has8 = any(card == 8 for card in newhand.card)
-        has18 = any(card == 18 for card in newhand.card)
-        has28 = any(card == 28 for card in newhand.card)
-        if has9: self.rule9 = True
-        if has19: self.rule19 = True
-        if has29: self.rule29 = True
-        if has8: self.rule9 = False
-        if has18: self.rule19 = False
-        if has28: self.rule29 = False
+        self.card_mask |= newhand.mask
+        mask = newhand.mask
+        if mask & 1 << 9: self.rule9 = True
+        if mask & 1 << 19: self.rule19 = True
+        if mask & 1 << 29: self.rule29 = True
+        if mask & 1 << 8: self.rule9 = False
+        if mask & 1 << 18: self.rule19 = False
+        if mask & 1 << 28: self.rule29 = False
+        self.public_hash ^= public ^ self._rules_hash()
+        for listener in self._listeners:
+            listener.on_play_hand(self, self._token, newhand)
 
     def empty_previous_hand(self) -> None:
         """Make previous played hand empty."""
-        self.previous_hand = Hand((), 'None', -1, -1)
+        self.public_hash ^= _hand_hash(self.previous_hand) ^ _NONE_HAND_HASH
+        self.previous_hand = NONE_HAND
     def erase(self, card: int) -> None:
         """Play one card onto table without any side effect."""
+        self.public_hash ^= _Z_TABLE_CARD[card]
+        self.hands_hash ^= _Z_SEAT_CARD[self._token][card]
         self.cards += [card]
+        self.card_mask |= cards_to_mask((card,))
+        for digit in CARD_DIGITS[card]:
+            self.reprc_left[digit] -= 1
+        for listener in self._listeners:
+            listener.on_erase(self, self._token, card)
+
+    def apply_move(self, move: Optional[Hand]) -> tuple:
+        """Play a move of the active player without any checking.
+
+        The move is one of `enumerate_legal_moves`: a hand, an erase when
+        `for_erase`, or None for passing (skipping the erase when
+        `for_erase`). It has the same effect as the `PlayerUtility` action.
+
+        Returns
+        ----------
+        record : tuple
+            The minimal state to take the move back with `undo_move`.
+        """
+        player = self.players[self._token]
+        record = self.move_record()
+        if self.for_erase:
+            if move is not None:
+                player.card_mask &= ~move.mask
+                self.erase(move.card[0])
+            self.turn_forward(played_hand=True)
+            self.for_erase = False
+        elif move is None:
+            self.turn_forward(played_hand=False)
+        else:
+            self.play_hand(move)
+            player.card_mask &= ~move.mask
+            if move.eraseable:
+                self.for_erase = True
+            else:
+                self.turn_forward(played_hand=True)
+        return record
+
+    def move_record(self) -> tuple:
+        """Return the state `undo_move` needs to take back the next move.
+
+        `apply_move` returns it. Take it before a move played any other
+        way, e.g. by a `PlayerUtility`, to be able to take that move back.
+        """
+        flags = 0
+        for other in reversed(self.players):
+            flags = (flags << 3 | other.lastplayed << 2
+                     | other.his_turn << 1 | other.in_game)
+        return (self._token, self.players[self._token].card_mask,
+                len(self.cards), self.card_mask, self.previous_hand,
+                self.rule9 | self.rule19 << 1 | self.rule29 << 2,
+                self.turn, flags, self._for_erase, self.game_playing,
+                self.public_hash, self.hands_hash)
+
+    def undo_move(self, record: tuple) -> None:
+        """Take back the move that returned the record from `apply_move`.
+
+        Moves have to be taken back in the reverse order they were played.
+        """
+        (self._token, card_mask, num_cards, self.card_mask,
+         self.previous_hand, rules, self.turn, flags,
+         self._for_erase, self.game_playing,
+         self.public_hash, self.hands_hash) = record
+        self.players[self._token].card_mask = card_mask
+        taken = self.cards[num_cards:]
+        del self.cards[num_cards:]
+        self.rule9 = bool(rules & 1)
+        self.rule19 = bool(rules & 2)
+        self.rule29 = bool(rules & 4)
+        for player in self.players:
+            player.in_game = bool(flags & 1)
+            player.his_turn = bool(flags & 2)
+            player.lastplayed = bool(flags & 4)
+            flags >>= 3
+        for card in taken:
+            for digit in CARD_DIGITS[card]:
+                self.reprc_left[digit] += 1
+        if taken:
+            for listener in self._listeners:
+                listener.on_undo(self, self._token, taken)
+
+# Up to this many cards, legal moves are found from the subsets of a hand.
+_SMALL_HAND = 8
+
+def enumerate_legal_moves(player: Player, table: TableClassic,
+                          for_erase: Optional[bool] = None
+                          ) -> Iterator[Optional[Hand]]:
+    """Yield every legal move of a player against the current table.
+
+    Argument
+    ----------
+    player : Player
+        The active player, all of his cards are considered.
+    table : TableClassic
+        The table the player plays on.
+    for_erase : bool, optional (default is `table.for_erase`)
+        True when the player has just played an eraseable hand and has to
+        choose a card to erase.
+
+    Yields
+    ----------
+    move : Hand | None
+        A playable hand, an erase `Hand((card,), 'erase')` when `for_erase`,
+        or None for passing the turn (skipping the erase when `for_erase`).
+    """
+    cards = player.card_mask
+    first_turn = table.turn == 1 and not table.card_mask & 1 << 1
+    if for_erase is None:
+        for_erase = table.for_erase
+    if for_erase:
+        if not first_turn:
+            yield None
+        for card in mask_to_cards(cards):
+            if not first_turn or card == 1:
+                yield Hand((card,), 'erase')
+        return
+
+    # (size, lowest playable key) of each hand size that can be played
+    previous = table.previous_hand
+    if previous.rank == 'None':
+        allowed = [(1, 0), (2, 0), (3, 0)]
+    else:
+        size = len(previous)
+        if previous.rank in ('triangle', 'straight', 'square'):
+            allowed = [(size, previous.key)]
+        else:
+            allowed = [(size, previous.key + 1)]
+        if size == 1 and table.rule9:
+            allowed.append((2, 0))
+        if size == 1 and table.rule29:
+            allowed.append((3, 0))
+        if size == 2 and table.rule19:
+            allowed.append((3, 0))
+
+    # a small hand has fewer card subsets than there are stronger hands,
+    # and under rule 'rare' a weak hand can turn into a strong one
+    rare = table.reprc_left if table.rare_rule else None
+    small = rare is not None or cards.bit_count() <= _SMALL_HAND
+    if small:
+        held = mask_to_cards(cards)
+    missing = ~cards
+    for size, lowest in allowed:
+        if small:
+            found = (hand for subset in combinations(held, size)
+                     for hand in _hands_lookup[cards_to_mask(subset)])
+            if rare is not None:
+                found = (rarify(hand, rare) for hand in found)
+            hands = sorted(
+                (hand for hand in found if hand.key >= lowest),
+                key=lambda hand: (hand.key, hand.card)
+            )
+        else:
+            everything = _hands_by_size[size]
+            start = bisect_left(_keys_by_size[size], lowest)
+            hands = (everything[i] for i in range(start, len(everything))
+                     if not everything[i].mask & missing)
+        for hand in hands:
+            if first_turn and not hand.mask & 1 << 1 and not hand.eraseable:
+                continue
+            yield hand
+    if not player.lastplayed:
+        yield None
+
+def _check_lookup() -> int:
+    """Check `evaluate_cards` and `evaluate_mask` against `_evaluate_cards`
+    for every 1/2/3-card combination in every order, and for inputs that
+    are not a set of deck cards. Return the number of inputs checked."""
+    inputs = [(), (0,), (-1,), (32,), (1, 1), (5, 5, 25), (-1, 2, 3),
+              (1, 2, 3, 4)]
+    for size in (1, 2, 3):
+        for cards in combinations(range(1, 32), size):
+            inputs.extend(permutations(cards))
+    for cards in inputs:
+        expected = [id(hand) for hand in _evaluate_cards(cards)]
+        if [id(hand) for hand in evaluate_cards(cards)] != expected:
+            raise AssertionError(f'evaluate_cards{cards} differs from '
+                                 '_evaluate_cards')
+        mask = cards_to_mask(cards)
+        if (mask in _hands_lookup and mask.bit_count() == len(cards)
+                and [id(hand) for hand in evaluate_mask(mask)] != expected):
+            raise AssertionError(f'evaluate_mask({mask:#x}) differs from '
+                                 '_evaluate_cards')
+    return len(inputs)
+
+if __name__ == '__main__':
+    checked = _check_lookup()
+    print(f'checked {checked} card tuples against _evaluate_cards')